@@ -0,0 +1,219 @@
+import html
+import http.server
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+CHUNK = 64 * 1024
+
+# Paths served, with <name> free-form so every download gets its own title:
+#   /watch/<name>          HTML page with a <video> tag pointing at /media/<name>.mp4
+#   /media/<name>.mp4      progressive file, honours Range
+#   /hls/<name>.m3u8       master playlist -> /hls/<name>/video.m3u8 -> seg<i>.ts
+#   /dash/<name>.mpd       single muxed representation -> /dash/<name>/seg<i>.m4s
+ROUTES = [
+    (re.compile(r'^/watch/([\w-]+)$'), 'watch_page'),
+    (re.compile(r'^/media/([\w-]+)\.mp4$'), 'progressive'),
+    (re.compile(r'^/hls/([\w-]+)\.m3u8$'), 'hls_master'),
+    (re.compile(r'^/hls/([\w-]+)/video\.m3u8$'), 'hls_media'),
+    (re.compile(r'^/hls/([\w-]+)/seg(\d+)\.ts$'), 'hls_segment'),
+    (re.compile(r'^/dash/([\w-]+)\.mpd$'), 'dash_manifest'),
+    (re.compile(r'^/dash/([\w-]+)/init\.mp4$'), 'dash_init'),
+    (re.compile(r'^/dash/([\w-]+)/seg(\d+)\.m4s$'), 'dash_segment'),
+]
+
+
+class MediaHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.handle_request(head=True)
+
+    def do_GET(self):
+        self.handle_request(head=False)
+
+    def handle_request(self, head):
+        server = self.server
+        server.count_request()
+        if server.latency:
+            time.sleep(server.latency)
+
+        path = urlparse(self.path).path
+        for pattern, route in ROUTES:
+            match = pattern.match(path)
+            if match:
+                getattr(self, route)(head, *match.groups())
+                return
+        self.send_error(404)
+
+    def send_body(self, head, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def send_bytes(self, head, size, content_type, fill=b'\0'):
+        start, end = 0, size - 1
+        match = re.match(r'bytes=(\d*)-(\d*)$', self.headers.get('Range') or '')
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(size - 1, int(match.group(2) or size - 1))
+            else:
+                start = max(0, size - int(match.group(2)))
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        if head:
+            return
+
+        block = fill * CHUNK
+        remaining = end - start + 1
+        try:
+            while remaining > 0:
+                n = min(CHUNK, remaining)
+                self.wfile.write(block[:n])
+                remaining -= n
+                self.server.throttle(n)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def watch_page(self, head, name):
+        title = html.escape(name)
+        body = (f'<!DOCTYPE html><html><head><title>{title}</title></head><body>'
+                f'<video controls><source src="/media/{name}.mp4" type="video/mp4" label="720p">'
+                f'</video></body></html>').encode()
+        self.send_body(head, body, 'text/html; charset=utf-8')
+
+    def progressive(self, head, name):
+        self.send_bytes(head, self.server.media_size, 'video/mp4')
+
+    def hls_master(self, head, name):
+        body = ('#EXTM3U\n'
+                '#EXT-X-STREAM-INF:BANDWIDTH=2500000,RESOLUTION=1280x720,'
+                'CODECS="avc1.64001f,mp4a.40.2"\n'
+                f'{name}/video.m3u8\n').encode()
+        self.send_body(head, body, 'application/vnd.apple.mpegurl')
+
+    def hls_media(self, head, name):
+        segments = ''.join(f'#EXTINF:2.0,\nseg{i}.ts\n' for i in range(self.server.segments))
+        body = ('#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:2\n#EXT-X-MEDIA-SEQUENCE:0\n'
+                f'{segments}#EXT-X-ENDLIST\n').encode()
+        self.send_body(head, body, 'application/vnd.apple.mpegurl')
+
+    def hls_segment(self, head, name, index):
+        # 0x47 is the MPEG-TS sync byte
+        self.send_bytes(head, self.server.segment_size, 'video/mp2t', fill=b'G')
+
+    def dash_manifest(self, head, name):
+        duration = 2 * self.server.segments
+        body = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static" '
+                f'mediaPresentationDuration="PT{duration}S" minBufferTime="PT2S" '
+                'profiles="urn:mpeg:dash:profile:isoff-on-demand:2011">'
+                f'<Period duration="PT{duration}S">'
+                '<AdaptationSet mimeType="video/mp4" segmentAlignment="true">'
+                '<Representation id="720p" bandwidth="2500000" width="1280" height="720" '
+                'codecs="avc1.64001f,mp4a.40.2">'
+                f'<SegmentTemplate timescale="1" duration="2" startNumber="0" '
+                f'initialization="{name}/init.mp4" media="{name}/seg$Number$.m4s"/>'
+                '</Representation></AdaptationSet></Period></MPD>').encode()
+        self.send_body(head, body, 'application/dash+xml')
+
+    def dash_init(self, head, name):
+        self.send_bytes(head, 1024, 'video/mp4')
+
+    def dash_segment(self, head, name, index):
+        self.send_bytes(head, self.server.segment_size, 'video/iso.segment')
+
+
+class MediaServer(http.server.ThreadingHTTPServer):
+    # Stand-in for a video site on 127.0.0.1: synthetic bytes only, with
+    # optional per-request latency and a shared rate cap to mimic a real link.
+    daemon_threads = True
+
+    def __init__(self, media_size=8 * 1024 * 1024, segments=20, segment_size=256 * 1024,
+                 latency=0.0, rate=None, port=0):
+        super().__init__(('127.0.0.1', port), MediaHandler)
+        self.media_size = media_size
+        self.segments = segments
+        self.segment_size = segment_size
+        self.latency = latency
+        self.rate = rate
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._next_send = time.monotonic()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def url(self, kind, name):
+        return {
+            'progressive': f'{self.base_url}/watch/{name}',
+            'direct': f'{self.base_url}/media/{name}.mp4',
+            'hls': f'{self.base_url}/hls/{name}.m3u8',
+            'dash': f'{self.base_url}/dash/{name}.mpd',
+        }[kind]
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def throttle(self, sent):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._next_send = max(self._next_send, now) + sent / self.rate
+            delay = self._next_send - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True, name="media-server")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve synthetic media for manual testing.")
+    parser.add_argument('-p', '--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every request")
+    args = parser.parse_args()
+    server = MediaServer(latency=args.latency, port=args.port)
+    print(f"Serving on {server.base_url} (e.g. {server.url('progressive', 'demo')})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
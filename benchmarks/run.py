@@ -0,0 +1,309 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+import startup  # noqa: E402
+from media_server import MediaServer  # noqa: E402
+
+KINDS = ('progressive', 'hls', 'dash')
+MB = 1024 * 1024
+# Bytes reported per synthetic progress callback in the hook benchmark
+CHUNK_BYTES = 1024
+# Every section gets fresh names so nothing is served from the info cache,
+# the archive or an existing file unless that is what is being measured
+_names = iter(range(1, 10 ** 9))
+
+
+def unique(prefix):
+    return f"{prefix}-{next(_names)}"
+
+
+def isolate(home):
+    # Keep the cache, archive and journal of the benchmark away from the user's
+    for var in ('HOME', 'XDG_CACHE_HOME', 'XDG_DATA_HOME', 'XDG_CONFIG_HOME',
+                'APPDATA', 'LOCALAPPDATA'):
+        os.environ[var] = home
+
+
+def new_downloader(out_dir, **kwargs):
+    from src.downloader import YouTubeDownloader
+    downloader = YouTubeDownloader(**kwargs)
+    downloader.download_path = out_dir
+    downloader.use_archive = False
+    return downloader
+
+
+def summarize(samples, digits=1):
+    return {'median': round(statistics.median(samples), digits),
+            'min': round(min(samples), digits),
+            'max': round(max(samples), digits)}
+
+
+def bench_extraction(server, out_dir, quality, runs):
+    downloader = new_downloader(out_dir)
+    opts = downloader.get_options(quality, lambda d: None)
+    results = {}
+    try:
+        with downloader.sessions.session(opts) as ydl:
+            # The first extraction pays for importing yt-dlp and its extractors
+            start = time.perf_counter()
+            ydl.extract_info(server.url('progressive', unique('warm')), download=False, process=False)
+            results['first_ms'] = round((time.perf_counter() - start) * 1000, 1)
+
+            for kind in KINDS:
+                cold, cached = [], []
+                for _ in range(runs):
+                    url = server.url(kind, unique(f'extract-{kind}'))
+                    start = time.perf_counter()
+                    downloader.extract_info(ydl, url)
+                    cold.append((time.perf_counter() - start) * 1000)
+
+                    start = time.perf_counter()
+                    downloader.extract_info(ydl, url)
+                    cached.append((time.perf_counter() - start) * 1000)
+                results[kind] = {'cold_ms': summarize(cold), 'cached_ms': summarize(cached, 2)}
+    finally:
+        downloader.close()
+    return results
+
+
+def bench_throughput(server, out_dir, quality, runs):
+    downloader = new_downloader(out_dir)
+    results = {}
+    try:
+        # Not timed: loads yt-dlp so the first sample is not an outlier
+        downloader.download(server.url('progressive', unique('warm')), quality, lambda d: None)
+        for kind in KINDS:
+            rates, calls = [], []
+            for _ in range(runs):
+                hook_calls = [0]
+
+                def progress_hook(d):
+                    hook_calls[0] += 1
+
+                start = time.perf_counter()
+                filename = downloader.download(server.url(kind, unique(kind)), quality, progress_hook)
+                elapsed = time.perf_counter() - start
+                size = os.path.getsize(filename)
+                rates.append(size / MB / elapsed)
+                calls.append(hook_calls[0] / (size / MB))
+                os.remove(filename)
+            results[kind] = {'mb_per_s': summarize(rates), 'hook_calls_per_mb': summarize(calls)}
+    finally:
+        downloader.close()
+    return results
+
+
+def bench_overhead(server, out_dir, quality, count, workers):
+    # Tiny files, so the time is almost all extraction, setup and bookkeeping
+    results = {}
+    downloader = new_downloader(out_dir)
+    try:
+        downloader.download(server.url('progressive', unique('warm')), quality, lambda d: None)
+
+        before = server.requests
+        start = time.perf_counter()
+        for _ in range(count):
+            downloader.download(server.url('progressive', unique('tiny')), quality, lambda d: None)
+        elapsed = time.perf_counter() - start
+        results['direct'] = {'ms_per_download': round(elapsed * 1000 / count, 1),
+                             'requests_per_download': round((server.requests - before) / count, 1)}
+    finally:
+        downloader.close()
+
+    downloader = new_downloader(out_dir, max_workers=workers, per_host_limit=workers)
+    try:
+        downloader.download(server.url('progressive', unique('warm')), quality, lambda d: None)
+        start = time.perf_counter()
+        jobs = [downloader.submit(server.url('progressive', unique('queued')), quality)
+                for _ in range(count)]
+        for job in jobs:
+            job.wait()
+        elapsed = time.perf_counter() - start
+        results['queued'] = {'workers': workers,
+                             'ms_per_download': round(elapsed * 1000 / count, 1),
+                             'failed': sum(1 for job in jobs if job.error)}
+    finally:
+        downloader.close()
+    return results
+
+
+def bench_hooks(out_dir, calls):
+    # Drive the real run_job hook chain (job state, journal, bandwidth) with
+    # synthetic progress dicts instead of a network transfer
+    from src.fragments import FragmentMonitor
+    from src.jobs import DownloadJob
+
+    downloader = new_downloader(out_dir)
+    results = {}
+    label = ''
+
+    def fake_download(url, quality, progress_hook, postprocessor_hook=None, download_path=None,
+                      metrics=None, defer_postprocess=False, staging_id=None):
+        monitor = FragmentMonitor(downloader.fragment_tuner, 'bench')
+        monitor.attach({})
+        for name, hooks in (('progressive', [progress_hook]),
+                            ('fragmented', [progress_hook, monitor.hook])):
+            d = {'status': 'downloading', 'filename': os.path.join(out_dir, f'{name}.mp4'),
+                 'total_bytes': calls * CHUNK_BYTES, 'downloaded_bytes': 0,
+                 'speed': 1.0, 'eta': 1}
+            start = time.perf_counter()
+            for i in range(calls):
+                d['downloaded_bytes'] = i * CHUNK_BYTES
+                d['fragment_index'] = i if name == 'fragmented' else None
+                for hook in hooks:
+                    hook(d)
+            elapsed = time.perf_counter() - start
+            results[name + label] = {'us_per_call': round(elapsed * 1e6 / calls, 2)}
+        # Nothing to post-process; run_job wraps this the same way as a real finish step
+        return (lambda cancelled=False: None) if defer_postprocess else None
+
+    downloader.download = fake_download
+    try:
+        # A limit far above the hook rate, so the bucket is exercised but never sleeps
+        for rate, label in ((None, ''), (10 ** 12, '_rate_limited')):
+            downloader.set_rate_limit(rate)
+            job = DownloadJob('http://bench.invalid/video', '720p', on_progress=lambda job: None)
+            job.download_path = out_dir
+            downloader.run_job(job)
+    finally:
+        downloader.close()
+    return results
+
+
+def bench_headless(server, out_dir, quality, count, workers):
+    # The full command line path in a fresh interpreter, startup included
+    urls = [server.url('progressive', unique('cli')) for _ in range(count)]
+    command = [sys.executable, os.path.join(ROOT, 'main.py'), '-q', quality, '-o', out_dir,
+               '-j', str(workers), '--per-host', str(workers), '--no-archive'] + urls
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=ROOT, capture_output=True, text=True, timeout=600)
+    elapsed = time.perf_counter() - start
+
+    events = [json.loads(line) for line in result.stdout.splitlines() if line.startswith('{')]
+    summary = next((e for e in events if e['event'] == 'summary'), {})
+    return {'downloads': count, 'workers': workers, 'exit_code': result.returncode,
+            'total_ms': round(elapsed * 1000, 1), 'ms_per_download': round(elapsed * 1000 / count, 1),
+            'finished': summary.get('finished', 0)}
+
+
+def bench_startup(runs):
+    results = {}
+    for name in startup.PROBES:
+        results[name] = startup.measure(name, runs) or {'skipped': True}
+    return results
+
+
+def flatten(results, prefix=''):
+    for key, value in results.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            yield from flatten(value, path)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield path, value
+
+
+def compare(results, baseline):
+    old = dict(flatten(baseline.get('results', {})))
+    changes = {}
+    for path, value in flatten(results):
+        if path.endswith(('.min', '.max')) or not old.get(path):
+            continue
+        changes[path] = round((value - old[path]) / old[path] * 100, 1)
+    return changes
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    try:
+        from yt_dlp.version import __version__ as yt_dlp_version
+    except ImportError:
+        yt_dlp_version = None
+    return {'commit': commit, 'python': platform.python_version(), 'platform': platform.platform(),
+            'yt_dlp': yt_dlp_version, 'cpus': os.cpu_count()}
+
+
+SECTIONS = ('startup', 'extraction', 'throughput', 'overhead', 'hooks', 'headless')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Offline benchmarks against a local media server; prints JSON.")
+    parser.add_argument('-n', '--runs', type=int, default=3, help="samples per measurement")
+    parser.add_argument('-s', '--section', action='append', choices=SECTIONS,
+                        help="run only this section (repeatable)")
+    parser.add_argument('-q', '--quality', default='720p',
+                        help="quality preset; the server offers a single 720p stream")
+    parser.add_argument('--size', type=float, default=32, help="progressive file size in MiB")
+    parser.add_argument('--segments', type=int, default=64, help="HLS/DASH segment count")
+    parser.add_argument('--segment-size', type=int, default=512, help="segment size in KiB")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="seconds the server waits before answering each request")
+    parser.add_argument('--rate', type=float, help="server-wide rate cap in MiB/s")
+    parser.add_argument('--count', type=int, default=20, help="downloads in the overhead sections")
+    parser.add_argument('-j', '--jobs', type=int, default=3, help="workers for queued runs")
+    parser.add_argument('--hook-calls', type=int, default=100000)
+    parser.add_argument('--baseline', metavar='FILE', help="earlier output to compare against")
+    parser.add_argument('-o', '--output', metavar='FILE', help="also write the JSON here")
+    args = parser.parse_args(argv)
+    sections = args.section or SECTIONS
+
+    work_dir = tempfile.mkdtemp(prefix='yt-dlp-gui-bench-')
+    isolate(os.path.join(work_dir, 'home'))
+    out_dir = os.path.join(work_dir, 'downloads')
+    os.makedirs(out_dir)
+
+    media = MediaServer(media_size=int(args.size * MB), segments=args.segments,
+                        segment_size=args.segment_size * 1024, latency=args.latency,
+                        rate=args.rate * MB if args.rate else None)
+    tiny = MediaServer(media_size=16 * 1024, latency=args.latency)
+    results = {}
+    try:
+        with media, tiny:
+            if 'startup' in sections:
+                results['startup'] = bench_startup(args.runs)
+            if 'extraction' in sections:
+                results['extraction'] = bench_extraction(tiny, out_dir, args.quality, args.runs)
+            if 'throughput' in sections:
+                results['throughput'] = bench_throughput(media, out_dir, args.quality, args.runs)
+            if 'overhead' in sections:
+                results['overhead'] = bench_overhead(tiny, out_dir, args.quality, args.count, args.jobs)
+            if 'hooks' in sections:
+                results['hooks'] = bench_hooks(out_dir, args.hook_calls)
+            if 'headless' in sections:
+                results['headless'] = bench_headless(tiny, out_dir, args.quality, args.count, args.jobs)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {'environment': environment(),
+              'config': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline')},
+              'results': results}
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            report['change_pct'] = compare(results, json.load(f))
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
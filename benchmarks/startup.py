@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each probe runs in a fresh interpreter and prints
+# {"ms": <elapsed>, "yt_dlp_loaded": <bool>} on its last line
+PROBES = {
+    'import_gui': """
+import json, sys, time
+t = time.perf_counter()
+import src.gui
+print(json.dumps({"ms": (time.perf_counter() - t) * 1000, "yt_dlp_loaded": "yt_dlp" in sys.modules}))
+""",
+    'import_cli': """
+import json, sys, time
+t = time.perf_counter()
+import src.cli
+print(json.dumps({"ms": (time.perf_counter() - t) * 1000, "yt_dlp_loaded": "yt_dlp" in sys.modules}))
+""",
+    'first_paint': """
+import json, sys, time
+t = time.perf_counter()
+from src.gui import ModernDownloaderGUI
+app = ModernDownloaderGUI()
+app.root.update()
+ms = (time.perf_counter() - t) * 1000
+loaded = "yt_dlp" in sys.modules
+app.root.destroy()
+print(json.dumps({"ms": ms, "yt_dlp_loaded": loaded}))
+""",
+}
+
+BUDGETS_MS = {
+    'import_gui': 250,
+    'import_cli': 250,
+    'first_paint': 600,
+}
+
+
+def run_probe(code):
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT,
+                            capture_output=True, text=True, timeout=60)
+    if result.returncode != 0:
+        return None
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure(name, runs):
+    samples = []
+    for _ in range(runs):
+        sample = run_probe(PROBES[name])
+        if sample is None:
+            return None
+        samples.append(sample)
+    return {
+        'median_ms': round(statistics.median(s['ms'] for s in samples), 1),
+        'max_ms': round(max(s['ms'] for s in samples), 1),
+        'yt_dlp_loaded': any(s['yt_dlp_loaded'] for s in samples),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold start and fail on regressions.")
+    parser.add_argument('-n', '--runs', type=int, default=5)
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="multiply the time budgets, e.g. on slow CI machines")
+    parser.add_argument('--no-check', action='store_true', help="report only")
+    args = parser.parse_args(argv)
+
+    results, failures = {}, []
+    for name in PROBES:
+        result = measure(name, args.runs)
+        if result is None:
+            # first_paint needs a display; skip it on headless machines
+            results[name] = {'skipped': True}
+            continue
+
+        result['budget_ms'] = BUDGETS_MS[name] * args.scale
+        results[name] = result
+        if result['yt_dlp_loaded']:
+            failures.append(f"{name}: yt_dlp imported eagerly")
+        if result['median_ms'] > result['budget_ms']:
+            failures.append(f"{name}: {result['median_ms']}ms > {result['budget_ms']}ms budget")
+
+    print(json.dumps({'startup': results, 'failures': failures}, indent=2))
+    return 1 if failures and not args.no_check else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
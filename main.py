@@ -1,5 +1,16 @@
-from src.gui import ModernDownloaderGUI
+import sys
 
 if __name__ == "__main__":
+    if getattr(sys, 'frozen', False):
+        # Worker processes of a frozen build start through this executable
+        import multiprocessing
+        multiprocessing.freeze_support()
+
+    if len(sys.argv) > 1:
+        # Headless mode never imports tkinter, so it runs without a display
+        from src.cli import main
+        sys.exit(main())
+
+    from src.gui import ModernDownloaderGUI
     app = ModernDownloaderGUI()
-    app.run()
\ No newline at end of file
+    app.run()
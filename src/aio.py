@@ -0,0 +1,228 @@
+import asyncio
+import functools
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from .downloader import YouTubeDownloader
+
+Progress = namedtuple('Progress', 'job_id state progress downloaded_bytes total_bytes speed eta')
+Done = namedtuple('Done', 'job_id state filename error warnings')
+
+_END = object()
+
+
+class EventStream:
+    # Progress is coalesced to the latest event, so a slow consumer never
+    # queues up history; the Done event always arrives and ends the stream
+    def __init__(self):
+        self._progress = None
+        self._done = None
+        self._wakeup = asyncio.Event()
+
+    def push(self, event):
+        if isinstance(event, Done):
+            self._done = event
+        else:
+            self._progress = event
+        self._wakeup.set()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            if self._progress is not None:
+                event, self._progress = self._progress, None
+                return event
+            if self._done is _END:
+                raise StopAsyncIteration
+            if self._done is not None:
+                event, self._done = self._done, _END
+                return event
+            self._wakeup.clear()
+            await self._wakeup.wait()
+
+
+class AsyncJob:
+    # Worker threads only schedule calls onto the loop; everything below
+    # the callbacks runs on the loop thread
+    def __init__(self, engine, loop):
+        self.engine = engine
+        self.job = None
+        self.done_event = None
+        self._loop = loop
+        self._streams = []
+        self._finished = loop.create_future()
+        self._progress_pending = False
+        # (keep_partial,) when cancelled before submit handed back the job
+        self._pending_cancel = None
+
+    @property
+    def id(self):
+        return self.job.id
+
+    @property
+    def state(self):
+        return self.job.state
+
+    @property
+    def done(self):
+        return self._finished.done()
+
+    def events(self):
+        stream = EventStream()
+        if self.done_event is not None:
+            stream.push(self.done_event)
+        else:
+            self._streams.append(stream)
+        return stream
+
+    async def wait(self):
+        # Shielded: a caller giving up on waiting does not cancel the download
+        return await asyncio.shield(self._finished)
+
+    def __await__(self):
+        return self.wait().__await__()
+
+    def cancel(self, keep_partial=None):
+        if self.done:
+            return
+        if self.job is None:
+            self._pending_cancel = (keep_partial,)
+            return
+        self.engine.downloader.cancel(self.job, keep_partial)
+
+    def _apply_pending_cancel(self):
+        if self._pending_cancel is not None and self.job is not None:
+            keep_partial, = self._pending_cancel
+            self._pending_cancel = None
+            self.cancel(keep_partial)
+
+    def _on_progress(self, job):
+        # Called per yt-dlp progress callback; at most one delivery is pending.
+        # The job is taken from here too, as it may finish before submit returns
+        self.job = job
+        if self._progress_pending:
+            return
+        self._progress_pending = True
+        self._call_soon(self._deliver_progress)
+
+    def _on_done(self, job):
+        self.job = job
+        self._call_soon(self._deliver_done)
+
+    def _call_soon(self, callback):
+        try:
+            self._loop.call_soon_threadsafe(callback)
+        except RuntimeError:
+            # The loop is closed; nobody is left to tell
+            pass
+
+    def _deliver_progress(self):
+        self._progress_pending = False
+        if self._finished.done():
+            return
+        job = self.job
+        event = Progress(job.id, job.state, job.progress, job.downloaded_bytes, job.total_bytes,
+                         job.speed, job.eta)
+        for stream in self._streams:
+            stream.push(event)
+
+    def _deliver_done(self):
+        if self._finished.done():
+            return
+        job = self.job
+        self.done_event = Done(job.id, job.state, job.filename, job.error, list(job.warnings))
+        for stream in self._streams:
+            stream.push(self.done_event)
+        self._streams = []
+        self._finished.set_result(self.done_event)
+        self.engine._jobs.discard(self)
+
+    def __repr__(self):
+        return f"<AsyncJob {self.job!r}>"
+
+
+class AsyncEngine:
+    # Downloads still run on the downloader's worker threads, so thousands of
+    # awaiting callers cost one future each. Submitting does a synced journal
+    # write, which goes through a small executor to stay off the loop.
+    def __init__(self, downloader=None, max_workers=3, per_host_limit=2, submit_workers=2):
+        self._owns_downloader = downloader is None
+        self.downloader = downloader or YouTubeDownloader(max_workers, per_host_limit)
+        self._executor = ThreadPoolExecutor(submit_workers, thread_name_prefix='aio-submit')
+        self._jobs = set()
+        self._submitting = set()
+        self._closed = False
+
+    async def submit(self, url, quality, download_path=None, priority=0):
+        if self._closed:
+            raise RuntimeError("Engine is closed")
+        loop = asyncio.get_running_loop()
+        handle = AsyncJob(self, loop)
+        self._jobs.add(handle)
+        submit = functools.partial(self.downloader.submit, url, quality, handle._on_progress,
+                                   handle._on_done, download_path=download_path, priority=priority)
+
+        def submit_job():
+            # Set on the executor thread, so aclose() finds it once the future is done
+            handle.job = submit()
+            return handle.job
+
+        future = loop.run_in_executor(self._executor, submit_job)
+        self._submitting.add(future)
+        future.add_done_callback(self._submitting.discard)
+        try:
+            # The submit goes through even if the caller stops waiting, so
+            # the job it queues is cancelled, not left running unseen
+            await asyncio.shield(future)
+        except asyncio.CancelledError:
+            handle.cancel()
+            future.add_done_callback(functools.partial(self._submitted, handle))
+            raise
+        except BaseException:
+            self._jobs.discard(handle)
+            raise
+        handle._apply_pending_cancel()
+        return handle
+
+    def _submitted(self, handle, future):
+        if future.cancelled() or future.exception() is not None:
+            self._jobs.discard(handle)
+        else:
+            handle._apply_pending_cancel()
+
+    async def download(self, url, quality, download_path=None, priority=0):
+        handle = await self.submit(url, quality, download_path, priority)
+        return await handle.wait()
+
+    def jobs(self):
+        return list(self._jobs)
+
+    def cancel_all(self, keep_partial=None):
+        for handle in list(self._jobs):
+            handle.cancel(keep_partial)
+
+    async def aclose(self, cancel=True):
+        if self._closed:
+            return
+        self._closed = True
+        if cancel:
+            self.cancel_all()
+        # Submits in flight get to queue their job before the downloader closes
+        if self._submitting:
+            await asyncio.wait(list(self._submitting))
+        if cancel:
+            for handle in list(self._jobs):
+                handle._apply_pending_cancel()
+            await asyncio.gather(*(handle.wait() for handle in list(self._jobs)
+                                   if handle.job is not None))
+        loop = asyncio.get_running_loop()
+        if self._owns_downloader:
+            await loop.run_in_executor(self._executor, self.downloader.close)
+        self._executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
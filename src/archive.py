@@ -0,0 +1,85 @@
+import os
+import sqlite3
+import threading
+import time
+from .cache import YOUTUBE_ID_RE
+
+
+def url_archive_id(url):
+    # Only ids that can be read straight off the URL; anything else is looked
+    # up again once extraction has produced the real extractor and id
+    match = YOUTUBE_ID_RE.search(url)
+    return ('youtube', match.group(1)) if match else None
+
+
+def info_archive_id(info):
+    extractor = info.get('extractor_key') or info.get('ie_key')
+    if not extractor or not info.get('id'):
+        return None
+    return extractor.lower(), str(info['id'])
+
+
+class DownloadArchive:
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS downloads ("
+                "extractor TEXT NOT NULL, video_id TEXT NOT NULL, quality TEXT NOT NULL, "
+                "filename TEXT, url TEXT, downloaded_at REAL NOT NULL, "
+                "PRIMARY KEY (extractor, video_id, quality)) WITHOUT ROWID")
+        return self._conn
+
+    def lookup(self, archive_id, quality):
+        if archive_id is None:
+            return None
+        with self._lock:
+            row = self._db().execute(
+                "SELECT filename, url, downloaded_at FROM downloads "
+                "WHERE extractor = ? AND video_id = ? AND quality = ?",
+                (*archive_id, quality)).fetchone()
+        return row
+
+    def contains(self, archive_id, quality):
+        row = self.lookup(archive_id, quality)
+        if row is None:
+            return False
+        # A file deleted since it was downloaded is fetched again
+        return row[0] is None or os.path.exists(row[0])
+
+    def add(self, archive_id, quality, filename=None, url=None):
+        if archive_id is None:
+            return
+        with self._lock:
+            db = self._db()
+            db.execute("INSERT OR REPLACE INTO downloads VALUES (?, ?, ?, ?, ?, ?)",
+                       (*archive_id, quality, filename, url, time.time()))
+            db.commit()
+
+    def remove(self, archive_id, quality=None):
+        with self._lock:
+            db = self._db()
+            if quality is None:
+                db.execute("DELETE FROM downloads WHERE extractor = ? AND video_id = ?", archive_id)
+            else:
+                db.execute("DELETE FROM downloads WHERE extractor = ? AND video_id = ? AND quality = ?",
+                           (*archive_id, quality))
+            db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db().execute("SELECT COUNT(*) FROM downloads").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
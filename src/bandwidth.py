@@ -0,0 +1,108 @@
+import re
+import threading
+import time
+
+LOW = -1
+NORMAL = 0
+HIGH = 1
+
+# Longest single sleep, so rate and weight changes take effect promptly
+MAX_SLEEP = 0.25
+# A job that has not drawn on its bucket for this long (extracting, between
+# streams, stalled) gives up its share to the jobs that are transferring
+ACTIVE_WINDOW = 3.0
+
+RATE_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kmg]?)i?b?\s*$', re.IGNORECASE)
+
+
+def parse_rate(value):
+    match = RATE_RE.match(str(value))
+    if not match:
+        raise ValueError(f"Invalid rate: {value!r}")
+    number, unit = match.groups()
+    rate = float(number) * 1024 ** ' kmg'.index(unit.lower() or ' ')
+    return int(rate) or None
+
+
+def priority_weight(priority):
+    return 2.0 ** priority
+
+
+class BandwidthManager:
+    # One token bucket per running job, refilled at the job's weighted share of
+    # the global rate among the jobs transferring right now. The buckets are drained from the progress hook, which
+    # runs on the download thread between reads, so sleeping there throttles
+    # the transfer itself.
+    def __init__(self, rate=None, burst=0.5):
+        self.rate = rate
+        self.burst = burst
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self._lock:
+            self.rate = rate or None
+
+    def register(self, job):
+        with self._lock:
+            self._jobs[job.id] = {'weight': priority_weight(job.priority), 'tokens': 0.0,
+                                  'refilled': time.monotonic(), 'stream': None, 'bytes': 0,
+                                  'active': None}
+
+    def unregister(self, job):
+        with self._lock:
+            self._jobs.pop(job.id, None)
+
+    def set_priority(self, job):
+        with self._lock:
+            state = self._jobs.get(job.id)
+            if state:
+                state['weight'] = priority_weight(job.priority)
+
+    def share(self, job):
+        with self._lock:
+            return self._share(self._jobs.get(job.id))
+
+    def _share(self, state, now=None):
+        if self.rate is None or state is None:
+            return None
+        since = (time.monotonic() if now is None else now) - ACTIVE_WINDOW
+        total = sum(s['weight'] for s in self._jobs.values()
+                    if s is state or (s['active'] is not None and s['active'] >= since))
+        return self.rate * state['weight'] / total
+
+    def hook(self, job):
+        def progress_hook(d):
+            if d['status'] == 'downloading':
+                self.consume(job, d.get('filename'), d.get('downloaded_bytes') or 0)
+        return progress_hook
+
+    def consume(self, job, stream, downloaded):
+        while True:
+            with self._lock:
+                state = self._jobs.get(job.id)
+                if state is None:
+                    return
+                if stream != state['stream']:
+                    state['stream'], state['bytes'] = stream, 0
+                used = max(0, downloaded - state['bytes'])
+                state['bytes'] = max(state['bytes'], downloaded)
+
+                now = time.monotonic()
+                state['active'] = now
+                share = self._share(state, now)
+                if share is None:
+                    state['tokens'], state['refilled'] = 0.0, now
+                    return
+
+                capacity = share * self.burst
+                state['tokens'] = min(capacity, state['tokens'] + (now - state['refilled']) * share)
+                state['tokens'] -= used
+                state['refilled'] = now
+                if state['tokens'] >= 0:
+                    return
+                delay = min(MAX_SLEEP, -state['tokens'] / share)
+
+            job.check_cancelled()
+            time.sleep(delay)
+            downloaded = state['bytes']
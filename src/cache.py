@@ -0,0 +1,131 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import parse_qs, urlparse
+
+YOUTUBE_ID_RE = re.compile(
+    r'(?:youtube(?:-nocookie)?\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/|v/)|youtu\.be/)'
+    r'([0-9A-Za-z_-]{11})')
+EXPIRE_PATH_RE = re.compile(r'/expire/(\d+)')
+
+# Signed media URLs are treated as stale this long before they actually expire
+EXPIRY_MARGIN = 300
+
+
+def cache_key(url):
+    match = YOUTUBE_ID_RE.search(url)
+    if match:
+        return f"youtube:{match.group(1)}"
+    return url.split('#', 1)[0].strip()
+
+
+def url_expiry(url):
+    try:
+        expire = parse_qs(urlparse(url).query).get('expire')
+        if expire:
+            return int(expire[0])
+        match = EXPIRE_PATH_RE.search(url)
+        return int(match.group(1)) if match else None
+    except (ValueError, TypeError):
+        return None
+
+
+def info_expiry(info):
+    expiries = [url_expiry(f['url']) for f in info.get('formats') or [] if f.get('url')]
+    if info.get('url'):
+        expiries.append(url_expiry(info['url']))
+    expiries = [e for e in expiries if e]
+    return min(expiries) - EXPIRY_MARGIN if expiries else None
+
+
+class InfoCache:
+    def __init__(self, path, ttl=6 * 3600, max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS info ("
+                "key TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, "
+                "expires REAL NOT NULL, accessed REAL NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS info_accessed ON info (accessed)")
+        return self._conn
+
+    def get(self, url):
+        key = cache_key(url)
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT data, expires FROM info WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                db.execute("DELETE FROM info WHERE key = ?", (key,))
+                db.commit()
+                return None
+            db.execute("UPDATE info SET accessed = ? WHERE key = ?", (now, key))
+            db.commit()
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, url, info):
+        now = time.time()
+        expires = now + self.ttl
+        signed_expiry = info_expiry(info)
+        if signed_expiry is not None:
+            expires = min(expires, signed_expiry)
+        if expires <= now:
+            return
+
+        data = zlib.compress(json.dumps(info).encode('utf-8'))
+        if len(data) > self.max_bytes:
+            return
+
+        with self._lock:
+            db = self._db()
+            db.execute("INSERT OR REPLACE INTO info VALUES (?, ?, ?, ?, ?)",
+                       (cache_key(url), data, len(data), expires, now))
+            self._evict(db, now)
+            db.commit()
+
+    def invalidate(self, url):
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM info WHERE key = ?", (cache_key(url),))
+            db.commit()
+
+    def clear(self):
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM info")
+            db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _evict(self, db, now):
+        db.execute("DELETE FROM info WHERE expires <= ?", (now,))
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM info").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        stale = []
+        for key, size in db.execute("SELECT key, size FROM info ORDER BY accessed"):
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        db.executemany("DELETE FROM info WHERE key = ?", stale)
@@ -0,0 +1,186 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from .bandwidth import parse_rate
+from .downloader import YouTubeDownloader
+from .jobs import CANCELLED, FAILED, FINISHED, SKIPPED, DownloadJob
+
+
+class JsonLinesReporter:
+    def __init__(self, stream=None, interval=0.5):
+        self.stream = stream or sys.stdout
+        self.interval = interval
+        self.counts = {FINISHED: 0, SKIPPED: 0, FAILED: 0, CANCELLED: 0}
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        line = json.dumps({'event': event, 'time': round(time.time(), 3), **fields})
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+    def queued(self, job):
+        self.emit('queued', job=job.id, url=job.url, quality=job.quality,
+                  playlist=job.playlist.id if job.playlist else None)
+
+    def progress(self, job):
+        now = time.monotonic()
+        if job.progress < 100 and now - self._last.get(job.id, 0) < self.interval:
+            return
+        self._last[job.id] = now
+        self.emit('progress', job=job.id, progress=round(job.progress, 1),
+                  downloaded_bytes=job.downloaded_bytes, total_bytes=job.total_bytes,
+                  speed=job.speed, eta=job.eta)
+
+    def retrying(self, job, kind, delay):
+        self.emit('retrying', job=job.id, url=job.url, kind=kind, delay=round(delay, 1),
+                  error=str(job.error) if job.error else None)
+
+    def done(self, job):
+        self._last.pop(job.id, None)
+        self.counts[job.state] += 1
+        self.emit(job.state, job=job.id, url=job.url, filename=job.filename,
+                  error=str(job.error) if job.error else None, warnings=job.warnings)
+
+    def summary(self):
+        self.emit('summary', **self.counts)
+
+
+def read_urls(urls, batch_file):
+    yield from urls
+    if batch_file is None:
+        return
+
+    stream = sys.stdin if batch_file == '-' else open(batch_file, encoding='utf-8')
+    try:
+        for line in stream:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="main.py",
+        description="Download videos without the GUI, reporting progress as JSON lines.")
+    parser.add_argument('urls', nargs='*', metavar='URL')
+    parser.add_argument('-a', '--batch-file', metavar='FILE',
+                        help="read URLs from FILE, one per line ('-' for stdin)")
+    parser.add_argument('-q', '--quality', default='1080p')
+    parser.add_argument('-o', '--output', metavar='DIR', help="download directory")
+    parser.add_argument('-j', '--jobs', type=int, default=3,
+                        help="number of concurrent downloads")
+    parser.add_argument('--per-host', type=int, default=2,
+                        help="concurrent downloads allowed per host")
+    parser.add_argument('-r', '--limit-rate', type=parse_rate, metavar='RATE',
+                        help="total download rate shared by all jobs, e.g. 500K or 4M")
+    parser.add_argument('--priority', type=int, default=0,
+                        help="priority of the submitted jobs (higher runs first and gets more bandwidth)")
+    parser.add_argument('--metrics-log', metavar='FILE',
+                        help="append per-job stage timings and speeds to FILE as JSON lines")
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help="serve Prometheus metrics on 127.0.0.1:PORT while running")
+    parser.add_argument('--playlist', action='store_true',
+                        help="expand playlist and channel URLs into their videos")
+    parser.add_argument('--no-archive', action='store_true',
+                        help="download again even if the archive says it was already fetched")
+    parser.add_argument('--resume', action='store_true',
+                        help="also resume jobs left unfinished by an earlier run")
+    parser.add_argument('--keep-partial', action='store_true',
+                        help="keep partial files of interrupted downloads for resuming")
+    parser.add_argument('--processes', action='store_true',
+                        help="run each download in a separate worker process")
+    parser.add_argument('--hang-timeout', type=float, default=300, metavar='SECONDS',
+                        help="kill a worker process that reports nothing for this long")
+    parser.add_argument('--staging', metavar='DIR',
+                        help="write partial and intermediate files to DIR, a local scratch "
+                             "directory, and move only finished files to the output directory")
+    parser.add_argument('--dedupe', action='store_true',
+                        help="replace finished files identical to earlier downloads with "
+                             "reflinks or hardlinks to them")
+    parser.add_argument('--no-retry', action='store_true',
+                        help="fail jobs on their first error instead of retrying with backoff")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.urls and args.batch_file is None and not args.resume:
+        parser.error("give at least one URL, --batch-file or --resume")
+
+    downloader = YouTubeDownloader(max_workers=args.jobs, per_host_limit=args.per_host)
+    if args.quality not in downloader.formats:
+        parser.error(f"unknown quality {args.quality!r} (choose from {', '.join(downloader.formats)})")
+    if args.output:
+        downloader.download_path = os.path.abspath(os.path.expanduser(args.output))
+        os.makedirs(downloader.download_path, exist_ok=True)
+    downloader.keep_partial_files = args.keep_partial
+    downloader.use_archive = not args.no_archive
+    downloader.set_rate_limit(args.limit_rate)
+    downloader.set_retries(not args.no_retry)
+    downloader.set_staging(args.staging)
+    downloader.set_dedupe(args.dedupe)
+    if args.processes:
+        downloader.set_process_workers(True, hang_timeout=args.hang_timeout)
+    if args.metrics_log:
+        downloader.log_metrics(args.metrics_log)
+    if args.metrics_port:
+        try:
+            downloader.serve_metrics(args.metrics_port)
+        except OSError as e:
+            parser.error(f"cannot serve metrics on port {args.metrics_port}: {e}")
+
+    reporter = JsonLinesReporter()
+    downloader.on_retry = reporter.retrying
+    # Bound the URLs read ahead of the workers so huge or endless inputs stream
+    slots = threading.BoundedSemaphore(max(1, args.jobs) * 2)
+    jobs = []
+
+    def on_done(job):
+        reporter.done(job)
+        slots.release()
+
+    def on_playlist_complete(playlist):
+        reporter.counts[SKIPPED] += playlist.skipped
+        slots.release()
+
+    try:
+        if args.resume:
+            for job in downloader.resume(on_progress=reporter.progress, on_done=reporter.done,
+                                         on_entry=reporter.queued):
+                jobs.append(job)
+                if isinstance(job, DownloadJob):
+                    reporter.queued(job)
+
+        for url in read_urls(args.urls, args.batch_file):
+            slots.acquire()
+            if args.playlist:
+                job = downloader.submit_playlist(url, args.quality, on_progress=reporter.progress,
+                                                 on_done=reporter.done, on_entry=reporter.queued,
+                                                 on_complete=on_playlist_complete,
+                                                 priority=args.priority)
+            else:
+                job = downloader.submit(url, args.quality, on_progress=reporter.progress,
+                                        on_done=on_done, priority=args.priority)
+                reporter.queued(job)
+            jobs = [j for j in jobs if not j.done] + [job]
+
+        for job in jobs:
+            job.wait()
+    except KeyboardInterrupt:
+        downloader.cancel_all()
+        for job in jobs:
+            job.wait()
+    finally:
+        downloader.close()
+
+    reporter.summary()
+    return 1 if reporter.counts[FAILED] or reporter.counts[CANCELLED] else 0
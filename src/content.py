@@ -0,0 +1,144 @@
+import hashlib
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+HASH_CHUNK = 1024 * 1024
+# ioctl that makes one file share another's extents (btrfs, XFS, bcachefs)
+FICLONE = 0x40049409
+
+
+def new_hash():
+    return hashlib.sha256()
+
+
+def hash_file(path):
+    digest = new_hash()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK)
+            if not chunk:
+                return digest.hexdigest()
+            digest.update(chunk)
+
+
+def reflink(src, dst):
+    if not sys.platform.startswith('linux'):
+        return False
+    import fcntl
+    with open(src, 'rb') as source, open(dst, 'wb') as target:
+        try:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        except OSError:
+            return False
+    return True
+
+
+def link_duplicate(original, duplicate):
+    # Replaces `duplicate` by a copy-on-write clone of `original` where the
+    # filesystem can do that, else by a hardlink; returns how, or None
+    directory = os.path.dirname(os.path.abspath(duplicate))
+    fd, tmp = tempfile.mkstemp(prefix=f'.{os.path.basename(duplicate)}.', suffix='.tmp',
+                               dir=directory)
+    os.close(fd)
+    try:
+        if reflink(original, tmp):
+            how = 'reflink'
+        else:
+            os.remove(tmp)
+            os.link(original, tmp)
+            how = 'hardlink'
+        os.replace(tmp, duplicate)
+        return how
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return None
+
+
+class ContentIndex:
+    # Finished files by content hash. A file changed or removed since it was
+    # recorded no longer matches its size and mtime and is dropped on lookup.
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT PRIMARY KEY, digest TEXT NOT NULL, size INTEGER NOT NULL, "
+                "mtime REAL NOT NULL, added REAL NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS files_digest ON files (digest, size)")
+        return self._conn
+
+    def find(self, digest, size):
+        with self._lock:
+            rows = self._db().execute("SELECT path, mtime FROM files WHERE digest = ? AND size = ?",
+                                      (digest, size)).fetchall()
+        found, stale = [], []
+        for path, mtime in rows:
+            try:
+                st = os.stat(path)
+            except OSError:
+                stale.append(path)
+                continue
+            if st.st_size == size and st.st_mtime == mtime:
+                found.append(path)
+            else:
+                stale.append(path)
+        for path in stale:
+            self.forget(path)
+        return found
+
+    def add(self, path, digest):
+        st = os.stat(path)
+        with self._lock:
+            db = self._db()
+            db.execute("INSERT OR REPLACE INTO files (path, digest, size, mtime, added) "
+                       "VALUES (?, ?, ?, ?, ?)",
+                       (os.path.abspath(path), digest, st.st_size, st.st_mtime, time.time()))
+            db.commit()
+
+    def forget(self, path):
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM files WHERE path = ?", (path,))
+            db.commit()
+
+    def dedupe(self, path, digest=None):
+        # Links `path` to an identical file recorded before, on the same
+        # filesystem; returns the file it now shares data with, or None
+        digest = digest or hash_file(path)
+        path = os.path.abspath(path)
+        size = os.path.getsize(path)
+        device = os.stat(path).st_dev
+        original = None
+        for candidate in self.find(digest, size):
+            try:
+                if candidate == path or os.stat(candidate).st_dev != device:
+                    continue
+                linked = os.path.samefile(candidate, path) or link_duplicate(candidate, path)
+            except OSError:
+                continue
+            if linked:
+                original = candidate
+                break
+        self.add(path, digest)
+        return original
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
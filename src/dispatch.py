@@ -0,0 +1,48 @@
+import queue
+
+
+class UiDispatcher:
+    # Worker threads only touch the buffers below; every Tk call happens in
+    # drain(), which runs on the main loop every `interval` milliseconds.
+    def __init__(self, root, render, interval=100):
+        self.root = root
+        self.render = render
+        self.interval = interval
+        self._latest = {}
+        self._calls = queue.SimpleQueue()
+        self._after_id = None
+
+    def post_progress(self, job):
+        self._latest[job.id] = job
+
+    def post(self, func, *args):
+        self._calls.put((func, args))
+
+    def start(self):
+        if self._after_id is None:
+            self._tick()
+
+    def stop(self):
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+
+    def drain(self):
+        jobs = []
+        while self._latest:
+            jobs.append(self._latest.popitem()[1])
+        if jobs:
+            self.render(jobs)
+
+        while True:
+            try:
+                func, args = self._calls.get_nowait()
+            except queue.Empty:
+                break
+            func(*args)
+
+    def _tick(self):
+        try:
+            self.drain()
+        finally:
+            self._after_id = self.root.after(self.interval, self._tick)
@@ -1,12 +1,120 @@
-import yt_dlp
+import glob
 import os
+import re
+import sqlite3
+import threading
+import time
+from .archive import DownloadArchive, info_archive_id, url_archive_id
+from .bandwidth import BandwidthManager
+from .cache import InfoCache
+from .content import ContentIndex
+from .fragments import FragmentMonitor, FragmentTuner, is_throttled
+from .history import HistoryStore
+from .jobs import FINISHED, SKIPPED, AlreadyDownloaded, DownloadJob, DownloadQueue, host_of
+from .journal import JobJournal
+from .metrics import EXTRACT, JsonLogSink, MetricsRecorder, PrometheusExporter
+from .paths import cache_dir, data_dir
+from .planner import plan_download
+from .playlist import PlaylistJob, iter_playlist_entries
+from .prefetch import Prefetcher, plan_size
+from .retry import CircuitBreaker, RetryPolicy
+from .sessions import SessionPool
+from .staging import StagingArea, move_downloaded_files, staging_key
+
+PARTIAL_SUFFIXES = ('.part', '.ytdl', '.temp')
+INTERMEDIATE_RE = re.compile(r'\.f[0-9][\w-]*\.\w+$')
+HEIGHT_RE = re.compile(r'^(\d+)p$')
+
+
+def load_yt_dlp():
+    # yt-dlp pulls in hundreds of extractor modules, so it is only imported
+    # on first use or from warm_up()
+    import yt_dlp
+    return yt_dlp
+
+
+_ydl_class = None
+
+
+def ydl_class():
+    global _ydl_class
+    if _ydl_class is not None:
+        return _ydl_class
+
+    class YoutubeDL(load_yt_dlp().YoutubeDL):
+        # post_process() merges, runs the FFmpeg postprocessors and moves the
+        # file into place. While `deferred` is a list it only records its
+        # arguments, and run_deferred() does the work later on another thread.
+        deferred = None
+
+        def post_process(self, filename, info, files_to_move=None):
+            if self.deferred is None:
+                return super().post_process(filename, info, files_to_move)
+            info['filepath'] = filename
+            self.deferred.append((filename, info, files_to_move))
+            return info
+
+        def run_deferred(self):
+            deferred, self.deferred = self.deferred or [], None
+            for filename, info, files_to_move in deferred:
+                result = super().post_process(filename, info, files_to_move)
+                if result is not info:
+                    # In place, so requested_downloads sees the final paths
+                    info.clear()
+                    info.update(result)
+
+        def run_pp(self, pp, infodict):
+            # Out of a staging directory, the finished file replaces its
+            # destination in one step or not at all
+            if type(pp).__name__ == 'MoveFilesAfterDownloadPP' and (self.params.get('paths') or {}).get('temp'):
+                infodict.setdefault('__files_to_move', {})
+                return move_downloaded_files(pp, infodict)
+            return super().run_pp(pp, infodict)
+
+    _ydl_class = YoutubeDL
+    return _ydl_class
+
+
+def new_ydl(opts):
+    return ydl_class()(opts)
+
+
+def partial_files(filename):
+    yield filename + '.part'
+    yield filename + '.ytdl'
+    yield from glob.glob(glob.escape(filename) + '.part-Frag*')
+    if filename.endswith(PARTIAL_SUFFIXES) or INTERMEDIATE_RE.search(filename):
+        yield filename
+
+
+def remove_partial_files(filenames):
+    for filename in filenames:
+        for path in partial_files(filename):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def extract_info(ydl, url, info_cache=None):
+    # Returns (info, whether it came from the cache)
+    info = info_cache.get(url) if info_cache else None
+    if info is not None:
+        return info, True
+
+    # Unprocessed info keeps every format, so one entry serves all qualities
+    info = ydl.extract_info(url, download=False, process=False)
+    if info_cache and info.get('_type', 'video') == 'video':
+        info = ydl.sanitize_info(info)
+        info_cache.put(url, info)
+    return info, False
+
 
 class YouTubeDownloader:
-    def __init__(self):
+    def __init__(self, max_workers=3, per_host_limit=2):
+        self.keep_partial_files = False
         self.download_path = os.path.expanduser("~/Downloads/YouTube")
-        if not os.path.exists(self.download_path):
-            os.makedirs(self.download_path)
-            
+
         self.formats = {
             "1080p": "bestvideo[height<=1080][ext=mp4]+bestaudio[ext=m4a]/best[height<=1080][ext=mp4]",
             "720p": "bestvideo[height<=720][ext=mp4]+bestaudio[ext=m4a]/best[height<=720][ext=mp4]",
@@ -14,14 +122,79 @@ class YouTubeDownloader:
             "Audio Only": "bestaudio[ext=m4a]/best[ext=m4a]"
         }
 
-    def get_options(self, quality, progress_hook, audio_only=False):
+        self.info_cache = InfoCache(os.path.join(cache_dir(), "info.sqlite"))
+        self.archive = DownloadArchive(os.path.join(data_dir(), "archive.sqlite"))
+        self.use_archive = True
+        self.fragment_tuner = FragmentTuner()
+        self.bandwidth = BandwidthManager()
+        self.journal = JobJournal(os.path.join(data_dir(), "journal.jsonl"))
+        self.history = HistoryStore(os.path.join(data_dir(), "history.sqlite"))
+        self.metrics = MetricsRecorder()
+        self.metrics_exporter = None
+        self.sessions = SessionPool(new_ydl)
+        self.breaker = CircuitBreaker()
+        # Called with (job, kind, delay) when a failed job is queued again
+        self.on_retry = None
+        self.queue = DownloadQueue(self.run_job, max_workers, per_host_limit,
+                                   on_finish=self.job_finished, retry_policy=RetryPolicy(),
+                                   breaker=self.breaker, on_retry=self.job_retrying)
+        self.playlists = set()
+        self.staging = None
+        self.content = None
+        self.prefetcher = Prefetcher(self.prefetch_info, self.plan, self.formats)
+        self.workers = None
+
+    def set_process_workers(self, enabled, hang_timeout=300.0):
+        # Run each job's yt-dlp work in a pool of child processes
+        if enabled and self.workers is None:
+            from .workers import ProcessPool
+            self.workers = ProcessPool(max_idle=self.queue.max_workers, hang_timeout=hang_timeout)
+        elif not enabled and self.workers is not None:
+            workers, self.workers = self.workers, None
+            workers.close(kill=False)
+
+    def set_staging(self, path):
+        # Intermediate files go to `path`, a local scratch directory; None writes
+        # everything straight into the download directory
+        if not path:
+            self.staging = None
+            return
+        self.staging = StagingArea(os.path.abspath(os.path.expanduser(path)))
+        threading.Thread(target=self.staging.prune, daemon=True, name="staging-prune").start()
+
+    def set_dedupe(self, enabled):
+        # Finished files identical to one downloaded before become links to it
+        if enabled and self.content is None:
+            self.content = ContentIndex(os.path.join(data_dir(), "content.sqlite"))
+        elif not enabled and self.content is not None:
+            content, self.content = self.content, None
+            content.close()
+
+    def warm_up(self):
+        threading.Thread(target=load_yt_dlp, daemon=True, name="yt-dlp-warmup").start()
+
+    def prefetch_info(self, url):
+        # Video options share a session key with the download that follows
+        with self.sessions.session(self.get_options("1080p", lambda d: None)) as ydl:
+            return self.extract_info(ydl, url)[0]
+
+    def get_options(self, quality, progress_hook, audio_only=False, postprocessor_hook=None,
+                    download_path=None):
         opts = {
             'format': self.formats.get(quality, self.formats['720p']),
-            'outtmpl': os.path.join(self.download_path, '%(title)s.%(ext)s'),
+            'outtmpl': os.path.join(download_path or self.download_path, '%(title)s.%(ext)s'),
+            'paths': {},
             'progress_hooks': [progress_hook],
+            'postprocessor_hooks': [postprocessor_hook] if postprocessor_hook else [],
+            'continuedl': True,
+            # The yt-dlp command line defaults; the API default is no retries at all
+            'retries': 10,
+            'fragment_retries': 10,
             'merge_output_format': 'mp4' if not audio_only else 'm4a',
+            'postprocessors': [],
             'noplaylist': True,
             'quiet': True,
+            'noprogress': True,
             'no_warnings': True
         }
 
@@ -30,15 +203,361 @@ class YouTubeDownloader:
                 'key': 'FFmpegExtractAudio',
                 'preferredcodec': 'm4a',
             }]
+        if self.staging is not None:
+            # yt-dlp joins these with the template; download() adds the temp dir
+            opts['outtmpl'] = '%(title)s.%(ext)s'
+            opts['paths'] = {'home': download_path or self.download_path}
+        if self.content is not None:
+            # Read by move_downloaded_files, which hashes what it copies
+            opts['content_hash'] = True
 
         return opts
 
-    def download(self, url, quality, progress_hook):
+    def get_playlist_options(self):
+        return {
+            'extract_flat': 'in_playlist',
+            'lazy_playlist': True,
+            'noplaylist': False,
+            'quiet': True,
+            'no_warnings': True
+        }
+
+    def download(self, url, quality, progress_hook, postprocessor_hook=None, download_path=None,
+                 metrics=None, defer_postprocess=False, staging_id=None):
         if not url.strip():
             raise ValueError("URL cannot be empty")
-            
+        self.prefetcher.wait(url)
+
+        download_path = download_path or self.download_path
+        os.makedirs(download_path, exist_ok=True)
         audio_only = quality == "Audio Only"
-        opts = self.get_options(quality, progress_hook, audio_only)
-        
-        with yt_dlp.YoutubeDL(opts) as ydl:
-            ydl.download([url])
\ No newline at end of file
+        opts = self.get_options(quality, progress_hook, audio_only, postprocessor_hook, download_path)
+        host = host_of(url)
+        fragments = FragmentMonitor(self.fragment_tuner, host)
+        opts['progress_hooks'].append(fragments.hook)
+        if metrics:
+            opts['retry_hooks'] = [metrics.retry]
+
+        if self.use_archive and self.archive.contains(url_archive_id(url), quality):
+            raise AlreadyDownloaded(url)
+
+        # Checked out rather than borrowed with `with`: a deferred post-processing
+        # step keeps the session, since its postprocessors report to this job
+        session = self.sessions.checkout(opts)
+        ydl = session.ydl
+        staging_dir = None
+        try:
+            if metrics:
+                with metrics.stage(EXTRACT):
+                    info, cached = self.extract_info(ydl, url)
+                metrics.cached_info = cached
+            else:
+                info, cached = self.extract_info(ydl, url)
+            archive_id = info_archive_id(info)
+            if self.use_archive and self.archive.contains(archive_id, quality):
+                raise AlreadyDownloaded(url)
+
+            plan = self.plan(info, quality)
+            staging_dir = self.stage(staging_id or f"{url}\0{quality}", info, plan, opts,
+                                     download_path)
+            if plan:
+                session = self.sessions.switch(session, plan.apply(opts))
+                ydl = session.ydl
+                if metrics:
+                    metrics.plan = plan.as_dict()
+            else:
+                session.set_paths(opts['paths'])
+
+            fragments.attach(ydl.params)
+            ydl.deferred = [] if defer_postprocess else None
+            try:
+                result = ydl.process_ie_result(info, download=True)
+            except Exception as e:
+                if is_throttled(e):
+                    self.fragment_tuner.throttled(host)
+                # Most often an expired signed URL; the next attempt re-extracts
+                if cached:
+                    self.info_cache.invalidate(url)
+                raise
+        except BaseException:
+            session.close()
+            if staging_dir:
+                # Partial data stays for the next attempt
+                self.staging.release(staging_dir)
+            raise
+
+        def finish(cancelled=False):
+            if cancelled:
+                # Cancelled while waiting for a post-processing worker
+                session.close()
+                if staging_dir:
+                    self.staging.release(staging_dir)
+                return None
+            try:
+                ydl.run_deferred()
+            except BaseException:
+                session.close()
+                if staging_dir:
+                    self.staging.release(staging_dir)
+                raise
+            self.sessions.release(session)
+            if staging_dir:
+                self.staging.discard(staging_dir)
+
+            downloads = (result or {}).get('requested_downloads') or [{}]
+            filename = downloads[-1].get('filepath')
+            self.archive.add(archive_id, quality, filename, url)
+            content = self.content
+            if content is not None and filename and os.path.isfile(filename):
+                try:
+                    content.dedupe(filename, downloads[-1].get('__content_hash'))
+                except (OSError, sqlite3.Error):
+                    # The download itself is done; it just keeps its own copy
+                    pass
+            return filename
+
+        return finish if defer_postprocess else finish()
+
+    def stage(self, key, info, plan, opts, download_path):
+        # Books scratch space for the download and points yt-dlp's temp path at
+        # it; returns the directory, or None when writing to the destination
+        if self.staging is None:
+            return None
+        directory = self.staging.job_dir(key)
+        size = plan_size(info, plan) if plan else None
+        if not self.staging.reserve(directory, size, download_path):
+            return None
+        opts['paths'] = dict(opts['paths'], temp=directory)
+        return directory
+
+    def plan(self, info, quality):
+        # Picks streams that need no re-encode; None keeps the preset in self.formats
+        if info.get('_type', 'video') != 'video':
+            return None
+        match = HEIGHT_RE.match(quality)
+        return plan_download(info, max_height=int(match.group(1)) if match else None,
+                             audio_only=quality == "Audio Only", container='mp4', audio_codec='m4a')
+
+    def extract_info(self, ydl, url):
+        return extract_info(ydl, url, self.info_cache)
+
+    def submit(self, url, quality, on_progress=None, on_done=None, uid=None, download_path=None,
+               priority=0):
+        if not url.strip():
+            raise ValueError("URL cannot be empty")
+
+        job = DownloadJob(url.strip(), quality, on_progress, on_done, uid, priority)
+        job.download_path = download_path or self.download_path
+        self.journal.queued(job)
+        self.history.record(job)
+        return self.queue.submit(job)
+
+    def submit_playlist(self, url, quality, on_progress=None, on_done=None, on_entry=None,
+                        on_complete=None, uid=None, download_path=None, priority=0):
+        if not url.strip():
+            raise ValueError("URL cannot be empty")
+
+        def complete(playlist):
+            self.journal.finished(playlist)
+            if on_complete:
+                on_complete(playlist)
+
+        playlist = PlaylistJob(url.strip(), quality, on_progress, on_done, on_entry, complete,
+                               window=self.queue.max_workers * 2, uid=uid, priority=priority)
+        playlist.download_path = download_path or self.download_path
+        self.journal.queued(playlist, kind='playlist')
+        self.playlists.add(playlist)
+        threading.Thread(target=self.expand_playlist, args=(playlist,), daemon=True,
+                         name=f"playlist-{playlist.id}").start()
+        return playlist
+
+    def expand_playlist(self, playlist):
+        error = None
+        try:
+            with self.sessions.session(self.get_playlist_options()) as ydl:
+                for entry in iter_playlist_entries(ydl, playlist.url):
+                    entry_url = entry.get('webpage_url') or entry.get('url')
+                    if entry.get('formats'):
+                        # Not a playlist after all; keep the full extraction for the download
+                        self.info_cache.put(entry_url, ydl.sanitize_info(entry))
+
+                    archive_id = info_archive_id(entry) or url_archive_id(entry_url)
+                    if self.use_archive and self.archive.contains(archive_id, playlist.quality):
+                        playlist.skipped += 1
+                        continue
+
+                    job = playlist.new_entry(entry_url)
+                    if job is None:
+                        break
+                    job.title = entry.get('title')
+                    self.journal.queued(job)
+                    self.history.record(job)
+                    if playlist.on_entry:
+                        playlist.on_entry(job)
+                    self.queue.submit(job)
+        except Exception as e:
+            error = e
+        finally:
+            self.playlists.discard(playlist)
+            playlist.expanded(error)
+
+    def resume(self, on_progress=None, on_done=None, on_entry=None, on_complete=None):
+        jobs = []
+        for record in self.journal.replay():
+            if record['kind'] == 'playlist':
+                job = self.submit_playlist(record['url'], record['quality'], on_progress, on_done,
+                                           on_entry, on_complete, uid=record['uid'],
+                                           download_path=record['download_path'],
+                                           priority=record.get('priority', 0))
+            else:
+                job = self.submit(record['url'], record['quality'], on_progress, on_done,
+                                  uid=record['uid'], download_path=record['download_path'],
+                                  priority=record.get('priority', 0))
+                job.downloaded_bytes = record.get('downloaded_bytes', 0)
+                job.total_bytes = record.get('total_bytes', 0)
+                job.files.update(record.get('files', []))
+            jobs.append(job)
+        return jobs
+
+    def job_finished(self, job):
+        if self.workers is not None:
+            self.workers.job_finished(job)
+        if self.staging is not None and (job.state in (FINISHED, SKIPPED)
+                                         or not self.keeps_partial(job)):
+            self.staging.discard(self.staging.job_dir(staging_key(job)))
+        self.journal.finished(job)
+        self.history.record(job)
+        self.metrics.finish(job)
+
+    def job_retrying(self, job, kind, delay):
+        job.warnings.append(f"Retrying in {delay:.0f}s after {kind} error: {job.error}")
+        self.history.record(job)
+        if self.on_retry:
+            self.on_retry(job, kind, delay)
+        if job.on_progress:
+            job.on_progress(job)
+
+    def set_retries(self, enabled):
+        self.queue.retry_policy = RetryPolicy() if enabled else None
+
+    def log_metrics(self, path):
+        return self.metrics.add_sink(JsonLogSink(path))
+
+    def serve_metrics(self, port=9464):
+        if self.metrics_exporter is None:
+            def gauges():
+                running, queued = self.queue.counts()
+                return {'queued_jobs': ("Jobs waiting for a worker.", queued),
+                        'rate_limit_bytes': ("Global rate limit, 0 when unlimited.",
+                                             self.bandwidth.rate or 0)}
+
+            self.metrics_exporter = self.metrics.add_sink(
+                PrometheusExporter(self.metrics, port, gauges=gauges))
+        return self.metrics_exporter
+
+    def close(self):
+        # Close the journal first so interrupted jobs stay resumable
+        self.journal.close()
+        self.prefetcher.close()
+        for playlist in list(self.playlists):
+            playlist.cancel()
+        self.queue.shutdown()
+        if self.workers is not None:
+            self.workers.close()
+        self.sessions.close()
+        self.info_cache.close()
+        self.archive.close()
+        self.history.close()
+        if self.content is not None:
+            self.content.close()
+        self.metrics.close()
+
+    def set_rate_limit(self, rate):
+        self.bandwidth.set_rate(rate)
+
+    def set_priority(self, job, priority):
+        if isinstance(job, PlaylistJob):
+            job.priority = priority
+            jobs = job.entries()
+        else:
+            jobs = [job]
+        for entry in jobs:
+            self.queue.set_priority(entry, priority)
+            self.bandwidth.set_priority(entry)
+
+    def cancel(self, job, keep_partial=None):
+        if isinstance(job, PlaylistJob):
+            for entry in job.cancel(keep_partial):
+                self.queue.cancel(entry, keep_partial)
+        else:
+            self.queue.cancel(job, keep_partial)
+
+    def cancel_all(self, keep_partial=None):
+        for playlist in list(self.playlists):
+            playlist.cancel(keep_partial)
+        self.queue.cancel_all(keep_partial)
+
+    def run_job(self, job):
+        throttle = self.bandwidth.hook(job)
+        metrics = self.metrics.begin(job)
+
+        def progress_hook(d):
+            metrics.on_progress(d)
+            job.update(d)
+            self.journal.progress(job)
+            throttle(d)
+
+        def postprocessor_hook(d):
+            metrics.on_postprocess(d)
+            job.check_cancelled()
+
+        self.journal.running(job)
+        self.history.record(job)
+        self.bandwidth.register(job)
+        try:
+            workers = self.workers
+            if workers is not None:
+                self.prefetcher.wait(job.url)
+                finish = workers.download(job, progress_hook, postprocessor_hook, metrics,
+                                          self.use_archive,
+                                          self.staging.path if self.staging else None,
+                                          self.content is not None)
+            else:
+                finish = self.download(job.url, job.quality, progress_hook, postprocessor_hook,
+                                       job.download_path, metrics, defer_postprocess=True,
+                                       staging_id=staging_key(job))
+        except Exception:
+            self.discard_partial_files(job)
+            raise
+        finally:
+            self.bandwidth.unregister(job)
+
+        if metrics.plan:
+            # Once, however many attempts it took
+            job.warnings.extend(note for note in metrics.plan['notes'] if note not in job.warnings)
+        handed_over = time.monotonic()
+
+        def postprocess():
+            metrics.postprocess_wait = time.monotonic() - handed_over
+            if job.cancelled:
+                finish(cancelled=True)
+                self.discard_partial_files(job)
+                job.check_cancelled()
+            try:
+                job.filename = finish() or job.filename
+            except Exception:
+                self.discard_partial_files(job)
+                raise
+
+        # Run by the queue on its post-processing pool, off the network worker
+        return postprocess
+
+    def keeps_partial(self, job):
+        return self.keep_partial_files if job.keep_partial is None else job.keep_partial
+
+    def discard_partial_files(self, job):
+        if job.cancelled and not self.keeps_partial(job):
+            self.remove_partial_files(job)
+
+    def remove_partial_files(self, job):
+        remove_partial_files(job.files)
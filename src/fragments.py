@@ -0,0 +1,95 @@
+import threading
+import time
+
+THROTTLE_MARKERS = ('HTTP Error 429', 'HTTP Error 403', 'Too Many Requests')
+
+
+def is_throttled(error):
+    return any(marker in str(error) for marker in THROTTLE_MARKERS)
+
+
+class FragmentTuner:
+    # Hill climbing on measured throughput, one state per host: keep stepping
+    # the fragment worker count in the direction that made things faster,
+    # turn around when it gets slower, and halve on throttling.
+    def __init__(self, minimum=1, maximum=16, start=2, tolerance=0.05):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.start = start
+        self.tolerance = tolerance
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _state(self, host):
+        return self._hosts.setdefault(host, {'workers': self.start, 'throughput': None, 'step': 1})
+
+    def workers(self, host):
+        with self._lock:
+            return self._state(host)['workers']
+
+    def record(self, host, workers, throughput):
+        with self._lock:
+            state = self._state(host)
+            if workers != state['workers'] or throughput <= 0:
+                # Measured at a level that is no longer current
+                return state['workers']
+
+            last = state['throughput']
+            if last is not None and throughput < last * (1 - self.tolerance):
+                state['step'] = -state['step']
+            elif last is not None and throughput <= last * (1 + self.tolerance):
+                state['throughput'] = max(last, throughput)
+                return workers
+
+            state['throughput'] = throughput
+            state['workers'] = min(self.maximum, max(self.minimum, workers + state['step']))
+            return state['workers']
+
+    def throttled(self, host):
+        with self._lock:
+            state = self._state(host)
+            state['workers'] = max(self.minimum, state['workers'] // 2)
+            state['throughput'] = None
+            state['step'] = 1
+            return state['workers']
+
+
+class FragmentMonitor:
+    # Progress hook for one job. Samples throughput every `window` fragments
+    # and writes the tuned worker count back into the YoutubeDL params, which
+    # yt-dlp reads when it starts the next fragmented stream.
+    def __init__(self, tuner, host, window=10):
+        self.tuner = tuner
+        self.host = host
+        self.window = window
+        self.params = None
+        self._stream = None
+        self._sample = None
+        self._lock = threading.Lock()
+
+    def attach(self, params):
+        self.params = params
+        params['concurrent_fragment_downloads'] = self.tuner.workers(self.host)
+
+    def hook(self, d):
+        if d.get('fragment_index') is None or self.params is None:
+            return
+
+        now = time.monotonic()
+        index = d['fragment_index']
+        downloaded = d.get('downloaded_bytes') or 0
+        with self._lock:
+            if d.get('filename') != self._stream:
+                self._stream = d.get('filename')
+                self._sample = (now, index, downloaded)
+                return
+
+            start, start_index, start_bytes = self._sample
+            if d['status'] != 'finished' and index - start_index < self.window:
+                return
+            self._sample = (now, index, downloaded)
+
+        if now > start and downloaded > start_bytes:
+            workers = self.params.get('concurrent_fragment_downloads', 1)
+            throughput = (downloaded - start_bytes) / (now - start)
+            self.params['concurrent_fragment_downloads'] = self.tuner.record(self.host, workers, throughput)
@@ -1,45 +1,352 @@
 import tkinter as tk
-from tkinter import messagebox, ttk, filedialog
-import threading
+from tkinter import messagebox, ttk, filedialog, simpledialog
 import os
-import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
+from .bandwidth import HIGH, NORMAL, parse_rate
+from .dispatch import UiDispatcher
 from .downloader import YouTubeDownloader
+from .cache import cache_key
+from .paths import cache_dir
+from .jobs import CANCELLED, FAILED, FINISHED, POSTPROCESSING, QUEUED, RUNNING, SKIPPED
+from .prefetch import looks_like_url
+from .settings import SettingsStore
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+class HistoryPanel:
+    # Holds only the ids of the current search; the Treeview has one item
+    # per visible line and scrolling refills them, so 100k entries cost the
+    # same to draw as 10
+    STATES = ["All states", QUEUED, RUNNING, POSTPROCESSING, FINISHED, FAILED, CANCELLED, SKIPPED]
+    PERIODS = {"Any time": None, "Today": 0, "Last 7 days": 7, "Last 30 days": 30}
+
+    def __init__(self, parent, store, post):
+        self.store = store
+        self.post = post
+        self.ids = []
+        self.top = 0
+        self.items = []
+        self.rows = {}
+        self.selected = None
+        self._query = 0
+        self._refresh_id = None
+
+        self.frame = ttk.LabelFrame(parent, text="History", padding=10)
+
+        filters = ttk.Frame(self.frame)
+        filters.pack(fill=tk.X, pady=(0, 5))
+        self.search = tk.StringVar()
+        self.search.trace_add('write', lambda *args: self.schedule_refresh(250))
+        ttk.Entry(filters, textvariable=self.search).pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.state = tk.StringVar(value=self.STATES[0])
+        state_combo = ttk.Combobox(filters, textvariable=self.state, values=self.STATES,
+                                   state='readonly', width=11)
+        state_combo.pack(side=tk.LEFT, padx=5)
+        state_combo.bind('<<ComboboxSelected>>', lambda e: self.refresh())
+        self.period = tk.StringVar(value="Any time")
+        period_combo = ttk.Combobox(filters, textvariable=self.period, values=list(self.PERIODS),
+                                    state='readonly', width=11)
+        period_combo.pack(side=tk.LEFT)
+        period_combo.bind('<<ComboboxSelected>>', lambda e: self.refresh())
+        self.count = ttk.Label(filters, width=9, anchor=tk.E)
+        self.count.pack(side=tk.LEFT, padx=(5, 0))
+
+        body = ttk.Frame(self.frame)
+        body.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(body, columns=('title', 'state', 'size', 'date'),
+                                 show='headings', selectmode='browse', height=6)
+        for column, heading, width, stretch in (('title', "Title", 220, True),
+                                                ('state', "State", 90, False),
+                                                ('size', "Size", 70, False),
+                                                ('date', "Date", 110, False)):
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=width, stretch=stretch)
+        self.scrollbar = ttk.Scrollbar(body, orient=tk.VERTICAL, command=self.on_scroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.tree.bind('<Configure>', lambda e: self.fill())
+        self.tree.bind('<<TreeviewSelect>>', self.on_select)
+        self.tree.bind('<MouseWheel>', lambda e: self.scroll_to(self.top + (-3 if e.delta > 0 else 3)))
+        self.tree.bind('<Button-4>', lambda e: self.scroll_to(self.top - 3))
+        self.tree.bind('<Button-5>', lambda e: self.scroll_to(self.top + 3))
+        self.tree.bind('<Up>', lambda e: self.on_key(-1))
+        self.tree.bind('<Down>', lambda e: self.on_key(1))
+        self.tree.bind('<Prior>', lambda e: self.scroll_to(self.top - self.visible_rows()))
+        self.tree.bind('<Next>', lambda e: self.scroll_to(self.top + self.visible_rows()))
+
+    def filters(self):
+        days = self.PERIODS[self.period.get()]
+        since = None
+        if days is not None:
+            since = time.mktime(time.localtime()[:3] + (0, 0, 0, 0, 0, -1)) - days * 86400
+        state = self.state.get()
+        return {'text': self.search.get(), 'since': since,
+                'state': None if state == self.STATES[0] else state}
+
+    def schedule_refresh(self, delay=500):
+        if self._refresh_id is not None:
+            self.frame.after_cancel(self._refresh_id)
+        self._refresh_id = self.frame.after(delay, self.refresh)
+
+    def refresh(self):
+        # The search runs off the Tk thread; only the newest answer is shown
+        self._refresh_id = None
+        self._query += 1
+        query, filters = self._query, self.filters()
+
+        def search():
+            try:
+                ids = self.store.ids(**filters)
+            except Exception:
+                return
+            self.post(self.show, query, ids)
+
+        threading.Thread(target=search, daemon=True, name="history-search").start()
+
+    def show(self, query, ids):
+        if query != self._query:
+            return
+        self.ids = ids
+        self.count.config(text=f"{len(ids):,}")
+        self.fill()
+
+    def visible_rows(self):
+        height = self.tree.winfo_height()
+        row_height = int(ttk.Style().lookup('Treeview', 'rowheight') or 20)
+        # Less the heading row
+        return max(1, height // row_height - 1)
+
+    def scroll_to(self, top):
+        self.top = top
+        self.fill()
+        return 'break'
+
+    def fill(self):
+        rows = self.visible_rows()
+        self.top = max(0, min(self.top, len(self.ids) - rows))
+        page = self.ids[self.top:self.top + rows]
+        self.rows = self.store.rows(page)
+
+        while len(self.items) > len(page):
+            self.tree.delete(self.items.pop())
+        while len(self.items) < len(page):
+            self.items.append(self.tree.insert('', tk.END))
+
+        selection = ()
+        for item, job_id in zip(self.items, page):
+            row = self.rows.get(job_id)
+            if row is None:
+                self.tree.item(item, values=('', '', '', ''))
+                continue
+            self.tree.item(item, values=(
+                row['title'] or row['url'],
+                row['state'],
+                format_size(row['bytes']) if row['bytes'] else '',
+                time.strftime('%Y-%m-%d %H:%M', time.localtime(row['created']))))
+            if job_id == self.selected:
+                selection = (item,)
+        self.tree.selection_set(selection)
+
+        if self.ids:
+            self.scrollbar.set(self.top / len(self.ids), (self.top + len(page)) / len(self.ids))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def on_scroll(self, action, amount, unit=None):
+        rows = self.visible_rows()
+        if action == 'moveto':
+            self.scroll_to(int(float(amount) * len(self.ids)))
+        elif unit == 'pages':
+            self.scroll_to(self.top + int(amount) * rows)
+        else:
+            self.scroll_to(self.top + int(amount))
+
+    def on_select(self, event):
+        selection = self.tree.selection()
+        if selection and selection[0] in self.items:
+            self.selected = self.ids[self.top + self.items.index(selection[0])]
+
+    def on_key(self, step):
+        # Moving past the first or last line scrolls the window of items
+        selection = self.tree.selection()
+        if not selection or selection[0] not in self.items:
+            return None
+        index = self.items.index(selection[0]) + step
+        if 0 <= index < len(self.items):
+            return None
+        position = self.top + index
+        if 0 <= position < len(self.ids):
+            self.selected = self.ids[position]
+            self.scroll_to(self.top + step)
+        return 'break'
+
+    def update_jobs(self, jobs):
+        # Live state for jobs on screen; the store only has their last write
+        by_uid = {job.uid: job for job in jobs}
+        for item, job_id in zip(self.items, self.ids[self.top:self.top + len(self.items)]):
+            row = self.rows.get(job_id)
+            job = row and by_uid.get(row['uid'])
+            if job is None:
+                continue
+            state = f"{job.state} {job.progress:.0f}%" if job.state == RUNNING else job.state
+            self.tree.set(item, 'state', state)
+            if job.title:
+                self.tree.set(item, 'title', job.title)
+            if job.total_bytes:
+                self.tree.set(item, 'size', format_size(job.total_bytes))
+
+
+class PreviewMixin:
+    # Link previews, prefetching and clipboard watching, shared with the
+    # standalone youtube_downloader.py window. The host has root, downloader,
+    # settings, url_entry, url, quality, quality_combo, quality_labels,
+    # status and watch_clipboard, and says when it is busy downloading.
+    _prefetch_id = None
+    _last_clipboard = None
+
+    def post(self, func, *args):
+        # Runs func on the Tk thread
+        self.root.after(0, func, *args)
+
+    def busy(self):
+        raise NotImplementedError
+
+    def wants_preview(self):
+        return True
+
+    def paste_url(self):
+        try:
+            self.url_entry.delete(0, tk.END)
+            self.url_entry.insert(0, self.root.clipboard_get())
+        except:
+            pass
+        self.prefetch()
+
+    def schedule_prefetch(self):
+        # Typing fires on every key; wait for a pause before resolving
+        if self._prefetch_id is not None:
+            self.root.after_cancel(self._prefetch_id)
+        self._prefetch_id = self.root.after(400, self.prefetch)
+
+    def prefetch(self):
+        if self._prefetch_id is not None:
+            self.root.after_cancel(self._prefetch_id)
+            self._prefetch_id = None
+        url = self.url.get().strip()
+        self.show_preview(None)
+        if looks_like_url(url) and self.wants_preview():
+            self.downloader.prefetcher.request(
+                url, lambda preview: self.post(self.show_preview, preview))
+
+    def show_preview(self, preview):
+        if preview is not None and cache_key(preview.url) != cache_key(self.url.get().strip()):
+            return
+        quality = self.selected_quality()
+        self.quality_labels = {}
+        for key in self.downloader.formats:
+            label = key
+            size = preview.sizes.get(key) if preview else None
+            if size:
+                label += f" - {format_size(size)}"
+            if preview and key == preview.recommended:
+                label += " (recommended)"
+            self.quality_labels[label] = key
+        self.quality_combo.config(values=list(self.quality_labels))
+        self.quality.set(next((label for label, key in self.quality_labels.items() if key == quality),
+                              self.quality.get()))
+
+        if preview is None or self.busy():
+            return
+        if preview.error:
+            self.status.config(text=f"Could not look up link: {preview.error}")
+        elif preview.title:
+            duration = f" ({timedelta(seconds=int(preview.duration))})" if preview.duration else ""
+            recommended = f" - {preview.recommended} recommended" if preview.recommended else ""
+            self.status.config(text=f"{preview.title}{duration}{recommended}")
+
+    def selected_quality(self):
+        return self.quality_labels.get(self.quality.get(), self.quality.get())
+
+    def change_watch_clipboard(self):
+        self.settings['watch_clipboard'] = self.watch_clipboard.get()
+        if self.watch_clipboard.get():
+            self.watch_clipboard_tick()
+
+    def watch_clipboard_tick(self):
+        # Tk only exposes the clipboard to polling; a cheap read once a second
+        if not self.watch_clipboard.get():
+            return
+        try:
+            text = self.root.clipboard_get().strip()
+        except tk.TclError:
+            text = None
+        if text != self._last_clipboard:
+            self._last_clipboard = text
+            if looks_like_url(text):
+                self.downloader.prefetcher.request(text)
+        self.root.after(1000, self.watch_clipboard_tick)
 
-class ModernDownloaderGUI:
+
+class ModernDownloaderGUI(PreviewMixin):
     def __init__(self):
-        self.settings = {}
         self.downloader = YouTubeDownloader()
         self.load_settings()
         self.setup_gui()
-        self.current_download = None
 
     def load_settings(self):
-        try:
-            with open('settings.json', 'r') as f:
-                self.settings = json.load(f)
-        except:
-            self.settings = {
-                'download_path': self.downloader.download_path,
-                'last_quality': '1080p'
-            }
-            self.save_settings()
-
-    def save_settings(self):
-        try:
-            with open('settings.json', 'w') as f:
-                json.dump(self.settings, f)
-        except:
-            pass
+        self.settings = SettingsStore().load()
+
+        if self.settings.get('download_path'):
+            self.downloader.download_path = self.settings['download_path']
+        self.downloader.queue.set_limits(max_workers=self.settings['max_workers'],
+                                         per_host_limit=self.settings['per_host_limit'])
+        self.downloader.keep_partial_files = self.settings['keep_partial_files']
+        self.downloader.use_archive = self.settings['use_archive']
+        self.downloader.set_rate_limit(self.settings['rate_limit'])
+        self.downloader.set_process_workers(self.settings['process_workers'])
+        self.downloader.set_staging(self.settings['staging_path'])
+        self.downloader.set_dedupe(self.settings['dedupe_files'])
+        if self.settings['metrics_log']:
+            self.downloader.log_metrics(self.settings['metrics_log'])
+        if self.settings['metrics_port']:
+            try:
+                self.downloader.serve_metrics(self.settings['metrics_port'])
+            except OSError:
+                pass
 
     def setup_gui(self):
+        # Jobs that failed since the queue last drained, for one summary
+        self._failed = []
+        # Submits, resumes and cancels still running off the Tk thread. One at
+        # a time and in order, so a resume has replayed the journal before new
+        # jobs are added to it, and a cancel reaches jobs submitted before it
+        self._in_flight = 0
+        self._background = ThreadPoolExecutor(1, thread_name_prefix='submit')
+        self._last_done = None
         self.root = tk.Tk()
         self.root.title("YouTube Downloader")
-        self.root.geometry("500x400")
-        self.root.minsize(500, 400)
+        self.root.geometry("600x640")
+        self.root.minsize(500, 480)
         
         self.create_menu()
         self.create_widgets()
+        if self.settings.errors:
+            self.status.config(text=f"Settings: {'; '.join(self.settings.errors)}")
+
+        self.dispatcher = UiDispatcher(self.root, self.progress_hook)
+        self.dispatcher.start()
+        self.history = HistoryPanel(self.main, self.downloader.history, self.dispatcher.post)
+        self.history.frame.pack(fill=tk.BOTH, expand=True, pady=(10, 0))
+        self.history.refresh()
 
     def create_menu(self):
         self.menu = tk.Menu(self.root)
@@ -48,18 +355,47 @@ class ModernDownloaderGUI:
         file_menu = tk.Menu(self.menu, tearoff=0)
         self.menu.add_cascade(label="File", menu=file_menu)
         file_menu.add_command(label="Change Download Location", command=self.change_location)
+        file_menu.add_command(label="Set Bandwidth Limit...", command=self.change_rate_limit)
+        file_menu.add_command(label="Set Downloads per Site...", command=self.change_per_host_limit)
+
+        self.keep_partial = tk.BooleanVar(value=self.settings['keep_partial_files'])
+        file_menu.add_checkbutton(label="Keep Partial Files on Cancel",
+                                  variable=self.keep_partial,
+                                  command=self.change_keep_partial)
+        self.use_archive = tk.BooleanVar(value=self.settings['use_archive'])
+        file_menu.add_checkbutton(label="Skip Previously Downloaded",
+                                  variable=self.use_archive,
+                                  command=self.change_use_archive)
+        self.watch_clipboard = tk.BooleanVar(value=self.settings['watch_clipboard'])
+        file_menu.add_checkbutton(label="Prefetch Copied Links",
+                                  variable=self.watch_clipboard,
+                                  command=self.change_watch_clipboard)
+        self.process_workers = tk.BooleanVar(value=self.settings['process_workers'])
+        file_menu.add_checkbutton(label="Run Downloads in Separate Processes",
+                                  variable=self.process_workers,
+                                  command=self.change_process_workers)
+        self.staging = tk.BooleanVar(value=bool(self.settings['staging_path']))
+        file_menu.add_checkbutton(label="Stage Downloads in a Local Folder...",
+                                  variable=self.staging,
+                                  command=self.change_staging)
+        self.dedupe_files = tk.BooleanVar(value=self.settings['dedupe_files'])
+        file_menu.add_checkbutton(label="Link Identical Files Instead of Storing Copies",
+                                  variable=self.dedupe_files,
+                                  command=self.change_dedupe_files)
         file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self.root.quit)
 
     def create_widgets(self):
-        main = ttk.Frame(self.root, padding=10)
+        main = self.main = ttk.Frame(self.root, padding=10)
         main.pack(fill=tk.BOTH, expand=True)
 
         # URL
         url_frame = ttk.LabelFrame(main, text="Video URL", padding=10)
         url_frame.pack(fill=tk.X, pady=(0, 10))
 
-        self.url_entry = ttk.Entry(url_frame)
+        self.url = tk.StringVar()
+        self.url.trace_add('write', lambda *args: self.schedule_prefetch())
+        self.url_entry = ttk.Entry(url_frame, textvariable=self.url)
         self.url_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 5))
 
         ttk.Button(url_frame, text="Paste", command=self.paste_url).pack(side=tk.RIGHT)
@@ -70,14 +406,37 @@ class ModernDownloaderGUI:
 
         ttk.Label(opt_frame, text="Quality:").pack(side=tk.LEFT)
 
-        self.quality = tk.StringVar(value=self.settings.get('last_quality', '1080p'))
+        # Combobox text -> quality key; labels gain sizes once a preview is in
+        self.quality_labels = {quality: quality for quality in self.downloader.formats}
+        self.quality = tk.StringVar(value=self.settings['last_quality'])
         self.quality_combo = ttk.Combobox(opt_frame, 
                                         textvariable=self.quality,
-                                        values=["1080p", "720p", "480p", "Audio Only"],
+                                        values=list(self.quality_labels),
                                         state='readonly',
-                                        width=15)
+                                        width=30)
         self.quality_combo.pack(side=tk.LEFT, padx=5)
 
+        ttk.Label(opt_frame, text="Parallel:").pack(side=tk.LEFT, padx=(10, 0))
+
+        self.max_workers = tk.IntVar(value=self.settings['max_workers'])
+        ttk.Spinbox(opt_frame,
+                    from_=1,
+                    to=8,
+                    textvariable=self.max_workers,
+                    command=self.change_max_workers,
+                    state='readonly',
+                    width=3).pack(side=tk.LEFT, padx=5)
+
+        self.playlist_mode = tk.BooleanVar(value=self.settings['playlist_mode'])
+        ttk.Checkbutton(opt_frame,
+                        text="Playlist",
+                        variable=self.playlist_mode).pack(side=tk.LEFT, padx=5)
+
+        self.urgent = tk.BooleanVar(value=False)
+        ttk.Checkbutton(opt_frame,
+                        text="Urgent",
+                        variable=self.urgent).pack(side=tk.LEFT, padx=5)
+
         self.download_btn = ttk.Button(opt_frame, 
                                      text="Download",
                                      command=self.start_download)
@@ -109,13 +468,6 @@ class ModernDownloaderGUI:
                                    state='disabled')
         self.cancel_btn.pack(side=tk.RIGHT)
 
-    def paste_url(self):
-        try:
-            self.url_entry.delete(0, tk.END)
-            self.url_entry.insert(0, self.root.clipboard_get())
-        except:
-            pass
-
     def change_location(self):
         path = filedialog.askdirectory(
             initialdir=self.downloader.download_path,
@@ -124,39 +476,111 @@ class ModernDownloaderGUI:
         if path:
             self.downloader.download_path = path
             self.settings['download_path'] = path
-            self.save_settings()
 
-    def progress_hook(self, d):
-        if d['status'] == 'downloading':
-            try:
-                downloaded = d.get('downloaded_bytes', 0)
-                total = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
-                speed = d.get('speed', 0)
-                eta = d.get('eta', 0)
-
-                if total:
-                    progress = (downloaded / total) * 100
-                    self.progress.set(progress)
-
-                    downloaded_mb = downloaded / 1024 / 1024
-                    total_mb = total / 1024 / 1024
-                    speed_mb = speed / 1024 / 1024 if speed else 0
-                    eta_str = str(timedelta(seconds=eta)) if eta else 'Unknown'
-
-                    status = f"{downloaded_mb:.1f}MB of {total_mb:.1f}MB "
-                    status += f"({progress:.1f}%) at {speed_mb:.1f}MB/s "
-                    status += f"- ETA: {eta_str}"
-                    
-                    self.status.config(text=status)
-                    self.root.update_idletasks()
+    def change_keep_partial(self):
+        self.downloader.keep_partial_files = self.keep_partial.get()
+        self.settings['keep_partial_files'] = self.keep_partial.get()
+
+    def change_rate_limit(self):
+        current = self.settings.get('rate_limit')
+        value = simpledialog.askstring(
+            "Bandwidth Limit",
+            "Total download rate for all jobs (e.g. 500K, 2M; empty for unlimited):",
+            initialvalue=f"{current // 1024}K" if current else "",
+            parent=self.root
+        )
+        if value is None:
+            return
 
-            except Exception as e:
-                self.status.config(text=f"Error: {str(e)}")
+        try:
+            rate = parse_rate(value) if value.strip() else None
+        except ValueError as e:
+            messagebox.showwarning("Error", str(e))
+            return
+
+        self.downloader.set_rate_limit(rate)
+        self.settings['rate_limit'] = rate
+
+    def change_per_host_limit(self):
+        value = simpledialog.askinteger(
+            "Downloads per Site",
+            "Parallel downloads from the same site (1-8):",
+            initialvalue=self.settings['per_host_limit'],
+            minvalue=1,
+            maxvalue=8,
+            parent=self.root
+        )
+        if value is None:
+            return
 
-        elif d['status'] == 'finished':
-            self.progress.set(100)
-            self.status.config(text="Processing...")
-            self.root.update_idletasks()
+        self.downloader.queue.set_limits(per_host_limit=value)
+        self.settings['per_host_limit'] = value
+
+    def change_use_archive(self):
+        self.downloader.use_archive = self.use_archive.get()
+        self.settings['use_archive'] = self.use_archive.get()
+
+    def change_process_workers(self):
+        # Jobs already running keep the mode they started in
+        self.downloader.set_process_workers(self.process_workers.get())
+        self.settings['process_workers'] = self.process_workers.get()
+
+    def change_staging(self):
+        path = None
+        if self.staging.get():
+            path = filedialog.askdirectory(
+                initialdir=os.path.join(cache_dir(), "staging"),
+                title="Select Local Staging Folder"
+            )
+            if not path:
+                self.staging.set(False)
+        self.downloader.set_staging(path)
+        self.settings['staging_path'] = path or None
+
+    def change_dedupe_files(self):
+        self.downloader.set_dedupe(self.dedupe_files.get())
+        self.settings['dedupe_files'] = self.dedupe_files.get()
+
+    def change_max_workers(self):
+        self.downloader.queue.set_limits(max_workers=self.max_workers.get())
+        self.settings['max_workers'] = self.max_workers.get()
+
+    def progress_hook(self, jobs):
+        self.history.update_jobs(jobs)
+        job = jobs[0]
+        try:
+            if job.state == QUEUED and job.retry_at is not None:
+                wait = max(0, job.retry_at - time.monotonic())
+                status = f"Retrying in {wait:.0f}s: {job.error}"
+            elif job.progress < 100 and job.total_bytes:
+                downloaded_mb = job.downloaded_bytes / 1024 / 1024
+                total_mb = job.total_bytes / 1024 / 1024
+                speed_mb = job.speed / 1024 / 1024
+                eta_str = str(timedelta(seconds=job.eta)) if job.eta else 'Unknown'
+
+                status = f"{downloaded_mb:.1f}MB of {total_mb:.1f}MB "
+                status += f"({job.progress:.1f}%) at {speed_mb:.1f}MB/s "
+                status += f"- ETA: {eta_str}"
+            elif job.progress >= 100:
+                status = "Processing..."
+            else:
+                return
+
+            self.show_progress(status)
+
+        except Exception as e:
+            self.status.config(text=f"Error: {str(e)}")
+
+    def show_progress(self, status=None):
+        jobs = self.downloader.queue.active_jobs()
+        running, queued = self.downloader.queue.counts()
+
+        if jobs:
+            self.progress.set(sum(job.progress for job in jobs) / len(jobs))
+        if running + queued > 1:
+            status = f"[{running} running, {queued} queued] {status or ''}"
+        if status:
+            self.status.config(text=status)
 
     def start_download(self):
         url = self.url_entry.get().strip()
@@ -164,34 +588,114 @@ class ModernDownloaderGUI:
             messagebox.showwarning("Error", "Enter a URL")
             return
 
-        self.download_btn.config(state='disabled')
-        self.url_entry.config(state='disabled')
-        self.quality_combo.config(state='disabled')
+        self.url_entry.delete(0, tk.END)
         self.cancel_btn.config(state='normal')
-        
-        self.settings['last_quality'] = self.quality.get()
-        self.save_settings()
 
-        def run_download():
+        quality = self.selected_quality()
+        self.settings.update({'last_quality': quality,
+                              'playlist_mode': self.playlist_mode.get()})
+
+        submit = self.downloader.submit_playlist if self.playlist_mode.get() else self.downloader.submit
+        priority = HIGH if self.urgent.get() else NORMAL
+        self.urgent.set(False)
+        self.show_progress("Queued")
+        self.in_background(lambda: submit(
+            url=url,
+            quality=quality,
+            on_progress=self.dispatcher.post_progress,
+            on_done=lambda job: self.dispatcher.post(self.download_done, job),
+            priority=priority
+        ), lambda job: self.history.schedule_refresh())
+
+    def resume_downloads(self):
+        self.in_background(lambda: self.downloader.resume(
+            on_progress=self.dispatcher.post_progress,
+            on_done=lambda job: self.dispatcher.post(self.download_done, job)
+        ), self.resumed, "resume downloads")
+
+    def resumed(self, jobs):
+        if jobs:
+            self.cancel_btn.config(state='normal')
+            self.show_progress(f"Resuming {len(jobs)} interrupted download(s)")
+            self.history.schedule_refresh()
+
+    def in_background(self, work, then, action="queue download"):
+        # Journal and history writes are fsync'd; keep them off the Tk thread
+        # and hand the result back through the dispatcher
+        self._in_flight += 1
+
+        def run():
             try:
-                self.downloader.download(
-                    url=url,
-                    quality=self.quality.get(),
-                    progress_hook=self.progress_hook
-                )
-                self.root.after(0, lambda: messagebox.showinfo("Success", 
-                    f"Download complete!\nLocation: {self.downloader.download_path}"))
+                result = work()
             except Exception as e:
-                self.root.after(0, lambda: messagebox.showerror("Error", str(e)))
-            finally:
-                self.root.after(0, self.reset_ui)
+                self.dispatcher.post(self.background_done, None, f"Could not {action}: {e}")
+            else:
+                self.dispatcher.post(self.background_done, then, result)
+
+        self._background.submit(run)
+
+    def background_done(self, then, result):
+        self._in_flight -= 1
+        if then is None:
+            self._failed.append(result)
+        else:
+            then(result)
+        if self.busy():
+            return
+        if self._last_done is not None or self._failed:
+            self.drained()
+        else:
+            self.cancel_btn.config(state='disabled')
 
-        self.current_download = threading.Thread(target=run_download, daemon=True)
-        self.current_download.start()
+    def post(self, func, *args):
+        self.dispatcher.post(func, *args)
 
-    def cancel_download(self):
+    def busy(self):
+        running, queued = self.downloader.queue.counts()
+        return bool(running + queued or self.downloader.playlists or self._in_flight)
+
+    def wants_preview(self):
+        return not self.playlist_mode.get()
+
+    def download_done(self, job):
+        self.history.schedule_refresh()
+        if job.error:
+            self._failed.append(f"{job.title or job.url}: {job.error}")
+        self._last_done = job
+
+        if self.busy():
+            self.show_progress(f"Failed: {self._failed[-1]}" if job.error else None)
+            return
+        self.drained()
+
+    def drained(self):
+        job, self._last_done = self._last_done, None
         self.reset_ui()
-        self.status.config(text="Cancelled")
+        failed, self._failed = self._failed, []
+        if failed:
+            self.status.config(text=f"{len(failed)} download(s) failed")
+            shown = "\n".join(failed[:5])
+            if len(failed) > 5:
+                shown += f"\n...and {len(failed) - 5} more"
+            messagebox.showerror("Error", shown)
+        elif job is None:
+            return
+        elif job.state == CANCELLED:
+            self.status.config(text="Cancelled")
+        elif job.state == SKIPPED:
+            self.status.config(text="Already downloaded")
+        else:
+            notes = "".join(f"\nNote: {note}" for note in job.warnings)
+            messagebox.showinfo("Success",
+                f"Download complete!\nLocation: {self.downloader.download_path}{notes}")
+
+    def cancel_download(self):
+        self.cancel_btn.config(state='disabled')
+        self.status.config(text="Cancelling...")
+        # Every queued job ends with a synced journal write and a history write
+        keep_partial = self.keep_partial.get()
+        self.in_background(lambda: self.downloader.cancel_all(keep_partial=keep_partial),
+                           lambda result: None, "cancel downloads")
 
     def reset_ui(self):
         self.url_entry.config(state='normal')
@@ -199,7 +703,16 @@ class ModernDownloaderGUI:
         self.quality_combo.config(state='readonly')
         self.cancel_btn.config(state='disabled')
         self.progress.set(0)
-        self.current_download = None
+        self.status.config(text="Ready")
 
     def run(self):
-        self.root.mainloop()
\ No newline at end of file
+        # Import yt-dlp in the background once the window has been drawn
+        self.root.after(100, self.downloader.warm_up)
+        self.root.after(150, self.resume_downloads)
+        self.root.after(200, self.watch_clipboard_tick)
+        try:
+            self.root.mainloop()
+        finally:
+            self._background.shutdown()
+            self.downloader.close()
+            self.settings.close()
\ No newline at end of file
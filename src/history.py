@@ -0,0 +1,127 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+
+COLUMNS = ('id', 'uid', 'url', 'title', 'host', 'quality', 'state', 'error', 'filename',
+           'bytes', 'created', 'finished')
+
+
+def match_query(text):
+    # Every word must match the start of a word in the title or URL
+    words = re.findall(r'\w+', text)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+class HistoryStore:
+    # Every job ever queued, newest first. Searches return ids only, so a
+    # view can hold the full result and fetch the few rows it shows by key.
+    def __init__(self, path):
+        self.path = path
+        self.fts = False
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id INTEGER PRIMARY KEY, uid TEXT NOT NULL UNIQUE, url TEXT NOT NULL, title TEXT, "
+                "host TEXT, quality TEXT, state TEXT NOT NULL, error TEXT, filename TEXT, "
+                "bytes INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL, finished REAL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_url ON jobs (url)")
+            self.fts = self._create_fts(self._conn)
+            self._conn.commit()
+        return self._conn
+
+    @staticmethod
+    def _create_fts(db):
+        existed = db.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'jobs_fts'").fetchone() is not None
+        try:
+            db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS jobs_fts USING fts5("
+                       "title, url, content='jobs', content_rowid='id')")
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: searches fall back to LIKE
+            return False
+        db.executescript(
+            "CREATE TRIGGER IF NOT EXISTS jobs_fts_insert AFTER INSERT ON jobs BEGIN "
+            "INSERT INTO jobs_fts (rowid, title, url) VALUES (new.id, new.title, new.url); END;"
+            "CREATE TRIGGER IF NOT EXISTS jobs_fts_delete AFTER DELETE ON jobs BEGIN "
+            "INSERT INTO jobs_fts (jobs_fts, rowid, title, url) "
+            "VALUES ('delete', old.id, old.title, old.url); END;"
+            "CREATE TRIGGER IF NOT EXISTS jobs_fts_update AFTER UPDATE OF title, url ON jobs BEGIN "
+            "INSERT INTO jobs_fts (jobs_fts, rowid, title, url) "
+            "VALUES ('delete', old.id, old.title, old.url); "
+            "INSERT INTO jobs_fts (rowid, title, url) VALUES (new.id, new.title, new.url); END;")
+        if not existed:
+            # Rows written while the index did not exist
+            db.execute("INSERT INTO jobs_fts (jobs_fts) VALUES ('rebuild')")
+        return True
+
+    def record(self, job):
+        finished = time.time() if job.done else None
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT INTO jobs (uid, url, title, host, quality, state, error, filename, bytes, "
+                "created, finished) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (uid) DO UPDATE SET title = coalesce(excluded.title, title), "
+                "state = excluded.state, error = excluded.error, "
+                "filename = coalesce(excluded.filename, filename), "
+                "bytes = max(excluded.bytes, bytes), finished = excluded.finished",
+                (job.uid, job.url, job.title, job.host, job.quality, job.state,
+                 str(job.error) if job.error else None, job.filename,
+                 job.total_bytes or job.downloaded_bytes or 0, job.created, finished))
+            db.commit()
+
+    def _where(self, text, state, since, until):
+        clauses, args = [], []
+        if text and text.strip():
+            if self.fts and match_query(text):
+                clauses.append("id IN (SELECT rowid FROM jobs_fts WHERE jobs_fts MATCH ?)")
+                args.append(match_query(text))
+            elif not self.fts:
+                pattern = '%' + re.sub(r'([\\%_])', r'\\\1', text.strip()) + '%'
+                clauses.append("(title LIKE ? ESCAPE '\\' OR url LIKE ? ESCAPE '\\')")
+                args += [pattern, pattern]
+        if state:
+            clauses.append("state = ?")
+            args.append(state)
+        if since is not None:
+            clauses.append("created >= ?")
+            args.append(since)
+        if until is not None:
+            clauses.append("created < ?")
+            args.append(until)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), args
+
+    def ids(self, text=None, state=None, since=None, until=None):
+        with self._lock:
+            db = self._db()
+            where, args = self._where(text, state, since, until)
+            rows = db.execute(f"SELECT id FROM jobs{where} ORDER BY created DESC, id DESC",
+                              args).fetchall()
+        return [row[0] for row in rows]
+
+    def rows(self, ids):
+        if not ids:
+            return {}
+        with self._lock:
+            rows = self._db().execute(
+                f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE id IN ({', '.join('?' * len(ids))})",
+                list(ids)).fetchall()
+        return {row[0]: dict(zip(COLUMNS, row)) for row in rows}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
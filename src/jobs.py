@@ -0,0 +1,364 @@
+import itertools
+import os
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from urllib.parse import urlparse
+from .retry import classify
+
+QUEUED = 'queued'
+RUNNING = 'running'
+POSTPROCESSING = 'postprocessing'
+FINISHED = 'finished'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+SKIPPED = 'skipped'
+
+DONE_STATES = (FINISHED, FAILED, CANCELLED, SKIPPED)
+
+
+class DownloadCancelled(Exception):
+    pass
+
+
+class AlreadyDownloaded(Exception):
+    pass
+
+
+def host_of(url):
+    host = urlparse(url if '//' in url else '//' + url).hostname or ''
+    return host[4:] if host.startswith('www.') else host
+
+
+class DownloadJob:
+    _ids = itertools.count(1)
+
+    def __init__(self, url, quality, on_progress=None, on_done=None, uid=None, priority=0):
+        self.id = next(self._ids)
+        self.uid = uid or uuid.uuid4().hex
+        self.url = url
+        self.quality = quality
+        self.host = host_of(url)
+        self.priority = priority
+        self.created = time.time()
+        self.title = None
+        self.playlist = None
+        self.download_path = None
+        self.on_progress = on_progress
+        self.on_done = on_done
+
+        self.state = QUEUED
+        self.progress = 0.0
+        self.downloaded_bytes = 0
+        self.total_bytes = 0
+        self.speed = 0
+        self.eta = None
+        self.filename = None
+        self.files = set()
+        self.error = None
+        self.warnings = []
+        self.keep_partial = None
+        # Failed attempts per error kind, and when the next one may start
+        self.attempts = Counter()
+        self.retry_at = None
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self.state in DONE_STATES
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def cancel(self, keep_partial=None):
+        self.keep_partial = keep_partial
+        self._cancel.set()
+
+    def check_cancelled(self, d=None):
+        if self._cancel.is_set():
+            raise DownloadCancelled(f"Download {self.id} cancelled")
+
+    def update(self, d):
+        self.check_cancelled()
+
+        for key in ('filename', 'tmpfilename'):
+            if d.get(key):
+                self.files.add(d[key])
+        if self.title is None and d.get('info_dict'):
+            self.title = d['info_dict'].get('title')
+
+        if d['status'] == 'downloading':
+            self.downloaded_bytes = d.get('downloaded_bytes') or 0
+            self.total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+            self.speed = d.get('speed') or 0
+            self.eta = d.get('eta')
+            if self.total_bytes:
+                self.progress = self.downloaded_bytes / self.total_bytes * 100
+        elif d['status'] == 'finished':
+            self.progress = 100.0
+            self.filename = d.get('filename', self.filename)
+
+        if self.on_progress:
+            self.on_progress(self)
+
+    def __repr__(self):
+        return f"<DownloadJob {self.id} {self.state} {self.url}>"
+
+
+class DownloadQueue:
+    # run_job may return a callable to finish the job off the network: the
+    # worker and host slot are freed right away and the callable runs on a
+    # separate CPU-sized pool, so transfers and post-processing overlap.
+    # A failure the retry policy allows goes back in the queue with a
+    # not-before time instead of holding a worker while it backs off, and
+    # hosts whose circuit breaker is open are passed over. The finishing
+    # callable is called even for a job cancelled while it waited, so it can
+    # free what the download holds; it raises DownloadCancelled then.
+    def __init__(self, run_job, max_workers=3, per_host_limit=2, on_finish=None,
+                 postprocess_workers=None, retry_policy=None, breaker=None, on_retry=None):
+        self.run_job = run_job
+        self.on_finish = on_finish
+        self.retry_policy = retry_policy
+        self.breaker = breaker
+        self.on_retry = on_retry
+        self.max_workers = max(1, max_workers)
+        self.per_host_limit = max(1, per_host_limit)
+        self.postprocess_workers = max(1, postprocess_workers or os.cpu_count() or 1)
+        self.jobs = {}
+
+        self._pending = []
+        self._active_hosts = Counter()
+        self._workers = set()
+        self._idle = 0
+        self._finishing = deque()
+        self._postprocessors = set()
+        self._postprocess_idle = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def submit(self, job):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Download queue is shut down")
+            self.jobs[job.id] = job
+            self._enqueue(job)
+            self._spawn_workers()
+            self._cond.notify_all()
+        return job
+
+    def set_priority(self, job, priority):
+        with self._cond:
+            job.priority = priority
+            if job in self._pending:
+                self._pending.remove(job)
+                self._enqueue(job)
+
+    def cancel(self, job, keep_partial=None):
+        job.cancel(keep_partial)
+        with self._cond:
+            if job not in self._pending:
+                return
+            self._pending.remove(job)
+            self.jobs.pop(job.id, None)
+        self._finish(job, CANCELLED)
+
+    def cancel_all(self, keep_partial=None):
+        for job in self.active_jobs():
+            self.cancel(job, keep_partial)
+
+    def set_limits(self, max_workers=None, per_host_limit=None, postprocess_workers=None):
+        with self._cond:
+            if max_workers is not None:
+                self.max_workers = max(1, max_workers)
+            if per_host_limit is not None:
+                self.per_host_limit = max(1, per_host_limit)
+            if postprocess_workers is not None:
+                # Extra running post-processing workers exit as they go idle
+                self.postprocess_workers = max(1, postprocess_workers)
+            self._spawn_workers()
+            self._cond.notify_all()
+
+    def counts(self):
+        with self._cond:
+            return len(self.jobs) - len(self._pending), len(self._pending)
+
+    def active_jobs(self):
+        with self._cond:
+            return list(self.jobs.values())
+
+    def shutdown(self, wait=False):
+        with self._cond:
+            self._closed = True
+            self._pending.clear()
+            self._cond.notify_all()
+            workers = list(self._workers | self._postprocessors)
+        if wait:
+            for worker in workers:
+                worker.join()
+
+    def _enqueue(self, job):
+        # Highest priority first, FIFO within a priority
+        index = len(self._pending)
+        while index and self._pending[index - 1].priority < job.priority:
+            index -= 1
+        self._pending.insert(index, job)
+
+    def _spawn_workers(self):
+        while len(self._workers) < self.max_workers and self._idle < len(self._pending):
+            worker = threading.Thread(target=self._work, daemon=True,
+                                      name=f"download-worker-{len(self._workers) + 1}")
+            self._workers.add(worker)
+            self._idle += 1
+            worker.start()
+
+    def _take(self):
+        # Called with the lock held; returns None when the worker should exit
+        while True:
+            if self._closed or len(self._workers) > self.max_workers:
+                self._idle -= 1
+                self._workers.discard(threading.current_thread())
+                return None
+
+            now = time.monotonic()
+            wake = None
+            for i, job in enumerate(self._pending):
+                if self._active_hosts[job.host] >= self.per_host_limit:
+                    continue
+                if job.retry_at is not None and job.retry_at > now:
+                    wake = min(wake or job.retry_at, job.retry_at)
+                    continue
+                if self.breaker is not None and not self.breaker.allow(job.host, now):
+                    reopens = self.breaker.reopens_at(job.host)
+                    if reopens is not None:
+                        wake = min(wake or reopens, reopens)
+                    continue
+                del self._pending[i]
+                self._idle -= 1
+                self._active_hosts[job.host] += 1
+                job.state = RUNNING
+                job.retry_at = None
+                job.error = None
+                return job
+
+            self._cond.wait(None if wake is None else max(0.0, wake - now))
+
+    def _work(self):
+        while True:
+            with self._cond:
+                job = self._take()
+            if job is None:
+                return
+
+            try:
+                state, finish = self._run(job, self.run_job)
+            finally:
+                with self._cond:
+                    self._active_hosts[job.host] -= 1
+                    self._idle += 1
+                    self._cond.notify_all()
+
+            if self.breaker is not None:
+                if state == FINISHED:
+                    self.breaker.success(job.host)
+                elif state == FAILED:
+                    self.breaker.failure(job.host, classify(job.error))
+                else:
+                    self.breaker.release(job.host)
+
+            if state == FINISHED and callable(finish):
+                self._postprocess(job, finish)
+            else:
+                self._settle(job, state)
+
+    def _run(self, job, func, check_cancelled=True):
+        try:
+            if check_cancelled:
+                job.check_cancelled()
+            return FINISHED, func(job)
+        except DownloadCancelled:
+            return CANCELLED, None
+        except AlreadyDownloaded:
+            return SKIPPED, None
+        except Exception as e:
+            job.error = e
+            return (CANCELLED if job.cancelled else FAILED), None
+
+    def _postprocess(self, job, finish):
+        with self._cond:
+            job.state = POSTPROCESSING
+            self._finishing.append((job, finish))
+            if not self._postprocess_idle and len(self._postprocessors) < self.postprocess_workers:
+                worker = threading.Thread(target=self._postprocess_work, daemon=True,
+                                          name=f"postprocess-worker-{len(self._postprocessors) + 1}")
+                self._postprocessors.add(worker)
+                worker.start()
+            self._cond.notify_all()
+
+    def _postprocess_work(self):
+        while True:
+            with self._cond:
+                # Jobs already handed over are still finished after shutdown
+                while not self._finishing and not self._closed:
+                    if len(self._postprocessors) > self.postprocess_workers:
+                        break
+                    self._postprocess_idle += 1
+                    self._cond.wait()
+                    self._postprocess_idle -= 1
+                if not self._finishing:
+                    self._postprocessors.discard(threading.current_thread())
+                    return
+                job, finish = self._finishing.popleft()
+
+            state, _ = self._run(job, lambda job: finish(), check_cancelled=False)
+            self._settle(job, state)
+
+    def _settle(self, job, state):
+        if state != FAILED or self.retry_policy is None or job.cancelled:
+            self._complete(job, state)
+            return
+        kind = classify(job.error)
+        job.attempts[kind] += 1
+        delay = self.retry_policy.delay(kind, job.attempts[kind])
+        if delay is None:
+            self._complete(job, state)
+            return
+
+        with self._cond:
+            if self._closed:
+                # Left as it is, so a journal replay picks it up next time
+                return
+            job.state = QUEUED
+            job.retry_at = time.monotonic() + delay
+            self._enqueue(job)
+            self._spawn_workers()
+            self._cond.notify_all()
+        if self.on_retry:
+            try:
+                self.on_retry(job, kind, delay)
+            except Exception:
+                pass
+
+    def _complete(self, job, state):
+        with self._cond:
+            self.jobs.pop(job.id, None)
+        self._finish(job, state)
+
+    def _finish(self, job, state):
+        if state == CANCELLED:
+            job.error = None
+        job.state = state
+        try:
+            if self.on_finish:
+                self.on_finish(job)
+            if job.on_done:
+                job.on_done(job)
+        except Exception:
+            pass
+        finally:
+            job._done.set()
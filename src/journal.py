@@ -0,0 +1,135 @@
+import json
+import os
+import sys
+import threading
+import time
+from .jobs import DONE_STATES
+
+if sys.platform == 'win32':
+    import msvcrt
+else:
+    import fcntl
+
+QUEUED_EVENT = 'queued'
+RUNNING_EVENT = 'running'
+PROGRESS_EVENT = 'progress'
+
+
+def _try_lock(f):
+    try:
+        if sys.platform == 'win32':
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+class JobJournal:
+    # Append-only JSON lines. Only one process owns the journal at a time;
+    # other instances run without one rather than replaying foreign jobs.
+    def __init__(self, path, progress_interval=5.0):
+        self.path = path
+        self.progress_interval = progress_interval
+        self.enabled = True
+        self._file = None
+        self._lock_file = None
+        self._last_progress = {}
+        self._lock = threading.Lock()
+
+    def _open(self):
+        if self._file is None and self.enabled:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._lock_file = open(self.path + '.lock', 'a+')
+            if not _try_lock(self._lock_file):
+                self._lock_file.close()
+                self._lock_file = None
+                self.enabled = False
+                return None
+            self._file = open(self.path, 'a', encoding='utf-8')
+        return self._file
+
+    def _write(self, record, sync=False):
+        with self._lock:
+            f = self._open()
+            if f is None:
+                return
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            if sync:
+                os.fsync(f.fileno())
+
+    def queued(self, job, kind='video'):
+        self._write({'event': QUEUED_EVENT, 'uid': job.uid, 'time': time.time(), 'kind': kind,
+                     'url': job.url, 'quality': job.quality, 'priority': job.priority,
+                     'download_path': job.download_path,
+                     'playlist': job.playlist.uid if job.playlist else None}, sync=True)
+
+    def running(self, job):
+        self._write({'event': RUNNING_EVENT, 'uid': job.uid, 'time': time.time()}, sync=True)
+
+    def progress(self, job):
+        now = time.monotonic()
+        if now - self._last_progress.get(job.uid, 0) < self.progress_interval:
+            return
+        self._last_progress[job.uid] = now
+        self._write({'event': PROGRESS_EVENT, 'uid': job.uid, 'time': time.time(),
+                     'downloaded_bytes': job.downloaded_bytes, 'total_bytes': job.total_bytes,
+                     'files': sorted(job.files)})
+
+    def finished(self, job):
+        self._last_progress.pop(job.uid, None)
+        self._write({'event': job.state, 'uid': job.uid, 'time': time.time(),
+                     'error': str(job.error) if job.error else None}, sync=True)
+
+    def replay(self):
+        jobs = {}
+        with self._lock:
+            if self._open() is None or not os.path.exists(self.path):
+                return []
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash
+                        continue
+                    uid = record.get('uid')
+                    if record['event'] == QUEUED_EVENT:
+                        jobs[uid] = record
+                    elif uid not in jobs:
+                        continue
+                    elif record['event'] in DONE_STATES:
+                        del jobs[uid]
+                    elif record['event'] == PROGRESS_EVENT:
+                        jobs[uid].update(downloaded_bytes=record['downloaded_bytes'],
+                                         total_bytes=record['total_bytes'],
+                                         files=record['files'])
+
+            # Entries of an unfinished playlist are re-listed when it is expanded again
+            records = [r for r in jobs.values() if r.get('playlist') not in jobs]
+            self._compact(records)
+        return records
+
+    def _compact(self, records):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._file.close()
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def close(self):
+        with self._lock:
+            self.enabled = False
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
@@ -0,0 +1,322 @@
+import http.server
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+EXTRACT = 'extract'
+TRANSFER = 'transfer'
+MERGE = 'merge'
+POSTPROCESS = 'postprocess'
+STAGES = (EXTRACT, TRANSFER, MERGE, POSTPROCESS)
+
+# Postprocessor keys as yt-dlp reports them in postprocessor hooks
+MERGE_KEYS = ('Merger', 'FFmpegMerger')
+
+STAGE_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+class JobMetrics:
+    # Filled in from the job's own hooks, so it is only ever written by the
+    # worker thread running the job; readers get copies from as_dict()
+    def __init__(self, job):
+        self.job_id = job.id
+        self.uid = job.uid
+        self.url = job.url
+        self.host = job.host
+        self.quality = job.quality
+        self.state = job.state
+        self.error = None
+        self.queued_at = job.created
+        self.started_at = None
+        self.finished_at = None
+        self.cached_info = False
+        self.plan = None
+
+        self.stages = dict.fromkeys(STAGES, 0.0)
+        self.postprocessors = {}
+        self.bytes = 0
+        self.peak_speed = 0.0
+        self.retries = 0
+        # Attempts the queue made at the whole job, this one included
+        self.attempts = sum(job.attempts.values()) + 1
+        self.fragments = 0
+        self.postprocess_wait = 0.0
+
+        self._streams = {}
+        self._open_stages = {}
+        self._transfer_started = {}
+        self._pp_started = {}
+
+    def start(self):
+        self.started_at = time.time()
+
+    @contextmanager
+    def stage(self, name):
+        start = self._open_stages[name] = time.monotonic()
+        try:
+            yield
+        finally:
+            del self._open_stages[name]
+            self.stages[name] += time.monotonic() - start
+
+    def on_progress(self, d):
+        stream = d.get('filename')
+        now = time.monotonic()
+        if d['status'] == 'downloading':
+            self._transfer_started.setdefault(stream, now)
+            self._streams[stream] = max(self._streams.get(stream, 0), d.get('downloaded_bytes') or 0)
+            self.peak_speed = max(self.peak_speed, d.get('speed') or 0)
+            if d.get('fragment_index') is not None:
+                self.fragments = max(self.fragments, d['fragment_index'])
+        elif d['status'] == 'finished':
+            self._streams[stream] = (d.get('total_bytes') or d.get('downloaded_bytes')
+                                     or self._streams.get(stream, 0))
+            started = self._transfer_started.pop(stream, None)
+            if started is not None:
+                self.stages[TRANSFER] += now - started
+        self.bytes = sum(self._streams.values())
+
+    def on_postprocess(self, d):
+        key = d.get('postprocessor') or 'unknown'
+        now = time.monotonic()
+        if d['status'] == 'started':
+            self._pp_started[key] = now
+        elif d['status'] == 'finished':
+            started = self._pp_started.pop(key, None)
+            if started is None:
+                return
+            self.postprocessors[key] = self.postprocessors.get(key, 0.0) + now - started
+            self.stages[MERGE if key in MERGE_KEYS else POSTPROCESS] += now - started
+
+    def retry(self, kind, attempt):
+        self.retries += 1
+
+    def finish(self, state, error=None):
+        now = time.monotonic()
+        # Close stages a failure or cancel left open
+        for started in self._transfer_started.values():
+            self.stages[TRANSFER] += now - started
+        self._transfer_started.clear()
+        self.state = state
+        self.error = str(error) if error else None
+        self.finished_at = time.time()
+
+    def as_dict(self):
+        end = self.finished_at or time.time()
+        # Count the running part of unfinished stages, for snapshots of active jobs
+        now = time.monotonic()
+        stages = dict(self.stages)
+        for name, started in list(self._open_stages.items()):
+            stages[name] += now - started
+        for started in list(self._transfer_started.values()):
+            stages[TRANSFER] += now - started
+        transfer = stages[TRANSFER]
+        return {
+            'job': self.job_id, 'uid': self.uid, 'url': self.url, 'host': self.host,
+            'quality': self.quality, 'state': self.state, 'error': self.error,
+            'queue_wait': round((self.started_at or end) - self.queued_at, 4),
+            'total': round(end - (self.started_at or end), 4),
+            'postprocess_wait': round(self.postprocess_wait, 4),
+            'stages': {name: round(seconds, 4) for name, seconds in stages.items()},
+            'postprocessors': {key: round(seconds, 4) for key, seconds in list(self.postprocessors.items())},
+            'cached_info': self.cached_info,
+            'plan': self.plan,
+            'bytes': self.bytes,
+            'avg_speed': round(self.bytes / transfer, 1) if transfer else None,
+            'peak_speed': round(self.peak_speed, 1),
+            'retries': self.retries,
+            'attempts': self.attempts,
+            'fragments': self.fragments,
+        }
+
+
+class MetricsRecorder:
+    # Sinks get a dict per finished job through record() and are closed with
+    # the recorder. A failing sink never affects the download.
+    def __init__(self, sinks=()):
+        self.sinks = list(sinks)
+        self._active = {}
+        self._totals = self._empty_totals()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _empty_totals():
+        return {
+            'jobs': {},
+            'bytes': 0,
+            'retries': 0,
+            'stage_seconds': dict.fromkeys(STAGES, 0.0),
+            'stage_buckets': {stage: [0] * (len(STAGE_BUCKETS) + 1) for stage in STAGES},
+            'stage_count': 0,
+            'queue_wait_seconds': 0.0,
+        }
+
+    def add_sink(self, sink):
+        with self._lock:
+            self.sinks.append(sink)
+        return sink
+
+    def begin(self, job):
+        metrics = JobMetrics(job)
+        metrics.start()
+        with self._lock:
+            self._active[job.id] = metrics
+        return metrics
+
+    def finish(self, job):
+        with self._lock:
+            metrics = self._active.pop(job.id, None)
+        if metrics is None:
+            # Cancelled before it ever ran
+            metrics = JobMetrics(job)
+        metrics.finish(job.state, job.error)
+        record = metrics.as_dict()
+
+        with self._lock:
+            totals = self._totals
+            totals['jobs'][record['state']] = totals['jobs'].get(record['state'], 0) + 1
+            totals['bytes'] += record['bytes']
+            totals['retries'] += record['retries']
+            totals['queue_wait_seconds'] += record['queue_wait']
+            if metrics.started_at is not None:
+                totals['stage_count'] += 1
+                for stage, seconds in metrics.stages.items():
+                    totals['stage_seconds'][stage] += seconds
+                    buckets = totals['stage_buckets'][stage]
+                    buckets[next((i for i, b in enumerate(STAGE_BUCKETS) if seconds <= b),
+                                 len(STAGE_BUCKETS))] += 1
+            sinks = list(self.sinks)
+
+        for sink in sinks:
+            try:
+                sink.record(record)
+            except Exception:
+                pass
+        return record
+
+    def snapshot(self):
+        with self._lock:
+            active = [m.as_dict() for m in self._active.values()]
+            totals = json.loads(json.dumps(self._totals))
+        return {'time': time.time(), 'active': active, 'totals': totals}
+
+    def reset(self):
+        with self._lock:
+            self._totals = self._empty_totals()
+
+    def close(self):
+        with self._lock:
+            sinks, self.sinks = self.sinks, []
+        for sink in sinks:
+            try:
+                sink.close()
+            except Exception:
+                pass
+
+
+class JsonLogSink:
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def record(self, record):
+        line = json.dumps(record)
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def prometheus_text(snapshot, gauges=None):
+    totals = snapshot['totals']
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP ytdlp_gui_{name} {help_text}")
+        lines.append(f"# TYPE ytdlp_gui_{name} {kind}")
+        for labels, value in samples:
+            label_text = ','.join(f'{k}="{v}"' for k, v in labels.items())
+            lines.append(f"ytdlp_gui_{name}{{{label_text}}} {value}" if label_text
+                         else f"ytdlp_gui_{name} {value}")
+
+    metric('jobs_total', 'counter', "Jobs finished, by final state.",
+           [({'state': state}, count) for state, count in sorted(totals['jobs'].items())])
+    metric('downloaded_bytes_total', 'counter', "Bytes transferred by finished jobs.",
+           [({}, totals['bytes'])])
+    metric('retries_total', 'counter', "Retries reported by yt-dlp.", [({}, totals['retries'])])
+    metric('queue_wait_seconds_total', 'counter', "Time finished jobs spent queued.",
+           [({}, round(totals['queue_wait_seconds'], 4))])
+
+    lines.append("# HELP ytdlp_gui_stage_seconds Time per job spent in each stage.")
+    lines.append("# TYPE ytdlp_gui_stage_seconds histogram")
+    for stage in STAGES:
+        cumulative = 0
+        for bound, count in zip(STAGE_BUCKETS + ('+Inf',), totals['stage_buckets'][stage]):
+            cumulative += count
+            lines.append(f'ytdlp_gui_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'ytdlp_gui_stage_seconds_sum{{stage="{stage}"}} '
+                     f'{round(totals["stage_seconds"][stage], 4)}')
+        lines.append(f'ytdlp_gui_stage_seconds_count{{stage="{stage}"}} {totals["stage_count"]}')
+
+    active = snapshot['active']
+    metric('active_jobs', 'gauge', "Jobs currently running.", [({}, len(active))])
+    metric('active_bytes', 'gauge', "Bytes transferred so far by running jobs.",
+           [({}, sum(m['bytes'] for m in active))])
+    for name, (help_text, value) in (gauges or {}).items():
+        metric(name, 'gauge', help_text, [({}, value)])
+    return "\n".join(lines) + "\n"
+
+
+class PrometheusExporter:
+    # Text exposition format on 127.0.0.1 only; `gauges` returns extra
+    # {name: (help, value)} read at scrape time, e.g. the queue length
+    def __init__(self, recorder, port=9464, host='127.0.0.1', gauges=None):
+        self.recorder = recorder
+        self.gauges = gauges
+        exporter = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True,
+                                        name="metrics-exporter")
+        self._thread.start()
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def render(self):
+        return prometheus_text(self.recorder.snapshot(), self.gauges() if self.gauges else None)
+
+    def record(self, record):
+        pass
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
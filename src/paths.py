@@ -0,0 +1,26 @@
+import os
+import sys
+
+APP_NAME = "yt-dlp-gui"
+
+
+def _user_dir(env, windows_env, mac_dir, fallback):
+    if sys.platform == 'win32':
+        base = os.environ.get(windows_env) or os.path.expanduser("~/AppData/Local")
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser(mac_dir)
+    else:
+        base = os.environ.get(env) or os.path.expanduser(fallback)
+    return os.path.join(base, APP_NAME)
+
+
+def cache_dir():
+    return _user_dir('XDG_CACHE_HOME', 'LOCALAPPDATA', "~/Library/Caches", "~/.cache")
+
+
+def config_dir():
+    return _user_dir('XDG_CONFIG_HOME', 'APPDATA', "~/Library/Application Support", "~/.config")
+
+
+def data_dir():
+    return _user_dir('XDG_DATA_HOME', 'LOCALAPPDATA', "~/Library/Application Support", "~/.local/share")
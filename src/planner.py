@@ -0,0 +1,160 @@
+CODEC_FAMILIES = {
+    'avc1': 'h264', 'avc3': 'h264', 'h264': 'h264',
+    'hev1': 'h265', 'hvc1': 'h265', 'hevc': 'h265', 'h265': 'h265',
+    'av01': 'av1', 'av1': 'av1',
+    'vp09': 'vp9', 'vp9': 'vp9', 'vp8': 'vp8',
+    'mp4a': 'aac', 'aac': 'aac',
+    'mp3': 'mp3', 'opus': 'opus', 'vorbis': 'vorbis', 'flac': 'flac',
+    'ac-3': 'ac3', 'ac3': 'ac3', 'ec-3': 'eac3', 'eac3': 'eac3',
+}
+
+# Codecs each container takes as a plain stream copy
+CONTAINERS = {
+    'mp4': ({'h264', 'h265', 'av1'}, {'aac', 'mp3', 'ac3', 'eac3'}),
+    'webm': ({'vp8', 'vp9', 'av1'}, {'opus', 'vorbis'}),
+}
+FALLBACK_CONTAINER = 'mkv'
+
+# FFmpegExtractAudio codec name -> (codec family, file extension)
+AUDIO_TARGETS = {
+    'm4a': ('aac', 'm4a'),
+    'aac': ('aac', 'm4a'),
+    'mp3': ('mp3', 'mp3'),
+    'opus': ('opus', 'opus'),
+    'vorbis': ('vorbis', 'ogg'),
+    'flac': ('flac', 'flac'),
+}
+LOSSLESS = ('flac',)
+
+
+def codec_family(codec):
+    if not codec or codec == 'none':
+        return codec
+    return CODEC_FAMILIES.get(codec.lower().split('.')[0], codec.lower())
+
+
+def has_video(f):
+    return f.get('vcodec') not in (None, 'none')
+
+
+def has_audio(f):
+    return f.get('acodec') not in (None, 'none')
+
+
+def usable(f):
+    return f.get('format_id') is not None and not f.get('has_drm') and f.get('ext') != 'mhtml'
+
+
+def bitrate(f, key='tbr'):
+    return f.get(key) or f.get('tbr') or 0
+
+
+class FormatPlan:
+    def __init__(self, format_spec, merge_format=None, postprocessors=(), notes=(), transcode=False):
+        self.format_spec = format_spec
+        self.merge_format = merge_format
+        self.postprocessors = list(postprocessors)
+        self.notes = list(notes)
+        self.transcode = transcode
+
+    def apply(self, opts):
+        opts = dict(opts, format=self.format_spec, postprocessors=self.postprocessors)
+        if self.merge_format:
+            opts['merge_output_format'] = self.merge_format
+        return opts
+
+    def as_dict(self):
+        return {'format': self.format_spec, 'merge_format': self.merge_format,
+                'postprocessors': [pp['key'] for pp in self.postprocessors],
+                'transcode': self.transcode, 'notes': self.notes}
+
+    def __repr__(self):
+        return f"<FormatPlan {self.format_spec} {[pp['key'] for pp in self.postprocessors]}>"
+
+
+def plan_download(info, max_height=None, audio_only=False, container='mp4', audio_codec='m4a',
+                  audio_quality=None):
+    # Returns None when the extractor gave too little codec information to
+    # plan with; the caller then falls back to its format presets
+    formats = [f for f in info.get('formats') or [] if usable(f)]
+    if not formats:
+        return None
+    if audio_only:
+        return plan_audio(formats, audio_codec, audio_quality)
+    return plan_video(formats, max_height, container)
+
+
+def plan_video(formats, max_height=None, container='mp4'):
+    videos = [f for f in formats if has_video(f)
+              and (max_height is None or (f.get('height') or 0) <= max_height)]
+    audios = [f for f in formats if has_audio(f) and not has_video(f)]
+    if not videos or any(f.get('height') is None for f in videos):
+        return None
+
+    video_codecs, audio_codecs = CONTAINERS.get(container, (set(), set()))
+
+    def fits(f):
+        return (codec_family(f['vcodec']) in video_codecs
+                and (not has_audio(f) or codec_family(f['acodec']) in audio_codecs))
+
+    # What the container takes as is, as the presets' [ext=mp4] did; then
+    # resolution, bitrate, and a muxed stream over a merge when all else is equal
+    video = max(videos, key=lambda f: (fits(f), f['height'], bitrate(f), has_audio(f)))
+    notes = []
+
+    if has_audio(video) or not audios:
+        if not has_audio(video):
+            notes.append("no audio stream available")
+        postprocessors = []
+        if video.get('ext') != container and fits(video):
+            # Same codecs, other container: a remux is a stream copy
+            postprocessors.append({'key': 'FFmpegVideoRemuxer', 'preferedformat': container})
+        elif video.get('ext') != container:
+            notes.append(f"kept as {video.get('ext')}: {video['vcodec']} does not fit {container} "
+                         "without re-encoding")
+        return FormatPlan(video['format_id'], postprocessors=postprocessors, notes=notes)
+
+    audio = max(audios, key=lambda f: (codec_family(f['acodec']) in audio_codecs, bitrate(f, 'abr')))
+    merge_format = container
+    if not (fits(video) and codec_family(audio['acodec']) in audio_codecs):
+        merge_format = next((name for name, (v, a) in CONTAINERS.items()
+                             if codec_family(video['vcodec']) in v
+                             and codec_family(audio['acodec']) in a), FALLBACK_CONTAINER)
+        notes.append(f"merged into {merge_format}: {video['vcodec']} + {audio['acodec']} "
+                     f"does not fit {container} without re-encoding")
+    return FormatPlan(f"{video['format_id']}+{audio['format_id']}", merge_format=merge_format,
+                      notes=notes)
+
+
+def plan_audio(formats, codec='m4a', quality=None):
+    audios = [f for f in formats if has_audio(f) and not has_video(f)]
+    # Audio can still be copied out of a muxed stream
+    candidates = audios or [f for f in formats if has_audio(f)]
+    if not candidates:
+        return None
+
+    if codec in (None, 'best'):
+        audio = max(candidates, key=lambda f: bitrate(f, 'abr'))
+        postprocessors = [] if not has_video(audio) else [
+            {'key': 'FFmpegExtractAudio', 'preferredcodec': 'best'}]
+        return FormatPlan(audio['format_id'], postprocessors=postprocessors)
+
+    family, ext = AUDIO_TARGETS[codec]
+    matching = [f for f in candidates if codec_family(f['acodec']) == family]
+    if matching:
+        audio = max(matching, key=lambda f: (not has_video(f), bitrate(f, 'abr')))
+        postprocessors = []
+        if audio.get('ext') != ext or has_video(audio):
+            # Right codec, wrong container: FFmpegExtractAudio copies the stream
+            postprocessors.append({'key': 'FFmpegExtractAudio', 'preferredcodec': codec})
+        return FormatPlan(audio['format_id'], postprocessors=postprocessors)
+
+    # Nothing to copy: encode from the best source, lossless ones first
+    audio = max(candidates, key=lambda f: (codec_family(f['acodec']) in LOSSLESS,
+                                           not has_video(f), bitrate(f, 'abr')))
+    postprocessor = {'key': 'FFmpegExtractAudio', 'preferredcodec': codec}
+    if quality:
+        postprocessor['preferredquality'] = str(quality)
+    note = f"no {codec} stream available; re-encoding {audio['acodec']} to {codec}"
+    return FormatPlan(audio['format_id'], postprocessors=[postprocessor], notes=[note],
+                      transcode=codec not in LOSSLESS)
@@ -0,0 +1,135 @@
+import threading
+import uuid
+from .jobs import CANCELLED, DONE_STATES, FAILED, FINISHED, DownloadJob
+
+EXPANDING = 'expanding'
+
+PLAYLIST_TYPES = ('playlist', 'multi_video')
+REDIRECT_TYPES = ('url', 'url_transparent')
+# Extractors whose flat entries are themselves playlists (e.g. channel tabs)
+NESTED_IES = ('YoutubeTab',)
+
+
+def iter_playlist_entries(ydl, url, ie_key=None, depth=3):
+    # process=False leaves `entries` as the extractor's lazy generator, so the
+    # listing is paged in only as fast as entries are consumed
+    info = ydl.extract_info(url, ie_key=ie_key, download=False, process=False)
+    for _ in range(depth):
+        if info.get('_type') not in REDIRECT_TYPES:
+            break
+        info = ydl.extract_info(info['url'], ie_key=info.get('ie_key'), download=False, process=False)
+
+    if info.get('_type') not in PLAYLIST_TYPES:
+        yield info
+        return
+
+    for entry in info.get('entries') or []:
+        if not entry:
+            continue
+        entry_url = entry.get('webpage_url') or entry.get('url')
+        nested = entry.get('_type') in PLAYLIST_TYPES or entry.get('ie_key') in NESTED_IES
+        if nested and depth > 0:
+            yield from iter_playlist_entries(ydl, entry_url, entry.get('ie_key'), depth - 1)
+        elif entry_url:
+            yield entry
+
+
+class PlaylistJob:
+    def __init__(self, url, quality, on_progress=None, on_done=None, on_entry=None,
+                 on_complete=None, window=6, uid=None, priority=0):
+        self.id = next(DownloadJob._ids)
+        self.uid = uid or uuid.uuid4().hex
+        self.url = url
+        self.quality = quality
+        self.priority = priority
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.on_entry = on_entry
+        self.on_complete = on_complete
+        self.playlist = None
+        self.download_path = None
+
+        self.state = EXPANDING
+        self.count = 0
+        self.skipped = 0
+        self.error = None
+        self.keep_partial = None
+        self._entries = set()
+        self._slots = threading.BoundedSemaphore(window)
+        self._expanded = False
+        self._cancel = threading.Event()
+        self._cond = threading.Condition()
+
+    @property
+    def done(self):
+        return self.state in DONE_STATES
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self, keep_partial=None):
+        self.keep_partial = keep_partial
+        self._cancel.set()
+        with self._cond:
+            entries = list(self._entries)
+        for job in entries:
+            job.cancel(keep_partial)
+        return entries
+
+    def entries(self):
+        with self._cond:
+            return list(self._entries)
+
+    def wait(self, timeout=None):
+        with self._cond:
+            return self._cond.wait_for(lambda: self.done, timeout)
+
+    def new_entry(self, entry_url):
+        # Blocks while `window` entries are still in flight
+        while not self._slots.acquire(timeout=0.5):
+            if self.cancelled:
+                return None
+        if self.cancelled:
+            self._slots.release()
+            return None
+
+        job = DownloadJob(entry_url, self.quality, self.on_progress, self._entry_done,
+                          priority=self.priority)
+        job.playlist = self
+        job.download_path = self.download_path
+        with self._cond:
+            self._entries.add(job)
+            self.count += 1
+        return job
+
+    def expanded(self, error=None):
+        with self._cond:
+            self._expanded = True
+            self.error = error
+        self._check_complete()
+
+    def _entry_done(self, job):
+        with self._cond:
+            self._entries.discard(job)
+        self._slots.release()
+        if self.on_done:
+            self.on_done(job)
+        self._check_complete()
+
+    def _check_complete(self):
+        with self._cond:
+            if self.done or not self._expanded or self._entries:
+                return
+            if self.cancelled:
+                self.state = CANCELLED
+            elif self.error:
+                self.state = FAILED
+            else:
+                self.state = FINISHED
+            self._cond.notify_all()
+        if self.on_complete:
+            self.on_complete(self)
+
+    def __repr__(self):
+        return f"<PlaylistJob {self.id} {self.state} {self.count} entries {self.url}>"
@@ -0,0 +1,155 @@
+import re
+import threading
+from collections import OrderedDict, deque
+from .cache import cache_key
+
+URL_RE = re.compile(r'^https?://\S+$')
+
+
+def looks_like_url(text):
+    return bool(text) and URL_RE.match(text.strip()) is not None
+
+
+def plan_size(info, plan):
+    # Sum of the planned streams, from sizes or bitrate times duration
+    formats = {f.get('format_id'): f for f in info.get('formats') or []}
+    total = 0
+    for format_id in plan.format_spec.split('+'):
+        f = formats.get(format_id)
+        if f is None:
+            return None
+        size = f.get('filesize') or f.get('filesize_approx')
+        if not size and f.get('tbr') and info.get('duration'):
+            size = f['tbr'] * 1000 / 8 * info['duration']
+        if not size:
+            return None
+        total += size
+    return int(total)
+
+
+class Preview:
+    def __init__(self, url, info=None, error=None):
+        self.url = url
+        self.error = error
+        self.title = info.get('title') if info else None
+        self.duration = info.get('duration') if info else None
+        self.sizes = {}
+        self.plans = {}
+        self.recommended = None
+
+    def __repr__(self):
+        return f"<Preview {self.title or self.url} {self.sizes}>"
+
+
+class Prefetcher:
+    # Resolves metadata for URLs the user is likely to download next, newest
+    # request first. `extract` is expected to leave its result in the info
+    # cache, so the download that follows starts with the transfer.
+    def __init__(self, extract, plan, qualities, workers=2, max_previews=256):
+        self.extract = extract
+        self.plan = plan
+        self.qualities = list(qualities)
+        self.workers = workers
+        self.max_previews = max_previews
+        self._previews = OrderedDict()
+        self._pending = deque()
+        self._waiting = {}
+        self._threads = 0
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def request(self, url, on_ready=None):
+        url = url.strip()
+        key = cache_key(url)
+        with self._lock:
+            preview = self._previews.get(key)
+            if preview is None:
+                waiting = self._waiting.get(key)
+                if waiting is None:
+                    waiting = self._waiting[key] = (threading.Event(), [])
+                    self._pending.append((key, url))
+                    self._spawn()
+                elif (key, url) in self._pending:
+                    # Asked for again: move it to the front
+                    self._pending.remove((key, url))
+                    self._pending.append((key, url))
+                if on_ready:
+                    waiting[1].append(on_ready)
+                return None
+            self._previews.move_to_end(key)
+        if on_ready:
+            on_ready(preview)
+        return preview
+
+    def get(self, url):
+        with self._lock:
+            return self._previews.get(cache_key(url.strip()))
+
+    def wait(self, url, timeout=None):
+        # Lets a download join an extraction already in flight rather than start its own
+        with self._lock:
+            waiting = self._waiting.get(cache_key(url.strip()))
+        if waiting is not None:
+            waiting[0].wait(timeout)
+        return self.get(url)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._pending.clear()
+            waiting, self._waiting = list(self._waiting.values()), {}
+        for event, callbacks in waiting:
+            event.set()
+
+    def _spawn(self):
+        # Called with the lock held
+        if self._threads < self.workers and not self._closed:
+            self._threads += 1
+            threading.Thread(target=self._work, daemon=True, name=f"prefetch-{self._threads}").start()
+
+    def _work(self):
+        while True:
+            with self._lock:
+                if not self._pending or self._closed:
+                    self._threads -= 1
+                    return
+                key, url = self._pending.pop()
+
+            preview = self._resolve(url)
+            with self._lock:
+                # Failures are reported but not kept, so the next request tries again
+                if preview.error is None:
+                    self._previews[key] = preview
+                    while len(self._previews) > self.max_previews:
+                        self._previews.popitem(last=False)
+                event, callbacks = self._waiting.pop(key, (None, []))
+            if event is not None:
+                event.set()
+            for callback in callbacks:
+                try:
+                    callback(preview)
+                except Exception:
+                    pass
+
+    def _resolve(self, url):
+        try:
+            info = self.extract(url)
+        except Exception as e:
+            return Preview(url, error=e)
+
+        preview = Preview(url, info)
+        if info.get('_type', 'video') != 'video':
+            return preview
+        for quality in self.qualities:
+            plan = self.plan(info, quality)
+            if plan is None:
+                continue
+            preview.plans[quality] = plan
+            preview.sizes[quality] = plan_size(info, plan)
+
+        # The lowest quality that still gets the same streams as the highest
+        video = [(quality, plan.format_spec) for quality, plan in preview.plans.items()
+                 if quality != "Audio Only"]
+        if video:
+            preview.recommended = [quality for quality, spec in video if spec == video[0][1]][-1]
+        return preview
@@ -0,0 +1,181 @@
+import random
+import threading
+import time
+from .fragments import is_throttled
+
+NETWORK = 'network'
+THROTTLED = 'throttled'
+EXTRACTOR = 'extractor'
+POSTPROCESS = 'postprocess'
+FATAL = 'fatal'
+
+# Text markers, for errors that carry no HTTP status
+NETWORK_MARKERS = (
+    'timed out', 'timeout', 'connection reset', 'connection refused', 'connection aborted',
+    'remote end closed', 'broken pipe', 'network is unreachable', 'temporary failure in name',
+    'name or service not known', 'incomplete read', 'incompleteread', 'bytes read',
+    'http error 500', 'http error 502', 'http error 503', 'http error 504',
+    'unable to download webpage', 'unable to download video data', 'worker sent nothing',
+)
+NETWORK_TYPES = ('TimeoutError', 'ConnectionError', 'IncompleteRead', 'TransportError',
+                 'URLError', 'RemoteDisconnected', 'WorkerHung')
+POSTPROCESS_TYPES = ('PostProcessingError',)
+EXTRACTOR_TYPES = ('ExtractorError', 'RegexNotFoundError', 'WorkerCrashed')
+# Client errors worth another try; any other 4xx is the server's final answer
+THROTTLED_STATUSES = (403, 429)
+TIMEOUT_STATUS = 408
+
+# kind: (retries, first delay in seconds)
+DEFAULT_RETRIES = {
+    NETWORK: (5, 2.0),
+    THROTTLED: (4, 30.0),
+    EXTRACTOR: (2, 5.0),
+    POSTPROCESS: (1, 1.0),
+}
+
+
+def _causes(error):
+    # yt-dlp wraps the original exception in DownloadError.exc_info, and
+    # ExtractorError keeps it in .cause
+    seen = []
+    while error is not None and error not in seen and len(seen) < 8:
+        seen.append(error)
+        exc_info = getattr(error, 'exc_info', None)
+        cause = getattr(error, 'cause', None)
+        if isinstance(exc_info, tuple) and len(exc_info) > 1 and exc_info[1] is not error:
+            error = exc_info[1]
+        elif isinstance(cause, BaseException):
+            error = cause
+        else:
+            error = error.__cause__ or error.__context__
+    return seen
+
+
+def http_status(causes):
+    # yt-dlp's HTTPError has .status, urllib's .code
+    for cause in causes:
+        for attr in ('status', 'code'):
+            status = getattr(cause, attr, None)
+            if isinstance(status, int) and 400 <= status < 600:
+                return status
+    return None
+
+
+def classify(error):
+    causes = _causes(error)
+    for cause in causes:
+        # Already classified where it happened, e.g. in a worker process
+        kind = getattr(cause, 'retry_kind', None)
+        if kind:
+            return kind
+    names = {cls.__name__ for cause in causes for cls in type(cause).__mro__}
+    message = ' '.join(str(cause) for cause in causes).lower()
+
+    status = http_status(causes)
+    if status in THROTTLED_STATUSES:
+        return THROTTLED
+    if status == TIMEOUT_STATUS or (status is not None and status >= 500):
+        return NETWORK
+    if status is not None:
+        return FATAL
+
+    if any(is_throttled(cause) for cause in causes):
+        return THROTTLED
+    if names.intersection(POSTPROCESS_TYPES) or 'postprocessing' in message:
+        return POSTPROCESS
+    if names.intersection(NETWORK_TYPES) or any(marker in message for marker in NETWORK_MARKERS):
+        return NETWORK
+    if names.intersection(EXTRACTOR_TYPES):
+        # Expected extractor errors are the site's answer: private, removed, geo-blocked
+        if any(getattr(cause, 'expected', False) for cause in causes):
+            return FATAL
+        return EXTRACTOR
+    return FATAL
+
+
+class RetryPolicy:
+    # Exponential backoff with full jitter above half the delay, so retries
+    # of jobs that failed together spread out instead of failing together again
+    def __init__(self, retries=None, factor=2.0, max_delay=600.0, jitter=random.random):
+        self.retries = dict(DEFAULT_RETRIES, **(retries or {}))
+        self.factor = factor
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def delay(self, kind, attempt):
+        # attempt counts from 1; None means give up
+        retries, first = self.retries.get(kind, (0, 0))
+        if attempt > retries:
+            return None
+        delay = min(self.max_delay, first * self.factor ** (attempt - 1))
+        return delay / 2 + self.jitter() * delay / 2
+
+
+class CircuitBreaker:
+    # Per host: after `threshold` failures in a row the host is left alone
+    # for `cooldown`, then one job is let through as a probe. The probe's
+    # result closes the circuit or reopens it for twice as long.
+    def __init__(self, threshold=4, cooldown=30.0, max_cooldown=900.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _state(self, host):
+        return self._hosts.setdefault(host, {'failures': 0, 'open_until': None,
+                                             'cooldown': self.cooldown, 'probing': False})
+
+    def allow(self, host, now=None):
+        # Granting a probe claims it, so call this only for a job about to start
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None or state['open_until'] is None:
+                return True
+            if state['probing'] or now < state['open_until']:
+                return False
+            state['probing'] = True
+            return True
+
+    def reopens_at(self, host):
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None or state['open_until'] is None or state['probing']:
+                return None
+            return state['open_until']
+
+    def is_open(self, host):
+        with self._lock:
+            state = self._hosts.get(host)
+            return state is not None and state['open_until'] is not None
+
+    def success(self, host):
+        with self._lock:
+            self._hosts.pop(host, None)
+
+    def release(self, host):
+        # The probe ended without telling us anything, e.g. it was cancelled;
+        # the next job to the host becomes the probe
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is not None and state['probing']:
+                state['probing'] = False
+                state['open_until'] = time.monotonic()
+
+    def failure(self, host, kind=NETWORK):
+        # Only failures that say something about the host count
+        if kind not in (NETWORK, THROTTLED):
+            self.release(host)
+            return
+        with self._lock:
+            state = self._state(host)
+            if state['probing']:
+                state['probing'] = False
+                state['cooldown'] = min(self.max_cooldown, state['cooldown'] * 2)
+                state['open_until'] = time.monotonic() + state['cooldown']
+                return
+            # Being told to slow down counts double
+            state['failures'] += 2 if kind == THROTTLED else 1
+            if state['failures'] >= self.threshold and state['open_until'] is None:
+                state['open_until'] = time.monotonic() + state['cooldown']
@@ -0,0 +1,149 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+HOOK_KEYS = ('progress_hooks', 'postprocessor_hooks', 'retry_hooks')
+# Set on the instance at each checkout instead of telling sessions apart
+DISPATCH_KEYS = ('format', 'paths')
+# yt-dlp looks up a sleep function per retry kind; ours only report the retry
+RETRY_KINDS = ('http', 'fragment', 'file_access', 'extractor')
+
+
+def session_key(opts):
+    return json.dumps({k: v for k, v in opts.items() if k not in HOOK_KEYS + DISPATCH_KEYS},
+                      sort_keys=True, default=repr)
+
+
+class Session:
+    def __init__(self, key):
+        self.key = key
+        self.ydl = None
+        self.progress_hooks = []
+        self.postprocessor_hooks = []
+        self.retry_hooks = []
+        self.last_used = time.monotonic()
+
+    def on_progress(self, d):
+        for hook in self.progress_hooks:
+            hook(d)
+
+    def on_postprocess(self, d):
+        for hook in self.postprocessor_hooks:
+            hook(d)
+
+    def set_format(self, spec):
+        # What YoutubeDL.__init__ does with the 'format' param
+        params = self.ydl.params
+        if 'format' in params and params['format'] == spec:
+            return
+        params['format'] = spec
+        self.ydl.format_selector = (spec if spec in (None, '-') or callable(spec)
+                                    else self.ydl.build_format_selector(spec))
+
+    def set_paths(self, paths):
+        # Read from params each time a filename is made
+        self.ydl.params['paths'] = dict(paths or {})
+
+    def retry_sleep(self, kind):
+        def sleep(n):
+            for hook in self.retry_hooks:
+                hook(kind, n)
+            # No delay, as when no sleep function is set
+            return 0
+        return sleep
+
+    def close(self):
+        try:
+            self.ydl.close()
+        except Exception:
+            pass
+
+
+class SessionPool:
+    # YoutubeDL instances are not thread-safe, so a session is lent to one job
+    # at a time. Hooks are fixed at construction, so each session installs
+    # its own dispatchers and the job's hooks are swapped in per checkout.
+    def __init__(self, factory, max_idle=4, idle_timeout=300):
+        self.factory = factory
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def session(self, opts):
+        session = self.checkout(opts)
+        try:
+            yield session.ydl
+        except BaseException:
+            # A transfer aborted mid-way can leave the instance in an odd state
+            session.close()
+            raise
+        else:
+            self.release(session)
+
+    def checkout(self, opts):
+        # For callers that keep a session across threads; pair with release(),
+        # or close() if the job failed
+        session = self.acquire(opts)
+        session.progress_hooks = list(opts.get('progress_hooks') or [])
+        session.postprocessor_hooks = list(opts.get('postprocessor_hooks') or [])
+        session.retry_hooks = list(opts.get('retry_hooks') or [])
+        session.set_format(opts.get('format'))
+        session.set_paths(opts.get('paths'))
+        return session
+
+    def switch(self, session, opts):
+        # Reuses the checked-out session when only per-checkout options changed
+        if session_key(opts) != session.key:
+            self.release(session)
+            return self.checkout(opts)
+        session.set_format(opts.get('format'))
+        session.set_paths(opts.get('paths'))
+        return session
+
+    def acquire(self, opts):
+        key = session_key(opts)
+        with self._lock:
+            self._reap()
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop()
+
+        session = Session(key)
+        session_opts = {k: v for k, v in opts.items() if k not in HOOK_KEYS + DISPATCH_KEYS}
+        session_opts['progress_hooks'] = [session.on_progress]
+        session_opts['postprocessor_hooks'] = [session.on_postprocess]
+        session_opts['retry_sleep_functions'] = {kind: session.retry_sleep(kind) for kind in RETRY_KINDS}
+        session.ydl = self.factory(session_opts)
+        return session
+
+    def release(self, session):
+        session.progress_hooks = []
+        session.postprocessor_hooks = []
+        session.retry_hooks = []
+        session.last_used = time.monotonic()
+        with self._lock:
+            idle = self._idle.setdefault(session.key, [])
+            if len(idle) < self.max_idle:
+                idle.append(session)
+                return
+        session.close()
+
+    def close(self):
+        with self._lock:
+            sessions = [s for idle in self._idle.values() for s in idle]
+            self._idle.clear()
+        for session in sessions:
+            session.close()
+
+    def _reap(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        for key in list(self._idle):
+            idle = self._idle[key]
+            for session in [s for s in idle if s.last_used < cutoff]:
+                idle.remove(session)
+                session.close()
+            if not idle:
+                del self._idle[key]
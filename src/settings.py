@@ -0,0 +1,235 @@
+import json
+import os
+import sys
+import threading
+import time
+from .paths import config_dir
+
+if sys.platform == 'win32':
+    import msvcrt
+else:
+    import fcntl
+
+# Older versions wrote settings.json next to main.py, the folder they were run from
+LEGACY_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           'settings.json')
+
+
+def _optional(check):
+    return lambda value: value is None or check(value)
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+# name: (default, check)
+SCHEMA = {
+    'download_path': (None, _optional(lambda v: isinstance(v, str) and v.strip() != '')),
+    'last_quality': ('1080p', lambda v: isinstance(v, str)),
+    'max_workers': (3, lambda v: _is_int(v) and 1 <= v <= 8),
+    'per_host_limit': (2, lambda v: _is_int(v) and 1 <= v <= 8),
+    'keep_partial_files': (False, lambda v: isinstance(v, bool)),
+    'use_archive': (True, lambda v: isinstance(v, bool)),
+    'playlist_mode': (False, lambda v: isinstance(v, bool)),
+    'rate_limit': (None, _optional(lambda v: _is_int(v) and v > 0)),
+    'metrics_log': (None, _optional(lambda v: isinstance(v, str))),
+    'metrics_port': (None, _optional(lambda v: _is_int(v) and 0 < v < 65536)),
+    'watch_clipboard': (False, lambda v: isinstance(v, bool)),
+    'process_workers': (False, lambda v: isinstance(v, bool)),
+    'dedupe_files': (False, lambda v: isinstance(v, bool)),
+    'staging_path': (None, _optional(lambda v: isinstance(v, str) and v.strip() != '')),
+}
+
+
+def default_path():
+    return os.path.join(config_dir(), 'settings.json')
+
+
+def _lock(f):
+    if sys.platform == 'win32':
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+    else:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+class SettingsStore:
+    # Reads once, validates against SCHEMA and writes back on a background
+    # thread, `delay` seconds after the last change. A write re-reads the
+    # file under a lock and only applies the keys changed here, so two
+    # instances don't undo each other, and replaces it atomically.
+    def __init__(self, path=None, delay=0.5, max_delay=5.0, legacy_path=LEGACY_PATH):
+        self.path = path or default_path()
+        self.delay = delay
+        self.max_delay = max_delay
+        self.legacy_path = legacy_path
+        self.errors = []
+        self._values = {}
+        self._dirty = set()
+        self._first_change = None
+        self._last_change = None
+        self._closed = False
+        # Taken off _dirty but not on disk yet
+        self._writing = False
+        self._writer = None
+        self._cond = threading.Condition()
+
+    def load(self):
+        values = self._read(self.path)
+        if not os.path.exists(self.path) and self.legacy_path and os.path.exists(self.legacy_path):
+            values = self._read(self.legacy_path)
+            if values is not None:
+                # Carried over from the app's folder once; the old file is left alone
+                with self._cond:
+                    self._dirty.update(values)
+        with self._cond:
+            self._values = self._validate(values or {})
+            if self._dirty:
+                self._schedule()
+        return self
+
+    def _read(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                values = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            self.errors.append(f"{path}: {e}")
+            return None
+        if not isinstance(values, dict):
+            self.errors.append(f"{path}: expected an object")
+            return None
+        return values
+
+    def _validate(self, values):
+        valid = {}
+        for key, value in values.items():
+            if key in SCHEMA and not SCHEMA[key][1](value):
+                self.errors.append(f"{key}: invalid value {value!r}, using the default")
+                continue
+            # Unknown keys are kept for newer versions that know them
+            valid[key] = value
+        return valid
+
+    def get(self, key, default=None):
+        with self._cond:
+            if key in self._values:
+                return self._values[key]
+        if key in SCHEMA and default is None:
+            return SCHEMA[key][0]
+        return default
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+    def __setitem__(self, key, value):
+        self.update({key: value})
+
+    def update(self, values):
+        for key, value in values.items():
+            if key in SCHEMA and not SCHEMA[key][1](value):
+                raise ValueError(f"Invalid value for {key}: {value!r}")
+        with self._cond:
+            changed = {k: v for k, v in values.items() if k not in self._values or self._values[k] != v}
+            if not changed:
+                return
+            self._values.update(changed)
+            self._dirty.update(changed)
+            self._schedule()
+
+    def as_dict(self):
+        with self._cond:
+            values = {key: default for key, (default, _) in SCHEMA.items()}
+            values.update(self._values)
+            return values
+
+    def _schedule(self):
+        # Called with the lock held
+        now = time.monotonic()
+        self._last_change = now
+        if self._first_change is None:
+            self._first_change = now
+        # A writer that died on an unexpected error is replaced
+        if (self._writer is None or not self._writer.is_alive()) and not self._closed:
+            self._writer = threading.Thread(target=self._write_loop, daemon=True, name="settings-writer")
+            self._writer.start()
+        self._cond.notify_all()
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while not self._dirty and not self._closed:
+                    self._cond.wait()
+                if not self._dirty:
+                    return
+                # Wait for changes to settle, but never longer than max_delay in total
+                while not self._closed:
+                    now = time.monotonic()
+                    due = min(self._last_change + self.delay, self._first_change + self.max_delay)
+                    if now >= due:
+                        break
+                    self._cond.wait(due - now)
+                changes = {key: self._values.get(key) for key in self._dirty}
+                removed = {key for key in self._dirty if key not in self._values}
+                self._dirty.clear()
+                self._first_change = None
+                self._writing = True
+
+            try:
+                self._write(changes, removed)
+            except OSError as e:
+                with self._cond:
+                    self._writing = False
+                    self.errors.append(f"{self.path}: {e}")
+                    # Try again with the next change, or after max_delay
+                    for key in changes:
+                        self._dirty.add(key)
+                    self._first_change = self._last_change = time.monotonic()
+                    if self._closed:
+                        return
+                    self._cond.wait(self.max_delay)
+            else:
+                with self._cond:
+                    self._writing = False
+                    self._cond.notify_all()
+
+    def _write(self, changes, removed):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + '.lock', 'a+') as lock:
+            _lock(lock)
+            current = self._read(self.path) or {}
+            current.update(changes)
+            for key in removed:
+                current.pop(key, None)
+
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(current, f, indent=2, sort_keys=True)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+
+    def flush(self, timeout=5.0):
+        # Writes pending changes now; returns False if that did not finish in time
+        with self._cond:
+            if self._first_change is not None:
+                self._first_change -= self.max_delay
+            self._cond.notify_all()
+            deadline = time.monotonic() + timeout
+            while ((self._dirty or self._writing) and self._writer is not None
+                   and self._writer.is_alive()):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(min(remaining, 0.05))
+            return not self._dirty and not self._writing
+
+    def close(self, timeout=5.0):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            writer = self._writer
+        if writer is not None:
+            writer.join(timeout)
@@ -0,0 +1,190 @@
+import errno
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from .content import new_hash
+
+COPY_CHUNK = 1024 * 1024
+# Left free on either disk on top of what a download is expected to need
+MARGIN = 64 * 1024 * 1024
+
+
+class InsufficientSpace(OSError):
+    def __init__(self, path, needed, free):
+        super().__init__(errno.ENOSPC, f"Not enough free space in {path}: "
+                                       f"{needed / 1e6:.0f} MB needed, {free / 1e6:.0f} MB free")
+        self.path = path
+        self.needed = needed
+        self.free = free
+
+
+def existing_parent(path):
+    # Nearest directory that exists, for paths not created yet
+    path = os.path.abspath(path)
+    while not os.path.isdir(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+def free_space(path):
+    return shutil.disk_usage(existing_parent(path)).free
+
+
+def same_device(a, b):
+    try:
+        return os.stat(existing_parent(a)).st_dev == os.stat(existing_parent(b)).st_dev
+    except OSError:
+        return False
+
+
+def staging_key(job):
+    # Stable across retries and a journal resume. Playlist entries are listed
+    # afresh on resume, so theirs comes from the playlist and the video.
+    if job.playlist is not None:
+        return f"{job.playlist.uid}\0{job.url}\0{job.quality}"
+    return job.uid
+
+
+def move_file(src, dst, digest=None):
+    # Whoever looks at `dst` sees nothing or the whole file. Across
+    # filesystems the copy goes to a hidden file next to it first, feeding
+    # `digest` on the way; returns whether it did.
+    try:
+        os.replace(src, dst)
+        return False
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    directory = os.path.dirname(os.path.abspath(dst))
+    size = os.path.getsize(src)
+    free = free_space(directory)
+    if free < size:
+        raise InsufficientSpace(directory, size, free)
+
+    fd, tmp = tempfile.mkstemp(prefix=f'.{os.path.basename(dst)}.', suffix='.tmp', dir=directory)
+    try:
+        with open(src, 'rb') as source, os.fdopen(fd, 'wb') as target:
+            while True:
+                chunk = source.read(COPY_CHUNK)
+                if not chunk:
+                    break
+                if digest is not None:
+                    digest.update(chunk)
+                target.write(chunk)
+            target.flush()
+            os.fsync(target.fileno())
+        shutil.copystat(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    os.remove(src)
+    return True
+
+
+def move_downloaded_files(pp, info):
+    # MoveFilesAfterDownloadPP.run with move_file in place of shutil.move
+    dl_path, dl_name = os.path.split(info['filepath'])
+    finaldir = info.get('__finaldir', dl_path)
+    finalpath = os.path.join(finaldir, dl_name)
+    if pp._downloaded:
+        info['__files_to_move'][info['filepath']] = finalpath
+    main_file = info['filepath']
+
+    for oldfile, newfile in info['__files_to_move'].items():
+        newfile = newfile or os.path.join(finaldir, os.path.basename(oldfile))
+        if os.path.abspath(oldfile) == os.path.abspath(newfile):
+            continue
+        if not os.path.exists(oldfile):
+            pp.report_warning(f'File "{oldfile}" cannot be found')
+            continue
+        if os.path.exists(newfile) and not pp.get_param('overwrites', True):
+            pp.report_warning(f'Cannot move file "{oldfile}" out of temporary directory '
+                              f'since "{newfile}" already exists. ')
+            continue
+        os.makedirs(os.path.dirname(os.path.abspath(newfile)), exist_ok=True)
+        pp.to_screen(f'Moving file "{oldfile}" to "{newfile}"')
+        digest = new_hash() if oldfile == main_file and pp.get_param('content_hash') else None
+        if move_file(oldfile, newfile, digest) and digest is not None:
+            # Saves dedupe a read of the file it was just handed
+            info['__content_hash'] = digest.hexdigest()
+
+    info['filepath'] = finalpath
+    return info
+
+
+class StagingArea:
+    # A directory on a fast local disk that takes every intermediate write:
+    # .part files, fragments and the streams a merge reads. Each download
+    # gets a subdirectory of its own, keyed by something stable across
+    # retries and restarts, so a retry or a resumed job finds its partial
+    # data again while two jobs for the same video never share one. Space is
+    # booked per download when it starts, so concurrent jobs do not all count
+    # the same free bytes.
+    def __init__(self, path, headroom=2.0, max_age=7 * 24 * 3600):
+        self.path = path
+        # A merge holds the separate streams and the merged output at once
+        self.headroom = headroom
+        self.max_age = max_age
+        self._reserved = {}
+        self._lock = threading.Lock()
+
+    def job_dir(self, key):
+        digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+        return os.path.join(self.path, digest)
+
+    def reserve(self, directory, size, destination):
+        # Returns whether to stage at all: without room here the download is
+        # written to its destination as before, if there is room there
+        staged = True
+        if size:
+            with self._lock:
+                self._reserved.pop(directory, None)
+                booked = sum(self._reserved.values())
+                needed = int(size * self.headroom) + MARGIN
+                if free_space(self.path) - booked < needed:
+                    staged = False
+                else:
+                    self._reserved[directory] = needed
+            if not staged or not same_device(self.path, destination):
+                # Only the finished file lands there, unless nothing is staged
+                needed = (int(size * self.headroom) if not staged else size) + MARGIN
+                free = free_space(destination)
+                if free < needed:
+                    self.release(directory)
+                    raise InsufficientSpace(destination, needed, free)
+        if staged:
+            os.makedirs(directory, exist_ok=True)
+        return staged
+
+    def release(self, directory):
+        with self._lock:
+            self._reserved.pop(directory, None)
+
+    def discard(self, directory):
+        self.release(directory)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    def prune(self):
+        # Left behind by jobs that never came back, e.g. removed from the journal
+        cutoff = time.time() - self.max_age
+        try:
+            entries = list(os.scandir(self.path))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            except OSError:
+                pass
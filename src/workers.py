@@ -0,0 +1,351 @@
+import multiprocessing
+import threading
+import time
+from contextlib import contextmanager
+from .jobs import AlreadyDownloaded, DownloadCancelled
+from .retry import classify
+from .staging import staging_key
+
+# Forwarded progress is coalesced to this interval, except status changes
+PROGRESS_INTERVAL = 0.1
+POLL_INTERVAL = 0.25
+# Post-processing reports little on its own; this keeps a long merge or a
+# copy to slow storage from looking like a hang
+HEARTBEAT_INTERVAL = 10.0
+
+PROGRESS_KEYS = ('status', 'filename', 'tmpfilename', 'downloaded_bytes', 'total_bytes',
+                 'total_bytes_estimate', 'speed', 'eta', 'elapsed', 'fragment_index',
+                 'fragment_count')
+POSTPROCESSOR_KEYS = ('status', 'postprocessor')
+
+
+class WorkerError(Exception):
+    def __init__(self, message, retry_kind=None):
+        super().__init__(message)
+        # As classified in the worker, which still had the exception itself
+        self.retry_kind = retry_kind
+
+
+class WorkerCrashed(WorkerError):
+    pass
+
+
+class WorkerHung(WorkerError):
+    pass
+
+
+# Child side. Everything the parent sees goes through `conn`; progress
+# waits for a reply, which is how the parent throttles and cancels.
+
+class RemoteMetrics:
+    def __init__(self, channel):
+        self.channel = channel
+        self.cached_info = False
+        self.plan = None
+
+    @contextmanager
+    def stage(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.channel.send(('stage', name, time.monotonic() - start))
+
+    def retry(self, kind, attempt):
+        self.channel.send(('retry', kind, attempt))
+
+
+class Channel:
+    # yt-dlp calls hooks from fragment threads too
+    def __init__(self, conn):
+        self.conn = conn
+        self.cancelled = False
+        self._last_progress = 0
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        with self._lock:
+            self.conn.send(message)
+
+    def progress(self, d):
+        now = time.monotonic()
+        if d['status'] == 'downloading' and now - self._last_progress < PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        event = {key: d[key] for key in PROGRESS_KEYS if d.get(key) is not None}
+        if d.get('info_dict'):
+            event['info_dict'] = {'title': d['info_dict'].get('title')}
+        with self._lock:
+            self.conn.send(('progress', event))
+            self.cancelled = self.conn.recv() == 'cancel' or self.cancelled
+        self.check_cancelled()
+
+    def postprocessor(self, d):
+        # Post-processing runs without waiting for the parent, which may not
+        # be listening yet; a cancel is picked up from the pipe if one is there
+        self.send(('postprocessor', {key: d.get(key) for key in POSTPROCESSOR_KEYS}))
+        with self._lock:
+            while self.conn.poll():
+                self.cancelled = self.conn.recv() == 'cancel' or self.cancelled
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise DownloadCancelled("Download cancelled")
+
+    @contextmanager
+    def heartbeat(self, interval=HEARTBEAT_INTERVAL):
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(interval):
+                try:
+                    self.send(('heartbeat',))
+                except OSError:
+                    return
+
+        thread = threading.Thread(target=beat, daemon=True, name="worker-heartbeat")
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+
+def worker_main(conn):
+    from .downloader import YouTubeDownloader
+
+    downloader = YouTubeDownloader(max_workers=1)
+    channel = Channel(conn)
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                return
+            if isinstance(message, str):
+                # A reply or cancel that arrived after the last job ended
+                continue
+            if message[0] == 'stop':
+                return
+            run_task(downloader, channel, message[1])
+    finally:
+        downloader.close()
+
+
+def run_task(downloader, channel, task):
+    channel.cancelled = False
+    downloader.use_archive = task['use_archive']
+    if task['staging_path'] != (downloader.staging and downloader.staging.path):
+        downloader.set_staging(task['staging_path'])
+    downloader.set_dedupe(task['dedupe'])
+    metrics = RemoteMetrics(channel)
+    try:
+        finish = downloader.download(task['url'], task['quality'], channel.progress,
+                                     channel.postprocessor, task['download_path'], metrics,
+                                     defer_postprocess=True, staging_id=task['staging_id'])
+        channel.send(('downloaded', {'plan': metrics.plan, 'cached_info': metrics.cached_info}))
+        with channel.heartbeat():
+            filename = finish()
+        channel.send(('done', filename))
+    except DownloadCancelled:
+        channel.send(('failed', 'cancelled', None))
+    except AlreadyDownloaded:
+        channel.send(('failed', 'skipped', None))
+    except Exception as e:
+        channel.send(('failed', 'error', str(e) or type(e).__name__, classify(e)))
+
+
+# Parent side
+
+class WorkerProcess:
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=worker_main, args=(child_conn,), daemon=True,
+                                       name="download-worker")
+        self.process.start()
+        child_conn.close()
+        # Between jobs, as opposed to somewhere mid-protocol
+        self.ready = True
+
+    @property
+    def alive(self):
+        return self.process.is_alive()
+
+    def stop(self):
+        try:
+            self.conn.send(('stop',))
+        except OSError:
+            pass
+        self.process.join(1)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(1)
+        self.conn.close()
+
+
+class ProcessPool:
+    # Drop-in for YouTubeDownloader.download inside run_job: the job's hooks
+    # run here, in the parent, on events the worker forwards. A worker that
+    # sends nothing for `hang_timeout`, or ignores a cancel for
+    # `cancel_grace`, is killed and replaced by a fresh process next time.
+    def __init__(self, max_idle=3, hang_timeout=300.0, cancel_grace=5.0):
+        self.max_idle = max_idle
+        self.hang_timeout = hang_timeout
+        self.cancel_grace = cancel_grace
+        # spawn everywhere: forking a process with Tk and worker threads is unsafe
+        self.context = multiprocessing.get_context('spawn')
+        self._idle = []
+        self._busy = {}
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.alive:
+                    return worker
+                worker.kill()
+        return WorkerProcess(self.context)
+
+    def release(self, worker):
+        with self._lock:
+            if worker.alive and not self._closed and len(self._idle) < self.max_idle:
+                self._idle.append(worker)
+                return
+        worker.stop()
+
+    def download(self, job, progress_hook, postprocessor_hook, metrics, use_archive=True,
+                 staging_path=None, dedupe=False):
+        worker = self.acquire()
+        with self._lock:
+            self._busy[job.id] = worker
+        task = {'url': job.url, 'quality': job.quality, 'download_path': job.download_path,
+                'use_archive': use_archive, 'staging_path': staging_path, 'dedupe': dedupe,
+                'staging_id': staging_key(job)}
+        try:
+            worker.ready = False
+            worker.conn.send(('job', task))
+            result = self._wait(worker, job, 'downloaded', progress_hook, postprocessor_hook,
+                                metrics)
+        except BaseException:
+            self._drop(job, worker)
+            raise
+        metrics.plan = result['plan']
+        metrics.cached_info = result['cached_info']
+
+        def finish(cancelled=False):
+            if cancelled:
+                # Its result will not be collected; the worker is mid-protocol
+                self.job_finished(job)
+                return None
+            # The worker went straight on to post-processing; collect its result
+            try:
+                filename = self._wait(worker, job, 'done', progress_hook, postprocessor_hook,
+                                      metrics)
+            except BaseException:
+                self._drop(job, worker)
+                raise
+            with self._lock:
+                self._busy.pop(job.id, None)
+            self.release(worker)
+            return filename
+
+        return finish
+
+    def _drop(self, job, worker):
+        with self._lock:
+            self._busy.pop(job.id, None)
+        if worker.ready and worker.alive:
+            # A failure the worker reported itself; it is waiting for its next job
+            self.release(worker)
+        else:
+            worker.kill()
+
+    def job_finished(self, job):
+        # A job cancelled between download and post-processing never collects
+        # its worker's result; the worker is stuck mid-protocol, so it goes
+        with self._lock:
+            worker = self._busy.pop(job.id, None)
+        if worker is not None:
+            worker.kill()
+
+    def _wait(self, worker, job, until, progress_hook, postprocessor_hook, metrics):
+        last_message = time.monotonic()
+        cancel_sent = None
+        while True:
+            now = time.monotonic()
+            if job.cancelled and cancel_sent is None:
+                cancel_sent = now
+                self._send(worker, 'cancel')
+            if cancel_sent is not None and now - cancel_sent > self.cancel_grace:
+                worker.kill()
+                raise DownloadCancelled(f"Download {job.id} cancelled")
+            if now - last_message > self.hang_timeout:
+                worker.kill()
+                raise WorkerHung(f"Worker sent nothing for {self.hang_timeout:.0f}s and was killed")
+
+            try:
+                if not worker.conn.poll(POLL_INTERVAL):
+                    if not worker.alive:
+                        raise WorkerCrashed(f"Worker exited with code {worker.process.exitcode}")
+                    continue
+                message = worker.conn.recv()
+            except (EOFError, OSError):
+                worker.kill()
+                raise WorkerCrashed(f"Worker exited with code {worker.process.exitcode}")
+            last_message = time.monotonic()
+
+            kind = message[0]
+            if kind == 'progress':
+                try:
+                    progress_hook(message[1])
+                    reply = 'ack'
+                except DownloadCancelled:
+                    reply = 'cancel'
+                    cancel_sent = cancel_sent or time.monotonic()
+                self._send(worker, reply)
+            elif kind == 'postprocessor':
+                try:
+                    postprocessor_hook(message[1])
+                except DownloadCancelled:
+                    if cancel_sent is None:
+                        cancel_sent = time.monotonic()
+                        self._send(worker, 'cancel')
+            elif kind == 'stage':
+                metrics.stages[message[1]] += message[2]
+            elif kind == 'retry':
+                metrics.retry(message[1], message[2])
+            elif kind == 'failed':
+                worker.ready = True
+                if message[1] == 'cancelled':
+                    raise DownloadCancelled(f"Download {job.id} cancelled")
+                if message[1] == 'skipped':
+                    raise AlreadyDownloaded(job.url)
+                raise WorkerError(message[2], message[3])
+            elif kind == until:
+                worker.ready = kind == 'done'
+                return message[1]
+
+    @staticmethod
+    def _send(worker, message):
+        try:
+            worker.conn.send(message)
+        except OSError:
+            pass
+
+    def close(self, kill=True):
+        # Without kill, running jobs finish and their workers stop afterwards
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            busy = list(self._busy.values()) if kill else []
+        for worker in idle:
+            worker.stop()
+        for worker in busy:
+            worker.kill()
@@ -0,0 +1,91 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from src.bandwidth import ACTIVE_WINDOW, BandwidthManager, parse_rate
+
+
+def make_job(job_id, priority=0):
+    return SimpleNamespace(id=job_id, priority=priority, check_cancelled=lambda: None)
+
+
+def test_share_is_none_without_a_rate():
+    manager = BandwidthManager()
+    job = make_job(1)
+    manager.register(job)
+    assert manager.share(job) is None
+
+
+def test_unregistered_job_has_no_share():
+    assert BandwidthManager(1000).share(make_job(1)) is None
+
+
+def test_idle_jobs_leave_their_share_to_transferring_ones():
+    manager = BandwidthManager(1000)
+    jobs = [make_job(i) for i in range(3)]
+    for job in jobs:
+        manager.register(job)
+    # Registered but extracting: nothing consumed yet
+    manager.consume(jobs[0], 'a', 1)
+    assert manager.share(jobs[0]) == pytest.approx(1000)
+
+
+def test_transferring_jobs_share_by_weight():
+    manager = BandwidthManager(1200)
+    normal, high = make_job(1), make_job(2, priority=1)
+    for job in (normal, high):
+        manager.register(job)
+        manager.consume(job, 'a', 1)
+    assert manager.share(normal) == pytest.approx(400)
+    assert manager.share(high) == pytest.approx(800)
+
+
+def test_share_returns_after_the_active_window():
+    manager = BandwidthManager(1000)
+    first, second = make_job(1), make_job(2)
+    for job in (first, second):
+        manager.register(job)
+        manager.consume(job, 'a', 1)
+    assert manager.share(first) == pytest.approx(500)
+
+    with manager._lock:
+        manager._jobs[second.id]['active'] -= ACTIVE_WINDOW + 1
+    assert manager.share(first) == pytest.approx(1000)
+
+
+def test_unregister_frees_the_share():
+    manager = BandwidthManager(1000)
+    first, second = make_job(1), make_job(2)
+    for job in (first, second):
+        manager.register(job)
+        manager.consume(job, 'a', 1)
+    manager.unregister(second)
+    assert manager.share(first) == pytest.approx(1000)
+
+
+def test_consume_throttles_to_the_rate():
+    rate = 200 * 1024
+    manager = BandwidthManager(rate, burst=0.1)
+    job = make_job(1)
+    manager.register(job)
+    start = time.monotonic()
+    for downloaded in range(0, rate // 2, 8192):
+        manager.consume(job, 'a', downloaded)
+    elapsed = time.monotonic() - start
+    assert elapsed == pytest.approx(0.5, abs=0.2)
+
+
+@pytest.mark.parametrize('text, rate', [
+    ('500K', 500 * 1024),
+    ('2M', 2 * 1024 ** 2),
+    ('1.5m', int(1.5 * 1024 ** 2)),
+    ('100', 100),
+])
+def test_parse_rate(text, rate):
+    assert parse_rate(text) == rate
+
+
+def test_parse_rate_rejects_garbage():
+    with pytest.raises(ValueError):
+        parse_rate('fast')
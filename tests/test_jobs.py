@@ -0,0 +1,218 @@
+import threading
+import time
+
+import pytest
+
+from src.jobs import (CANCELLED, FAILED, FINISHED, POSTPROCESSING, QUEUED, DownloadCancelled,
+                      DownloadJob, DownloadQueue)
+from src.retry import FATAL, NETWORK, RetryPolicy
+
+TIMEOUT = 5
+
+
+class NetworkError(ConnectionError):
+    pass
+
+
+def wait_for(condition, timeout=TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.01)
+
+
+def make_job(url='https://a.example/v', priority=0):
+    return DownloadJob(url, '720p', priority=priority)
+
+
+@pytest.fixture
+def queues():
+    created = []
+
+    def make(run_job, **kwargs):
+        queue = DownloadQueue(run_job, **kwargs)
+        created.append(queue)
+        return queue
+
+    yield make
+    for queue in created:
+        queue.shutdown()
+
+
+def test_per_host_limit(queues):
+    lock = threading.Lock()
+    running, peak = {}, {}
+    release = threading.Event()
+
+    def run_job(job):
+        with lock:
+            running[job.host] = running.get(job.host, 0) + 1
+            peak[job.host] = max(peak.get(job.host, 0), running[job.host])
+        release.wait(TIMEOUT)
+        with lock:
+            running[job.host] -= 1
+
+    queue = queues(run_job, max_workers=6, per_host_limit=2)
+    jobs = [queue.submit(make_job(f'https://{host}.example/{i}'))
+            for host in ('a', 'b') for i in range(4)]
+    wait_for(lambda: sum(running.values()) == 4)
+    time.sleep(0.1)
+    assert running == {'a.example': 2, 'b.example': 2}
+
+    release.set()
+    for job in jobs:
+        assert job.wait(TIMEOUT)
+    assert peak == {'a.example': 2, 'b.example': 2}
+    assert all(job.state == FINISHED for job in jobs)
+
+
+def test_higher_priority_starts_first(queues):
+    started = []
+    release = threading.Event()
+
+    def run_job(job):
+        started.append(job.url)
+        release.wait(TIMEOUT)
+
+    queue = queues(run_job, max_workers=1)
+    first = queue.submit(make_job('https://a.example/first'))
+    wait_for(lambda: started)
+    jobs = [queue.submit(make_job('https://a.example/low-1')),
+            queue.submit(make_job('https://a.example/high', priority=1)),
+            queue.submit(make_job('https://a.example/low-2'))]
+    release.set()
+    for job in [first] + jobs:
+        assert job.wait(TIMEOUT)
+    assert started == ['https://a.example/first', 'https://a.example/high',
+                       'https://a.example/low-1', 'https://a.example/low-2']
+
+
+def test_retryable_failure_is_retried(queues):
+    calls = []
+    retries = []
+
+    def run_job(job):
+        calls.append(job.url)
+        if len(calls) == 1:
+            raise NetworkError("connection reset by peer")
+
+    queue = queues(run_job, retry_policy=RetryPolicy({NETWORK: (2, 0.01)}),
+                   on_retry=lambda job, kind, delay: retries.append(kind))
+    job = queue.submit(make_job())
+    assert job.wait(TIMEOUT)
+    assert job.state == FINISHED
+    assert len(calls) == 2
+    assert retries == [NETWORK]
+    assert job.attempts[NETWORK] == 1
+
+
+def test_fatal_failure_is_not_retried(queues):
+    calls = []
+
+    def run_job(job):
+        calls.append(job.url)
+        raise ValueError("This video is private")
+
+    queue = queues(run_job, retry_policy=RetryPolicy({NETWORK: (2, 0.01)}))
+    job = queue.submit(make_job())
+    assert job.wait(TIMEOUT)
+    assert job.state == FAILED
+    assert len(calls) == 1
+    assert job.attempts[FATAL] == 1
+
+
+def test_cancel_pending_job(queues):
+    started = []
+    release = threading.Event()
+    finished = []
+
+    def run_job(job):
+        started.append(job)
+        release.wait(TIMEOUT)
+
+    queue = queues(run_job, max_workers=1, on_finish=finished.append)
+    running = queue.submit(make_job('https://a.example/1'))
+    wait_for(lambda: started)
+    pending = queue.submit(make_job('https://a.example/2'))
+    assert pending.state == QUEUED
+
+    queue.cancel(pending)
+    assert pending.wait(TIMEOUT)
+    assert pending.state == CANCELLED
+    assert finished == [pending]
+
+    release.set()
+    assert running.wait(TIMEOUT)
+    assert started == [running]
+    assert queue.counts() == (0, 0)
+
+
+def test_cancel_running_job(queues):
+    def run_job(job):
+        while True:
+            job.check_cancelled()
+            time.sleep(0.01)
+
+    queue = queues(run_job)
+    job = queue.submit(make_job())
+    wait_for(lambda: job.state != QUEUED)
+    queue.cancel(job)
+    assert job.wait(TIMEOUT)
+    assert job.state == CANCELLED
+    assert job.error is None
+
+
+def test_cancel_while_waiting_for_postprocessing(queues):
+    # The finishing step still runs for a cancelled job, so it can free what
+    # the download holds
+    release = threading.Event()
+    finished = []
+
+    def run_job(job):
+        def finish():
+            if job.url.endswith('/slow'):
+                release.wait(TIMEOUT)
+            finished.append((job.url, job.cancelled))
+            job.check_cancelled()
+        return finish
+
+    queue = queues(run_job, postprocess_workers=1)
+    slow = queue.submit(make_job('https://a.example/slow'))
+    wait_for(lambda: slow.state == POSTPROCESSING)
+    waiting = queue.submit(make_job('https://b.example/waiting'))
+    wait_for(lambda: waiting.state == POSTPROCESSING)
+
+    queue.cancel(waiting)
+    release.set()
+    assert slow.wait(TIMEOUT) and waiting.wait(TIMEOUT)
+    assert slow.state == FINISHED
+    assert waiting.state == CANCELLED
+    assert ('https://b.example/waiting', True) in finished
+
+
+def test_postprocessing_frees_the_download_worker(queues):
+    release = threading.Event()
+    started = []
+
+    def run_job(job):
+        started.append(job.url)
+
+        def finish():
+            release.wait(TIMEOUT)
+        return finish
+
+    queue = queues(run_job, max_workers=1, postprocess_workers=2)
+    first = queue.submit(make_job('https://a.example/1'))
+    second = queue.submit(make_job('https://a.example/2'))
+    wait_for(lambda: len(started) == 2)
+    assert first.state == second.state == POSTPROCESSING
+    release.set()
+    assert first.wait(TIMEOUT) and second.wait(TIMEOUT)
+
+
+def test_cancelled_job_raises_from_check():
+    job = make_job()
+    job.cancel()
+    with pytest.raises(DownloadCancelled):
+        job.check_cancelled()
@@ -0,0 +1,127 @@
+import sys
+
+import pytest
+
+from src.retry import (EXTRACTOR, FATAL, NETWORK, POSTPROCESS, THROTTLED, CircuitBreaker,
+                       RetryPolicy, classify)
+
+
+# Shaped like yt-dlp's exceptions: classify goes by class name and attributes
+class HTTPError(Exception):
+    def __init__(self, status, reason=''):
+        super().__init__(f"HTTP Error {status}: {reason}")
+        self.status = status
+
+
+class ExtractorError(Exception):
+    def __init__(self, msg, cause=None, expected=False):
+        super().__init__(msg)
+        self.cause = cause
+        self.expected = expected
+
+
+class DownloadError(Exception):
+    def __init__(self, msg, exc_info=None):
+        super().__init__(msg)
+        self.exc_info = exc_info
+
+
+class PostProcessingError(Exception):
+    pass
+
+
+def wrapped(error):
+    # What YoutubeDL raises: the original error in exc_info
+    try:
+        raise error
+    except Exception:
+        return DownloadError(f"ERROR: {error}", sys.exc_info())
+
+
+@pytest.mark.parametrize('status, kind', [
+    (404, FATAL),
+    (410, FATAL),
+    (408, NETWORK),
+    (500, NETWORK),
+    (503, NETWORK),
+    (403, THROTTLED),
+    (429, THROTTLED),
+])
+def test_http_status(status, kind):
+    assert classify(wrapped(HTTPError(status))) == kind
+
+
+def test_status_found_through_extractor_cause():
+    error = ExtractorError("Unable to download webpage", cause=HTTPError(404))
+    assert classify(wrapped(error)) == FATAL
+
+
+def test_status_wins_over_text_markers():
+    # "unable to download webpage" is a network marker; a 404 is still final
+    error = ExtractorError("Unable to download webpage: HTTP Error 404", cause=HTTPError(404))
+    assert classify(error) == FATAL
+
+
+def test_expected_extractor_error_is_fatal():
+    assert classify(wrapped(ExtractorError("Private video", expected=True))) == FATAL
+
+
+def test_unexpected_extractor_error_is_retried():
+    assert classify(wrapped(ExtractorError("Unable to extract player response"))) == EXTRACTOR
+
+
+def test_network_errors_without_status():
+    assert classify(ConnectionResetError("Connection reset by peer")) == NETWORK
+    assert classify(wrapped(TimeoutError("The read operation timed out"))) == NETWORK
+
+
+def test_postprocessing_error():
+    assert classify(wrapped(PostProcessingError("Conversion failed"))) == POSTPROCESS
+
+
+def test_kind_given_by_a_worker_process():
+    error = Exception("HTTP Error 503")
+    error.retry_kind = FATAL
+    assert classify(error) == FATAL
+
+
+def test_unknown_error_is_fatal():
+    assert classify(ValueError("something else")) == FATAL
+
+
+def test_policy_gives_up_after_retries():
+    policy = RetryPolicy({NETWORK: (2, 1.0)}, jitter=lambda: 1.0)
+    assert policy.delay(NETWORK, 1) == 1.0
+    assert policy.delay(NETWORK, 2) == 2.0
+    assert policy.delay(NETWORK, 3) is None
+    assert policy.delay(FATAL, 1) is None
+
+
+def test_policy_jitter_stays_above_half_and_under_max():
+    policy = RetryPolicy({NETWORK: (10, 1.0)}, max_delay=5.0, jitter=lambda: 0.0)
+    assert policy.delay(NETWORK, 1) == 0.5
+    assert policy.delay(NETWORK, 10) == 2.5
+
+
+def test_breaker_opens_and_probes():
+    breaker = CircuitBreaker(threshold=2, cooldown=10.0)
+    breaker.failure('a.example')
+    assert breaker.allow('a.example')
+    breaker.failure('a.example')
+    assert breaker.is_open('a.example')
+
+    opened = breaker.reopens_at('a.example')
+    assert not breaker.allow('a.example', now=opened - 1)
+    assert breaker.allow('a.example', now=opened)
+    # Only one probe at a time
+    assert not breaker.allow('a.example', now=opened)
+    breaker.success('a.example')
+    assert not breaker.is_open('a.example')
+
+
+def test_breaker_ignores_failures_that_are_not_the_hosts():
+    breaker = CircuitBreaker(threshold=1)
+    breaker.failure('a.example', FATAL)
+    assert not breaker.is_open('a.example')
+    breaker.failure('a.example', THROTTLED)
+    assert breaker.is_open('a.example')
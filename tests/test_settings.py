@@ -0,0 +1,163 @@
+import json
+import os
+import time
+
+import pytest
+
+from src.settings import SettingsStore
+
+
+@pytest.fixture
+def stores(tmp_path):
+    created = []
+
+    def make(**kwargs):
+        kwargs.setdefault('legacy_path', None)
+        store = SettingsStore(str(tmp_path / 'config' / 'settings.json'), **kwargs)
+        created.append(store)
+        return store.load()
+
+    yield make
+    for store in created:
+        store.close()
+
+
+def read(store):
+    with open(store.path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def record_writes(store):
+    writes = []
+    write = store._write
+
+    def recording(changes, removed):
+        writes.append(dict(changes))
+        write(changes, removed)
+
+    store._write = recording
+    return writes
+
+
+def test_defaults_without_a_file(stores):
+    store = stores()
+    assert store['max_workers'] == 3
+    assert store['download_path'] is None
+    assert not os.path.exists(store.path)
+
+
+def test_changes_are_written_once_they_settle(stores):
+    store = stores(delay=0.1, max_delay=5.0)
+    writes = record_writes(store)
+    for workers in (2, 3, 4, 5):
+        store['max_workers'] = workers
+        time.sleep(0.02)
+    store['last_quality'] = '720p'
+    assert writes == []
+
+    time.sleep(0.4)
+    assert writes == [{'max_workers': 5, 'last_quality': '720p'}]
+    assert read(store) == {'max_workers': 5, 'last_quality': '720p'}
+
+
+def test_steady_changes_are_written_after_max_delay(stores):
+    store = stores(delay=0.2, max_delay=0.3)
+    writes = record_writes(store)
+    deadline = time.monotonic() + 0.8
+    workers = 1
+    while time.monotonic() < deadline:
+        store['max_workers'] = workers = workers % 8 + 1
+        time.sleep(0.05)
+    assert writes
+
+
+def test_flush_writes_now(stores):
+    store = stores(delay=60, max_delay=60)
+    store['rate_limit'] = 1024
+    assert store.flush()
+    assert read(store) == {'rate_limit': 1024}
+
+
+def test_unchanged_value_is_not_written(stores):
+    store = stores(delay=0.05)
+    store['max_workers'] = 3
+    assert store.flush()
+    writes = record_writes(store)
+    store['max_workers'] = 3
+    assert store.flush()
+    assert writes == []
+
+
+def test_invalid_values_are_rejected(stores):
+    store = stores()
+    with pytest.raises(ValueError):
+        store['max_workers'] = 0
+    with pytest.raises(ValueError):
+        store['keep_partial_files'] = 'yes'
+
+
+def test_invalid_values_in_the_file_fall_back_to_defaults(tmp_path, stores):
+    path = tmp_path / 'config' / 'settings.json'
+    path.parent.mkdir()
+    path.write_text(json.dumps({'max_workers': 99, 'last_quality': '480p', 'future_key': 1}))
+    store = stores()
+    assert store['max_workers'] == 3
+    assert store['last_quality'] == '480p'
+    assert store['future_key'] == 1
+    assert any('max_workers' in error for error in store.errors)
+
+
+def test_a_second_store_keeps_keys_it_did_not_change(stores):
+    first = stores(delay=0.01)
+    first['max_workers'] = 5
+    assert first.flush()
+    second = stores(delay=0.01)
+    second['last_quality'] = '480p'
+    first['rate_limit'] = 2048
+    assert first.flush() and second.flush()
+    assert read(first) == {'max_workers': 5, 'last_quality': '480p', 'rate_limit': 2048}
+
+
+def test_legacy_file_is_migrated_once(tmp_path, stores):
+    legacy = tmp_path / 'settings.json'
+    legacy.write_text(json.dumps({'download_path': '/videos', 'max_workers': 4}))
+    store = stores(legacy_path=str(legacy), delay=0.01)
+    assert store['download_path'] == '/videos'
+    assert store.flush()
+    assert read(store) == {'download_path': '/videos', 'max_workers': 4}
+    # The old file is left alone, and no longer read once the new one exists
+    assert legacy.exists()
+    legacy.write_text(json.dumps({'download_path': '/elsewhere'}))
+    assert stores(legacy_path=str(legacy))['download_path'] == '/videos'
+
+
+def test_failed_write_is_retried(tmp_path):
+    blocker = tmp_path / 'config'
+    blocker.write_text('')  # A file where the directory should be
+    store = SettingsStore(str(blocker / 'settings.json'), delay=0.01, max_delay=0.1,
+                          legacy_path=None).load()
+    try:
+        store['max_workers'] = 6
+        assert not store.flush(timeout=0.3)
+        assert store.errors
+
+        blocker.unlink()
+        assert store.flush()
+        assert read(store) == {'max_workers': 6}
+    finally:
+        store.close()
+
+
+def test_flush_waits_for_a_write_in_progress(stores):
+    store = stores(delay=0.01)
+    write = store._write
+
+    def slow_write(changes, removed):
+        time.sleep(0.3)
+        write(changes, removed)
+
+    store._write = slow_write
+    store['max_workers'] = 7
+    time.sleep(0.1)  # The writer has taken the change and is writing it
+    assert store.flush()
+    assert read(store) == {'max_workers': 7}
@@ -1,13 +1,24 @@
 import tkinter as tk
 from tkinter import messagebox, ttk, filedialog
-import yt_dlp
 import threading
 import os
-from typing import Dict, Optional
+from typing import Dict, List, Set
 from datetime import timedelta
 import sys
+import time
 import ctypes
-import json
+from collections import Counter
+from src.cache import InfoCache
+from src.downloader import extract_info, load_yt_dlp, remove_partial_files
+from src.fragments import FragmentMonitor, FragmentTuner, is_throttled
+from src.gui import PreviewMixin
+from src.jobs import host_of
+from src.paths import cache_dir
+from src.planner import plan_download
+from src.prefetch import Prefetcher
+from src.retry import CircuitBreaker, RetryPolicy, classify
+from src.sessions import SessionPool
+from src.settings import SettingsStore
 
 class ThemeManager:
     DARK_MODE = {
@@ -47,22 +58,28 @@ class ThemeManager:
 class YouTubeDownloader:
     def __init__(self):
         self.download_path = os.path.expanduser("~/Downloads/YouTube")
-        if not os.path.exists(self.download_path):
-            os.makedirs(self.download_path)
-            
-        self.format_specs = {
+
+        self.formats = {
             "4K": "bestvideo[height<=2160][ext!=webm]+bestaudio[ext!=webm]/best[height<=2160][ext!=webm]",
             "1080p": "bestvideo[height<=1080][ext!=webm]+bestaudio[ext!=webm]/best[height<=1080][ext!=webm]",
             "720p": "bestvideo[height<=720][ext!=webm]+bestaudio[ext!=webm]/best[height<=720][ext!=webm]",
             "480p": "bestvideo[height<=480][ext!=webm]+bestaudio[ext!=webm]/best[height<=480][ext!=webm]",
             "Audio Only": "bestaudio[ext!=webm]/best[ext!=webm]"
         }
+        self.info_cache = InfoCache(os.path.join(cache_dir(), "info.sqlite"))
+        self.fragment_tuner = FragmentTuner()
+        self.sessions = SessionPool(lambda opts: load_yt_dlp().YoutubeDL(opts), max_idle=1)
+        self.prefetcher = Prefetcher(self.prefetch_info, self.plan, self.formats)
+        self.retry_policy = RetryPolicy()
+        self.breaker = CircuitBreaker()
 
     def get_ydl_opts(self, quality: str, progress_hook, audio_only: bool = False) -> Dict:
         opts = {
-            'format': self.format_specs.get(quality, self.format_specs['1080p']),
+            'format': self.formats.get(quality, self.formats['1080p']),
             'outtmpl': os.path.join(self.download_path, '%(title)s.%(ext)s'),
             'progress_hooks': [progress_hook],
+            'postprocessor_hooks': [progress_hook],
+            'continuedl': True,
             'merge_output_format': 'mp4' if not audio_only else 'mp3',
             'noplaylist': True,
             'extract_flat': False,
@@ -71,6 +88,7 @@ class YouTubeDownloader:
             'restrictfilenames': True
         }
 
+        # Fallbacks for when the format planner has too little to go on
         if audio_only:
             opts['postprocessors'] = [{
                 'key': 'FFmpegExtractAudio',
@@ -85,37 +103,101 @@ class YouTubeDownloader:
 
         return opts
 
-    def download(self, url: str, quality: str, progress_hook) -> None:
+    def extract_info(self, ydl, url: str):
+        return extract_info(ydl, url, self.info_cache)
+
+    def prefetch_info(self, url: str) -> Dict:
+        # Video options share a session key with the download that follows
+        with self.sessions.session(self.get_ydl_opts("1080p", lambda d: None)) as ydl:
+            return self.extract_info(ydl, url)[0]
+
+    def plan(self, info: Dict, quality: str):
+        if info.get('_type', 'video') != 'video':
+            return None
+        heights = {"4K": 2160, "1080p": 1080, "720p": 720, "480p": 480}
+        return plan_download(info, max_height=heights.get(quality), audio_only=quality == "Audio Only",
+                             container='mp4', audio_codec='mp3', audio_quality=192)
+
+    def download(self, url: str, quality: str, progress_hook) -> List[str]:
         if not url.strip():
             raise ValueError("URL cannot be empty")
-            
+        self.prefetcher.wait(url)
+
+        os.makedirs(self.download_path, exist_ok=True)
         audio_only = quality == "Audio Only"
         ydl_opts = self.get_ydl_opts(quality, progress_hook, audio_only)
+        host = host_of(url)
+        fragments = FragmentMonitor(self.fragment_tuner, host)
+        ydl_opts['progress_hooks'].append(fragments.hook)
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
+        session = self.sessions.checkout(ydl_opts)
+        try:
+            info, cached = self.extract_info(session.ydl, url)
+            plan = self.plan(info, quality)
+            if plan:
+                session = self.sessions.switch(session, plan.apply(ydl_opts))
+            ydl = session.ydl
+            fragments.attach(ydl.params)
+            try:
+                ydl.process_ie_result(info, download=True)
+            except Exception as e:
+                if is_throttled(e):
+                    self.fragment_tuner.throttled(host)
+                if cached:
+                    self.info_cache.invalidate(url)
+                raise
+        except BaseException:
+            session.close()
+            raise
+        self.sessions.release(session)
+        return plan.notes if plan else []
+
+    def download_with_retry(self, url: str, quality: str, progress_hook, on_retry=None,
+                            wait=time.sleep) -> List[str]:
+        # Partial files are kept between attempts, so each one resumes where the last stopped.
+        # `wait` sleeps for the backoff and returns True to give up early, as Event.wait does.
+        host = host_of(url)
+        attempts: Counter = Counter()
+        while True:
+            reopens = self.breaker.reopens_at(host)
+            if not self.breaker.allow(host):
+                if wait(max(0.0, (reopens or time.monotonic()) - time.monotonic())):
+                    raise RuntimeError(f"{host} keeps failing; download not started")
+                continue
+            try:
+                notes = self.download(url, quality, progress_hook)
+            except Exception as e:
+                kind = classify(e)
+                self.breaker.failure(host, kind)
+                attempts[kind] += 1
+                delay = self.retry_policy.delay(kind, attempts[kind])
+                if delay is None:
+                    raise
+                if on_retry:
+                    on_retry(e, kind, delay)
+                if wait(delay):
+                    raise
+                continue
+            self.breaker.success(host)
+            return notes
+
+class ModernDownloaderGUI(PreviewMixin):
+    PROGRESS_INTERVAL_MS = 100
 
-class ModernDownloaderGUI:
     def __init__(self):
         self.downloader = YouTubeDownloader()
         self.current_download = None
+        self.latest_progress = None
+        self.cancel_event = threading.Event()
+        self.partial_files: Set[str] = set()
+        self.quality_labels: Dict[str, str] = {}
         self.load_settings()  # Load settings before setting up GUI
         self.setup_gui()
 
     def load_settings(self):
-        try:
-            with open('settings.json', 'r') as f:
-                self.settings = json.load(f)
-        except:
-            self.settings = {
-                'download_path': self.downloader.download_path,
-                'last_quality': '1080p',
-                'theme': 'system'
-            }
-
-    def save_settings(self):
-        with open('settings.json', 'w') as f:
-            json.dump(self.settings, f)
+        self.settings = SettingsStore().load()
+        if self.settings.get('download_path'):
+            self.downloader.download_path = self.settings['download_path']
 
     def setup_gui(self):
         self.root = tk.Tk()
@@ -131,6 +213,7 @@ class ModernDownloaderGUI:
         self.setup_options_frame()
         self.setup_progress_frame()
         self.setup_status_frame()
+        self.root.after(self.PROGRESS_INTERVAL_MS, self.render_progress)
 
     def setup_styles(self):
         self.style = ttk.Style()
@@ -154,6 +237,15 @@ class ModernDownloaderGUI:
         self.menu_bar.add_cascade(label="File", menu=file_menu)
         file_menu.add_command(label="Change Download Location", 
                             command=self.change_download_location)
+
+        self.keep_partial_var = tk.BooleanVar(value=self.settings['keep_partial_files'])
+        file_menu.add_checkbutton(label="Keep Partial Files on Cancel",
+                                  variable=self.keep_partial_var,
+                                  command=self.toggle_keep_partial)
+        self.watch_clipboard = tk.BooleanVar(value=self.settings['watch_clipboard'])
+        file_menu.add_checkbutton(label="Prefetch Copied Links",
+                                  variable=self.watch_clipboard,
+                                  command=self.change_watch_clipboard)
         file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self.root.quit)
 
@@ -170,7 +262,10 @@ class ModernDownloaderGUI:
         url_frame = ttk.LabelFrame(self.main_frame, text="Video URL", padding="10")
         url_frame.pack(fill=tk.X, pady=(0, 20))
 
-        self.url_entry = ttk.Entry(url_frame, width=50, style='Custom.TEntry')
+        self.url = tk.StringVar()
+        self.url.trace_add('write', lambda *args: self.schedule_prefetch())
+        self.url_entry = ttk.Entry(url_frame, width=50, style='Custom.TEntry',
+                                   textvariable=self.url)
         self.url_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 10))
         
         paste_button = ttk.Button(url_frame, text="Paste", 
@@ -189,14 +284,15 @@ class ModernDownloaderGUI:
 
         ttk.Label(quality_frame, text="Quality:").pack(side=tk.LEFT, padx=(0, 10))
         
-        self.quality_var = tk.StringVar(value=self.settings.get('last_quality', '1080p'))
-        qualities = ["4K", "1080p", "720p", "480p", "Audio Only"]
+        self.quality = tk.StringVar(value=self.settings['last_quality'])
+        # Combobox text -> quality key; labels gain sizes once a preview is in
+        self.quality_labels = {quality: quality for quality in self.downloader.formats}
         
         self.quality_combo = ttk.Combobox(quality_frame, 
-                                        textvariable=self.quality_var,
-                                        values=qualities,
+                                        textvariable=self.quality,
+                                        values=list(self.quality_labels),
                                         state='readonly',
-                                        width=15)
+                                        width=28)
         self.quality_combo.pack(side=tk.LEFT)
 
         # Download Button
@@ -226,10 +322,10 @@ class ModernDownloaderGUI:
         self.status_frame = ttk.Frame(self.main_frame)
         self.status_frame.pack(fill=tk.X)
 
-        self.status_label = ttk.Label(self.status_frame, 
+        self.status = ttk.Label(self.status_frame, 
                                     text="Ready to download",
                                     wraplength=550)
-        self.status_label.pack(side=tk.LEFT)
+        self.status.pack(side=tk.LEFT)
 
         self.cancel_button = ttk.Button(self.status_frame, 
                                       text="Cancel",
@@ -238,13 +334,8 @@ class ModernDownloaderGUI:
                                       style='Custom.TButton')
         self.cancel_button.pack(side=tk.RIGHT)
 
-    def paste_url(self):
-        try:
-            url = self.root.clipboard_get()
-            self.url_entry.delete(0, tk.END)
-            self.url_entry.insert(0, url)
-        except:
-            pass
+    def busy(self) -> bool:
+        return self.current_download is not None
 
     def change_download_location(self):
         new_path = filedialog.askdirectory(
@@ -254,7 +345,9 @@ class ModernDownloaderGUI:
         if new_path:
             self.downloader.download_path = new_path
             self.settings['download_path'] = new_path
-            self.save_settings()
+
+    def toggle_keep_partial(self):
+        self.settings['keep_partial_files'] = self.keep_partial_var.get()
 
     def show_about(self):
         about_text = """YouTube Downloader
@@ -267,7 +360,22 @@ Built with Python, yt-dlp, and tkinter.
         messagebox.showinfo("About", about_text)
 
     def progress_hook(self, d):
-        if d['status'] == 'downloading':
+        # Runs on the download thread: only record state here, render_progress draws it
+        if self.cancel_event.is_set():
+            raise load_yt_dlp().utils.DownloadCancelled("Download cancelled by user")
+
+        for key in ('filename', 'tmpfilename'):
+            if d.get(key):
+                self.partial_files.add(d[key])
+
+        if 'postprocessor' not in d:
+            self.latest_progress = d
+
+    def render_progress(self):
+        d, self.latest_progress = self.latest_progress, None
+        if d is None:
+            pass
+        elif d['status'] == 'downloading':
             try:
                 downloaded = d.get('downloaded_bytes', 0)
                 total = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
@@ -288,16 +396,16 @@ Built with Python, yt-dlp, and tkinter.
                     status += f"({progress:.1f}%) at {speed_mb:.1f}MB/s "
                     status += f"- ETA: {eta_str}"
                     
-                    self.status_label.config(text=status)
-                    self.root.update_idletasks()
+                    self.status.config(text=status)
 
             except Exception as e:
-                self.status_label.config(text=f"Error updating progress: {str(e)}")
+                self.status.config(text=f"Error updating progress: {str(e)}")
 
         elif d['status'] == 'finished':
             self.progress_var.set(100)
-            self.status_label.config(text="Download completed! Processing file...")
-            self.root.update_idletasks()
+            self.status.config(text="Download completed! Processing file...")
+
+        self.root.after(self.PROGRESS_INTERVAL_MS, self.render_progress)
 
     def start_download(self):
         url = self.url_entry.get().strip()
@@ -311,21 +419,39 @@ Built with Python, yt-dlp, and tkinter.
         self.cancel_button.config(state='normal')
         
         # Save last used quality
-        self.settings['last_quality'] = self.quality_var.get()
-        self.save_settings()
+        quality = self.selected_quality()
+        self.settings['last_quality'] = quality
+
+        self.cancel_event = threading.Event()
+        self.partial_files = set()
+        cancel_event, partial_files = self.cancel_event, self.partial_files
+        keep_partial = self.keep_partial_var.get()
+
+        def on_retry(error, kind, delay):
+            status = f"Retrying in {delay:.0f}s after {kind} error: {error}"
+            self.root.after(0, lambda: self.status.config(text=status))
 
         def run_download():
             try:
-                self.downloader.download(
+                notes = self.downloader.download_with_retry(
                     url=url,
-                    quality=self.quality_var.get(),
-                    progress_hook=self.progress_hook
+                    quality=quality,
+                    progress_hook=self.progress_hook,
+                    on_retry=on_retry,
+                    wait=cancel_event.wait
                 )
+                notes = "".join(f"\nNote: {note}" for note in notes)
                 self.root.after(0, lambda: messagebox.showinfo("Success", 
-                    f"Download completed!\nSaved to: {self.downloader.download_path}"))
+                    f"Download completed!\nSaved to: {self.downloader.download_path}{notes}"))
             except Exception as e:
-                self.root.after(0, lambda: messagebox.showerror("Error", 
-                    f"Download failed: {str(e)}"))
+                if cancel_event.is_set():
+                    if not keep_partial:
+                        remove_partial_files(partial_files)
+                    self.root.after(0, lambda: self.status.config(text="Download cancelled"))
+                else:
+                    # `e` is unbound once the except block ends, before the callback runs
+                    msg = f"Download failed: {e}"
+                    self.root.after(0, lambda: messagebox.showerror("Error", msg))
             finally:
                 self.root.after(0, self.reset_ui)
 
@@ -333,9 +459,10 @@ Built with Python, yt-dlp, and tkinter.
         self.current_download.start()
 
     def cancel_download(self):
-        # Implement download cancellation logic here
-        self.reset_ui()
-        self.status_label.config(text="Download cancelled")
+        # The worker stops at its next progress callback; reset_ui runs once it has exited
+        self.cancel_event.set()
+        self.cancel_button.config(state='disabled')
+        self.status.config(text="Cancelling download...")
 
     def reset_ui(self):
         self.url_entry.config(state='normal')
@@ -343,10 +470,17 @@ Built with Python, yt-dlp, and tkinter.
         self.quality_combo.config(state='readonly')
         self.cancel_button.config(state='disabled')
         self.progress_var.set(0)
+        self.latest_progress = None
         self.current_download = None
 
     def run(self):
-        self.root.mainloop()
+        self.root.after(100, lambda: threading.Thread(target=load_yt_dlp, daemon=True).start())
+        self.root.after(200, self.watch_clipboard_tick)
+        try:
+            self.root.mainloop()
+        finally:
+            self.downloader.sessions.close()
+            self.settings.close()
 
 if __name__ == "__main__":
     if getattr(sys, 'frozen', False):